@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+导入耗时基准测试（基于 python -X importtime）
+
+在新的解释器中导入指定模块，汇总每个顶层包的累计导入耗时，
+并检查启动路径上是否导入了应当延迟的重量级模块。
+
+用法:
+  python bench_importtime.py                      # 报告 websocket_server 的导入耗时
+  python bench_importtime.py --budget-ms 300      # 超出预算时退出码为1
+  python bench_importtime.py --raw                # 同时输出原始 -X importtime 内容
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# 启动路径上不应导入的模块（应在首次使用时才导入）
+DEFERRED_MODULES = ('MetaTrader5', 'numpy', 'pybit')
+
+def run_importtime(module):
+    """
+    在子进程中以 -X importtime 导入模块
+
+    Returns:
+        str: 解释器输出到stderr的importtime内容
+    """
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding='utf-8',
+        errors='replace'
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{process.stderr}")
+    return process.stderr
+
+def parse_importtime(output):
+    """
+    解析 -X importtime 输出
+
+    Returns:
+        List[dict]: 每个模块的 name/self_us/cumulative_us/depth
+    """
+    records = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        records.append({
+            'name': name.strip(),
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us),
+            'depth': depth
+        })
+    return records
+
+def summarize(records):
+    """按顶层包汇总导入耗时（self时间求和，避免嵌套重复计算）"""
+    packages = {}
+    for record in records:
+        package = record['name'].split('.')[0]
+        packages[package] = packages.get(package, 0) + record['self_us']
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="websocket_server导入耗时报告")
+    parser.add_argument('--module', default='websocket_server', help='要导入的模块')
+    parser.add_argument('--top', type=int, default=20, help='显示耗时最多的前N个包')
+    parser.add_argument('--budget-ms', type=float, default=0, help='导入总耗时预算（毫秒），0表示不检查')
+    parser.add_argument('--raw', action='store_true', help='输出原始 -X importtime 内容')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    args = parser.parse_args()
+
+    output = run_importtime(args.module)
+    records = parse_importtime(output)
+    total_us = sum(record['self_us'] for record in records)
+    packages = summarize(records)
+    imported = {record['name'].split('.')[0] for record in records}
+    deferred_violations = [name for name in DEFERRED_MODULES if name in imported]
+
+    if args.raw:
+        print(output)
+
+    if args.json:
+        print(json.dumps({
+            'module': args.module,
+            'total_ms': total_us / 1000,
+            'packages': [{'name': name, 'ms': us / 1000} for name, us in packages[:args.top]],
+            'deferred_violations': deferred_violations
+        }, indent=2))
+    else:
+        print(f"导入 {args.module} 总耗时: {total_us / 1000:.1f}ms ({len(records)} 个模块)")
+        print("=" * 60)
+        for name, us in packages[:args.top]:
+            print(f"{name:<30} {us / 1000:8.2f}ms {us * 100 / max(total_us, 1):6.1f}%")
+        print("=" * 60)
+        if deferred_violations:
+            print(f"警告: 启动路径上导入了应当延迟的模块: {deferred_violations}")
+        else:
+            print(f"延迟模块未在启动路径上导入: {list(DEFERRED_MODULES)}")
+
+    if deferred_violations:
+        sys.exit(1)
+    if args.budget_ms and total_us / 1000 > args.budget_ms:
+        print(f"超出导入耗时预算: {total_us / 1000:.1f}ms > {args.budget_ms}ms")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
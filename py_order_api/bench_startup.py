@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+启动性能基准测试
+
+启动websocket_server，测量:
+  - time_to_listen: 进程启动到端口可连接的时间
+  - time_to_ready: 进程启动到health_check返回readiness=ready的时间
+  - time_to_first_order: 进程启动到第一笔开仓成功的时间（需指定--order-symbol，请使用模拟账户）
+
+用法:
+  python bench_startup.py --runs 3
+  python bench_startup.py --order-symbol "COMEX Gold" --volume 1 --order-type BUY
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+import websockets
+
+async def wait_for_listen(host, port, deadline, process):
+    """轮询端口直到可以建立TCP连接"""
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务器进程已退出，退出码: {process.returncode}")
+        try:
+            with socket.create_connection((host, port), timeout=0.05):
+                return time.perf_counter()
+        except OSError:
+            await asyncio.sleep(0.005)
+    raise TimeoutError(f"等待端口 {host}:{port} 监听超时")
+
+async def send_request(websocket, action, params=None):
+    """发送请求并等待对应ID的响应（忽略广播等其他消息）"""
+    request_id = str(uuid.uuid4())
+    await websocket.send(json.dumps({'id': request_id, 'action': action, 'params': params or {}}))
+    while True:
+        response = json.loads(await websocket.recv())
+        if response.get('id') == request_id:
+            return response
+
+async def wait_for_ready(websocket, deadline):
+    """轮询health_check直到服务就绪"""
+    while time.perf_counter() < deadline:
+        response = await send_request(websocket, 'health_check')
+        if response.get('readiness', {}).get('ready'):
+            return time.perf_counter()
+        await asyncio.sleep(0.01)
+    raise TimeoutError("等待服务就绪超时")
+
+async def wait_for_first_order(websocket, params, deadline):
+    """重复发送开仓请求直到第一笔成功"""
+    while time.perf_counter() < deadline:
+        response = await send_request(websocket, 'open_position', params)
+        if response.get('status') == 'success':
+            return time.perf_counter()
+        await asyncio.sleep(0.01)
+    raise TimeoutError("等待首笔开仓成功超时")
+
+async def run_once(args):
+    """启动一次服务器并采集各阶段耗时"""
+    result = {}
+    t0 = time.perf_counter()
+    deadline = t0 + args.timeout
+    process = subprocess.Popen(
+        [sys.executable] + args.server,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        result['time_to_listen'] = await wait_for_listen(args.host, args.port, deadline, process) - t0
+
+        async with websockets.connect(f"ws://{args.host}:{args.port}") as websocket:
+            await websocket.recv()  # 欢迎消息
+            result['time_to_welcome'] = time.perf_counter() - t0
+            result['time_to_ready'] = await wait_for_ready(websocket, deadline) - t0
+
+            if args.order_symbol:
+                params = {
+                    'symbol': args.order_symbol,
+                    'volume': args.volume,
+                    'order_type': args.order_type,
+                    'comment': 'bench_startup'
+                }
+                result['time_to_first_order'] = await wait_for_first_order(websocket, params, deadline) - t0
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="websocket_server启动性能基准测试")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--runs', type=int, default=3, help='重复启动次数')
+    parser.add_argument('--timeout', type=float, default=120, help='单次启动超时（秒）')
+    parser.add_argument('--order-symbol', default='', help='首笔开仓的外部品种，为空则不下单')
+    parser.add_argument('--volume', type=float, default=1)
+    parser.add_argument('--order-type', default='BUY')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    parser.add_argument('server', nargs='*', default=['websocket_server.py'],
+                        help='服务器启动参数（默认: websocket_server.py）')
+    args = parser.parse_args()
+
+    runs = []
+    for i in range(args.runs):
+        result = asyncio.run(run_once(args))
+        runs.append(result)
+        if not args.json:
+            print(f"第 {i + 1} 次: " + ", ".join(f"{k}={v * 1000:.1f}ms" for k, v in result.items()))
+
+    summary = {}
+    for key in runs[0]:
+        values = [run[key] * 1000 for run in runs]
+        summary[key] = {
+            'min_ms': min(values),
+            'median_ms': statistics.median(values),
+            'max_ms': max(values)
+        }
+
+    if args.json:
+        print(json.dumps({'runs': runs, 'summary': summary}, indent=2))
+    else:
+        print("=" * 60)
+        for key, stats in summary.items():
+            print(f"{key:<22} min={stats['min_ms']:8.1f}ms  median={stats['median_ms']:8.1f}ms  max={stats['max_ms']:8.1f}ms")
+
+if __name__ == "__main__":
+    main()
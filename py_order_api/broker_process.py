@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import collections
+import functools
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from log_setup import forward_record
+from market_data import RecordBuffer
+from metrics import REGISTRY
+from order_scheduler import BrokerError, OrderRejected, OutcomeUnknown
+
+logger = logging.getLogger(__name__)
+
+BROKER_RESTARTS = REGISTRY.counter('broker_restarts_total', '交易进程被重启的次数', ('reason',))
+BROKER_CALL_SECONDS = REGISTRY.histogram('broker_ipc_seconds', '经由交易进程的调用往返耗时（秒）', ('call',))
+
+# 心跳请求，由交易进程主线程直接响应，不进入线程池
+PING = '__ping__'
+
+# 停止交易进程
+STOP = '__stop__'
+
+# 交易进程发给服务进程的日志记录（响应的请求编号字段），由服务进程的日志线程写入
+LOG = '__log__'
+
+# 响应的状态字段: 调用被OrderRejected拒绝（其他为True成功 / False出错）
+REJECTED = 'rejected'
+
+# 会改变账户或持仓的调用：执行期间交易进程被重启时订单可能已经发送到终端
+TRADING_CALLS = (
+    'open_position', 'close_position_by_ticket', 'close_positions_by_symbol', 'close_all_positions',
+    'reduce_position', 'attach_stops'
+)
+
+# 可能长时间运行的只读调用（几个月的Tick/K线、历史同步），卡住判定使用单独的超时时间
+SLOW_CALLS = ('copy_ticks_range', 'copy_rates_range', 'get_history_deals', 'get_history_orders')
+
+def _call_error(message, method):
+    """未完成的调用失败时的异常：交易调用的结果未知"""
+    if method in TRADING_CALLS:
+        return OutcomeUnknown(f'{message}，{method} 的结果未知（订单可能已成交，请先查询持仓）')
+    return BrokerError(message)
+
+class _Rows:
+    """
+    MT5返回的具名元组（TradeDeal/TradePosition等）在管道中的编码
+    同类型的多行只传一次类型名和字段名，接收端重建为同名的namedtuple
+    """
+
+    __slots__ = ('name', 'fields', 'rows', 'single')
+
+    def __init__(self, name, fields, rows, single):
+        self.name = name
+        self.fields = fields
+        self.rows = rows
+        self.single = single
+
+def _is_named_tuple(value):
+    return isinstance(value, tuple) and hasattr(value, '_fields')
+
+def _is_array(value):
+    # 不导入numpy判断numpy数组（copy_rates_range/copy_ticks_range的返回值）
+    return type(value).__module__ == 'numpy' and hasattr(value, 'dtype')
+
+def to_wire(value):
+    """
+    把返回值转换为可以在没有导入MetaTrader5和numpy的进程中还原的编码
+    MetaTrader5模块的具名元组编码为_Rows，numpy结构化数组编码为RecordBuffer（服务进程直接分块发送）
+    """
+    if _is_array(value):
+        return RecordBuffer.from_array(value)
+    if _is_named_tuple(value):
+        return _Rows(type(value).__name__, tuple(value._fields), [tuple(value)], True)
+    if isinstance(value, tuple):
+        if value and _is_named_tuple(value[0]):
+            return _Rows(type(value[0]).__name__, tuple(value[0]._fields), [tuple(row) for row in value], False)
+        return tuple(to_wire(item) for item in value)
+    return value
+
+@functools.lru_cache(maxsize=64)
+def _row_type(name, fields):
+    return collections.namedtuple(name, fields)
+
+def from_wire(value):
+    """还原to_wire的编码"""
+    if isinstance(value, _Rows):
+        row_type = _row_type(value.name, value.fields)
+        rows = tuple(row_type._make(row) for row in value.rows)
+        return rows[0] if value.single else rows
+    if isinstance(value, tuple):
+        return tuple(from_wire(item) for item in value)
+    return value
+
+def broker_main(conn, config, trader_options, workers, trade_workers):
+    """
+    交易进程入口：持有MT5终端连接，执行管道中收到的MT5Trader方法调用
+    交易调用使用单独的线程池，不排在长时间的只读调用（Tick/K线/历史）后面
+
+    Args:
+        conn: 与服务进程通信的管道
+        config: 服务配置（日志、后端、品种规格缓存文件）
+        trader_options: MT5Trader的参数（不含spec_cache）
+        workers: 执行只读调用的线程数
+        trade_workers: 执行交易调用的线程数
+    """
+    import os
+    from log_setup import setup_logging
+    from mt5_trader import MT5Trader, select_backend
+    from spec_cache import SymbolSpecCache
+
+    send_lock = threading.Lock()
+
+    def reply(message):
+        with send_lock:
+            try:
+                conn.send(message)
+            except (OSError, ValueError):
+                pass
+
+    # 日志和交易记录发送给服务进程写入，不与服务进程同时追加同一个文件
+    setup_logging(config, forward=lambda record: reply((LOG, None, record)))
+    select_backend(os.environ.get("MT5_BACKEND") or config.get("mt5_backend", "mt5"))
+    trader = MT5Trader(
+        spec_cache=SymbolSpecCache(config.get("spec_cache_file", "symbol_specs.json")),
+        **trader_options
+    )
+    logger.info(f"交易进程已启动: pid={os.getpid()}")
+
+    read_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='broker-read')
+    trade_executor = ThreadPoolExecutor(max_workers=trade_workers, thread_name_prefix='broker-trade')
+
+    def execute(request_id, method, args, kwargs):
+        # 列表参数（如open_position的attempts）在调用中被追加，随结果返回给调用方
+        outputs = {name: value for name, value in kwargs.items() if isinstance(value, list)}
+        try:
+            result = getattr(trader, method)(*args, **kwargs)
+            reply((request_id, True, (to_wire(result), outputs)))
+        except OrderRejected as e:
+            reply((request_id, REJECTED, (str(e), e.reason, outputs)))
+        except Exception as e:
+            logger.exception(f"交易进程执行 {method} 时出错: {str(e)}")
+            reply((request_id, False, f"{type(e).__name__}: {str(e)}"))
+
+    while True:
+        try:
+            request_id, method, args, kwargs = conn.recv()
+        except (EOFError, OSError):
+            break
+        if method == PING:
+            reply((request_id, True, time.time()))
+        elif method == STOP:
+            break
+        else:
+            executor = trade_executor if method in TRADING_CALLS else read_executor
+            executor.submit(execute, request_id, method, args, kwargs)
+
+    try:
+        trader.shutdown()
+    except Exception:
+        pass
+    logger.info("交易进程已退出")
+
+class _Worker:
+    """一个交易进程及其管道和未完成的调用"""
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.pending = {}                  # 请求编号 -> (Future, 方法名, 发送时间)
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.reader = threading.Thread(target=self._read, name='broker-reader', daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        """接收响应，交给等待的调用"""
+        while True:
+            try:
+                request_id, ok, value = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            if request_id == LOG:
+                forward_record(value)
+                continue
+            with self.lock:
+                entry = self.pending.pop(request_id, None)
+            if entry is not None and not entry[0].done():
+                entry[0].set_result((ok, value))
+        self.fail('交易进程已退出')
+
+    def send(self, request_id, method, args, kwargs):
+        future = Future()
+        with self.lock:
+            self.pending[request_id] = (future, method, time.monotonic())
+            try:
+                self.conn.send((request_id, method, args, kwargs))
+            except (OSError, ValueError) as e:
+                self.pending.pop(request_id, None)
+                raise BrokerError(f'交易进程不可用: {str(e)}') from None
+        return future
+
+    def oldest_call(self):
+        """最早发出且尚未返回的调用: (方法名, 已等待秒数)"""
+        with self.lock:
+            if not self.pending:
+                return None, 0.0
+            future, method, sent_at = min(self.pending.values(), key=lambda entry: entry[2])
+        return method, time.monotonic() - sent_at
+
+    def overdue(self, timeout_for):
+        """
+        超过各自超时时间仍未返回的最早调用
+
+        Args:
+            timeout_for: 按方法名返回超时时间（秒）的函数
+
+        Returns:
+            tuple: (方法名, 已等待秒数)，没有则为(None, 0.0)
+        """
+        now = time.monotonic()
+        with self.lock:
+            entries = sorted(self.pending.values(), key=lambda entry: entry[2])
+        for future, method, sent_at in entries:
+            if now - sent_at > timeout_for(method):
+                return method, now - sent_at
+        return None, 0.0
+
+    def fail(self, message):
+        """让所有未完成的调用失败（交易调用为OutcomeUnknown）"""
+        with self.lock:
+            entries, self.pending = list(self.pending.values()), {}
+        for future, method, _ in entries:
+            if not future.done():
+                future.set_exception(_call_error(message, method))
+
+    def stop(self, timeout=2.0):
+        """停止交易进程（无响应时强制结束），未完成的调用立即失败，不等待进程退出"""
+        self.fail('交易进程已被重启')
+        try:
+            with self.lock:
+                self.conn.send((0, STOP, (), {}))
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout)
+        self.conn.close()
+
+class BrokerProxy:
+    """
+    交易进程代理（分进程模式）
+    服务进程只处理WebSocket、JSON和日志，MT5调用在独立的交易进程中执行；
+    代理提供与MT5Trader相同的方法，调用通过管道转发并阻塞等待结果（在交易/读取线程池中调用）。
+    supervise协程定期发送心跳并检查调用耗时，交易进程退出、无响应或调用卡住时自动重启
+    """
+
+    def __init__(self, config, trader_options, workers=2, trade_workers=1, hang_timeout=30.0, read_timeout=300.0,
+                 heartbeat_interval=1.0, heartbeat_timeout=5.0, on_restart=None):
+        """
+        初始化代理（不启动进程）
+
+        Args:
+            config: 服务配置，传给交易进程
+            trader_options: MT5Trader的参数（不含spec_cache）
+            workers: 交易进程中执行只读调用的线程数
+            trade_workers: 交易进程中执行交易调用的线程数
+            hang_timeout: 单个调用超过该时间（秒）未返回则认为交易进程卡住
+            read_timeout: SLOW_CALLS中的只读调用（Tick/K线/历史）使用的卡住判定时间（秒）
+            heartbeat_interval: 心跳间隔（秒）
+            heartbeat_timeout: 心跳超过该时间（秒）未响应则认为交易进程无响应
+            on_restart: 交易进程重启后调用的函数，参数为原因
+        """
+        self.config = config
+        self.trader_options = trader_options
+        self.workers = workers
+        self.trade_workers = trade_workers
+        self.hang_timeout = hang_timeout
+        self.read_timeout = read_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.on_restart = on_restart
+        self.mt5_path = trader_options.get('mt5_path', '')
+
+        self._context = multiprocessing.get_context('spawn')
+        self._ids = itertools.count(1)
+        self._worker = None
+        self._restart_lock = threading.Lock()
+        self.restarts = 0
+        self.last_restart = None
+        self.last_heartbeat_ms = None
+
+    def start(self):
+        """启动交易进程"""
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=broker_main,
+            args=(child_conn, self.config, self.trader_options, self.workers, self.trade_workers),
+            name='mt5-broker',
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        self._worker = _Worker(process, parent_conn)
+        logger.info(f"已启动交易进程: pid={process.pid}")
+
+    def call(self, method, *args, **kwargs):
+        """
+        在交易进程中调用MT5Trader的方法
+
+        Raises:
+            OrderRejected: 交易进程中的MT5Trader在本地拒绝了请求
+            OutcomeUnknown: 交易调用执行期间交易进程被重启或调用超时
+            BrokerError: 交易进程不可用、在调用期间被重启或调用出错
+        """
+        worker = self._worker
+        if worker is None:
+            raise BrokerError('交易进程未启动')
+        started = time.perf_counter()
+        future = worker.send(next(self._ids), method, args, kwargs)
+        try:
+            # 卡住的调用由supervise重启交易进程后失败返回，这里的超时只是兜底
+            ok, value = future.result(timeout=self._timeout(method) * 2)
+        except FutureTimeoutError:
+            raise _call_error(f'交易进程调用超时: {method}', method) from None
+        BROKER_CALL_SECONDS.observe(time.perf_counter() - started, method)
+        if ok == REJECTED:
+            message, reason, outputs = value
+            self._copy_outputs(kwargs, outputs)
+            raise OrderRejected(message, reason)
+        if not ok:
+            raise BrokerError(value)
+        result, outputs = value
+        self._copy_outputs(kwargs, outputs)
+        return from_wire(result)
+
+    def _timeout(self, method):
+        """调用的卡住判定时间（秒）"""
+        return self.read_timeout if method in SLOW_CALLS else self.hang_timeout
+
+    @staticmethod
+    def _copy_outputs(kwargs, outputs):
+        """把交易进程中追加到列表参数的内容复制回调用方传入的列表"""
+        for name, values in outputs.items():
+            kwargs[name][:] = values
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        method = functools.partial(self.call, name)
+        setattr(self, name, method)
+        return method
+
+    def restart(self, reason):
+        """重启交易进程，未完成的调用全部失败"""
+        with self._restart_lock:
+            old = self._worker
+            logger.error(f"重启交易进程: {reason}")
+            self.start()
+            if old is not None:
+                old.stop()
+            self.restarts += 1
+            self.last_restart = {'reason': reason, 'time': time.time()}
+            BROKER_RESTARTS.inc(reason)
+
+    def _check(self):
+        """检查交易进程，返回需要重启的原因（在线程中执行）"""
+        worker = self._worker
+        if not worker.process.is_alive():
+            return 'exited'
+
+        method, waited = worker.overdue(self._timeout)
+        if method is not None:
+            logger.error(f"交易进程调用 {method} 已等待 {waited:.1f}秒，判定为卡住")
+            return 'hung'
+
+        started = time.perf_counter()
+        try:
+            worker.send(next(self._ids), PING, (), {}).result(timeout=self.heartbeat_timeout)
+        except FutureTimeoutError:
+            logger.error(f"交易进程 {self.heartbeat_timeout}秒内未响应心跳")
+            return 'unresponsive'
+        except BrokerError:
+            return 'exited'
+        self.last_heartbeat_ms = round((time.perf_counter() - started) * 1000, 3)
+        return None
+
+    async def supervise(self):
+        """定期检查交易进程，退出、无响应或调用卡住时自动重启"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                reason = await loop.run_in_executor(None, self._check)
+                if reason is None:
+                    continue
+                await loop.run_in_executor(None, self.restart, reason)
+                if self.on_restart is not None:
+                    self.on_restart(reason)
+            except Exception as e:
+                logger.exception(f"检查交易进程时出错: {str(e)}")
+
+    def shutdown(self):
+        """关闭MT5连接并停止交易进程"""
+        worker = self._worker
+        if worker is None:
+            return
+        try:
+            self.call('shutdown')
+        except BrokerError:
+            pass
+        worker.stop()
+
+    def status(self):
+        """获取交易进程状态"""
+        worker = self._worker
+        if worker is None:
+            return {'running': False}
+        method, waited = worker.oldest_call()
+        return {
+            'running': worker.process.is_alive(),
+            'pid': worker.process.pid,
+            'started_at': worker.started_at,
+            'pending': len(worker.pending),
+            'oldest_call': {'method': method, 'waited_ms': round(waited * 1000, 1)} if method else None,
+            'last_heartbeat_ms': self.last_heartbeat_ms,
+            'restarts': self.restarts,
+            'last_restart': self.last_restart
+        }
@@ -3,9 +3,11 @@
 
 import logging
 import time
-from datetime import datetime
 from typing import Dict, List, Any, Optional
 from pybit.unified_trading import HTTP
+from metrics import TimedCalls, ORDER_RETCODES
+from records import Position, AccountSnapshot, OrderResult
+from rate_limiter import RateLimiter, RateLimitedSession
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -13,7 +15,8 @@ logger = logging.getLogger(__name__)
 class BybitTrader:
     """Bybit交易类，基于官方pybit库封装"""
     
-    def __init__(self, api_key: str = "", secret_key: str = "", testnet: bool = False, demo_trading: bool = False):
+    def __init__(self, api_key: str = "", secret_key: str = "", testnet: bool = False, demo_trading: bool = False,
+                 rate_limits: Optional[Dict[str, float]] = None):
         """
         初始化Bybit交易类
         
@@ -22,6 +25,7 @@ class BybitTrader:
             secret_key: Bybit密钥
             testnet: 是否使用测试网络
             demo_trading: 是否使用演示交易（主网演示）
+            rate_limits: 覆盖各接口组的每秒请求数（见rate_limiter.DEFAULT_LIMITS）
         """
         self.api_key = api_key
         self.secret_key = secret_key
@@ -37,14 +41,24 @@ class BybitTrader:
                 testnet=False,  # 演示交易基于主网
                 api_key=api_key,
                 api_secret=secret_key,
-                demo=True  # 启用演示模式
+                demo=True,  # 启用演示模式
+                return_response_headers=True
             )
         else:
             self.session = HTTP(
                 testnet=testnet,
                 api_key=api_key,
-                api_secret=secret_key
+                api_secret=secret_key,
+                return_response_headers=True
             )
+        
+        # 品种信息（最小交易量、步长、价格精度）缓存，开仓和设置止损止盈不再重复请求
+        self._instruments = {}
+        
+        # 每次Bybit HTTP调用的耗时计入broker_call_seconds指标
+        # 调用前按接口组限流（下单优先），并根据响应头中的限流状态校正
+        self.rate_limiter = RateLimiter(rate_limits)
+        self.session = RateLimitedSession(TimedCalls(self.session, 'bybit'), self.rate_limiter)
     
     def initialize(self) -> bool:
         """
@@ -86,16 +100,16 @@ class BybitTrader:
         """
         return self.initialized
     
-    def get_account_info(self) -> Dict[str, Any]:
+    def get_account_info(self) -> Optional[AccountSnapshot]:
         """
         获取账户信息
         
         Returns:
-            Dict: 账户信息字典
+            AccountSnapshot: 账户信息，失败返回None
         """
         if not self.is_connected():
             logger.error("Bybit未连接")
-            return {}
+            return None
         
         try:
             response = self.session.get_wallet_balance(accountType="UNIFIED")
@@ -107,80 +121,71 @@ class BybitTrader:
                 if list_data:
                     account = list_data[0]
                     server_name = "Bybit Demo" if self.demo_trading else "Bybit"
-                    return {
-                        "login": "demo_account" if self.demo_trading else "bybit_account",
-                        "server": server_name,
-                        "currency": "USDT",
-                        "leverage": 1,
-                        "balance": float(account.get("totalWalletBalance", "0")),
-                        "equity": float(account.get("totalEquity", "0")),
-                        "margin": float(account.get("totalMarginBalance", "0")),
-                        "margin_free": float(account.get("totalAvailableBalance", "0")),
-                        "margin_level": 0,
-                        "name": f"{server_name} Account"
-                    }
+                    return AccountSnapshot(
+                        login="demo_account" if self.demo_trading else "bybit_account",
+                        server=server_name,
+                        currency="USDT",
+                        leverage=1,
+                        balance=float(account.get("totalWalletBalance", "0")),
+                        equity=float(account.get("totalEquity", "0")),
+                        margin=float(account.get("totalMarginBalance", "0")),
+                        margin_free=float(account.get("totalAvailableBalance", "0")),
+                        margin_level=0,
+                        name=f"{server_name} Account"
+                    )
             
             logger.error(f"获取账户信息失败: {response}")
-            return {}
+            return None
             
         except Exception as e:
             logger.error(f"获取账户信息异常: {str(e)}")
-            return {}
+            return None
     
-    def calculate_sl_by_percentage(self, symbol: str, order_type: str, entry_price: float, 
-                                  percentage: float = 10.0) -> float:
+    def get_instrument(self, symbol: str) -> Optional[Dict[str, float]]:
         """
-        根据百分比计算止损价格
+        获取品种信息（首次请求后缓存）
         
         Args:
             symbol: 交易品种
-            order_type: 订单类型，"BUY"或"SELL"
-            entry_price: 开仓价格
-            percentage: 止损百分比，默认10%
             
         Returns:
-            float: 止损价格
+            dict: min_order_qty/qty_step/tick_size，获取失败返回None
         """
-        try:
-            # 获取品种信息
-            response = self.session.get_instruments_info(category="linear", symbol=symbol)
-            
-            if response and response.get("retCode") == 0:
-                result = response.get("result", {})
-                list_data = result.get("list", [])
-                
-                if list_data:
-                    instrument = list_data[0]
-                    tick_size = float(instrument.get("tickSize", "0.01"))
-                    
-                    # 计算止损距离
-                    sl_distance = entry_price * (percentage / 100.0)
-                    
-                    # 根据订单类型计算止损价格
-                    if order_type.upper() == "BUY":
-                        sl_price = entry_price - sl_distance
-                    else:  # SELL
-                        sl_price = entry_price + sl_distance
-                    
-                    # 四舍五入到合适的精度
-                    sl_price = round(sl_price / tick_size) * tick_size
-                    
-                    logger.info(f"止损计算: 品种={symbol}, 类型={order_type}, 开仓价={entry_price}, "
-                               f"止损百分比={percentage}%, 止损价={sl_price}")
-                    
-                    return sl_price
-            
+        instrument = self._instruments.get(symbol)
+        if instrument is not None:
+            return instrument
+        
+        response = self.session.get_instruments_info(category="linear", symbol=symbol)
+        if not response or response.get("retCode") != 0:
+            logger.error(f"获取品种信息失败: {response}")
+            return None
+        
+        list_data = response.get("result", {}).get("list", [])
+        if not list_data:
             logger.error(f"无法获取品种信息: {symbol}")
-            return 0.0
-            
-        except Exception as e:
-            logger.error(f"计算止损价格时出错: {e}")
-            return 0.0
+            return None
+        
+        info = list_data[0]
+        lot_size = info.get("lotSizeFilter") or info
+        price_filter = info.get("priceFilter") or info
+        instrument = {
+            'min_order_qty': float(lot_size.get("minOrderQty", "0.001")),
+            'qty_step': float(lot_size.get("qtyStep", "0.001")),
+            'tick_size': float(price_filter.get("tickSize", "0.01"))
+        }
+        self._instruments[symbol] = instrument
+        return instrument
+    
+    @staticmethod
+    def round_price(price: float, tick_size: float) -> float:
+        """价格对齐到tickSize"""
+        decimals = len(f"{tick_size:.10f}".rstrip('0').split('.')[1])
+        return round(round(price / tick_size) * tick_size, decimals)
     
     def open_position(self, symbol: str, order_type: str, volume: float,
                      price: float = 0.0, sl: float = 0.0, tp: float = 0.0,
                      profit_amount: float = 0.0, deviation: int = 20, 
-                     comment: str = "") -> Optional[Dict]:
+                     comment: str = "") -> Optional[OrderResult]:
         """
         开仓函数
         
@@ -189,37 +194,27 @@ class BybitTrader:
             order_type: 订单类型，"BUY"或"SELL"（也可以通过volume正负数判断）
             volume: 交易量，正数=做多(Buy)，负数=做空(Sell)
             price: 价格，0表示市价
-            sl: 止损价格，0表示不设置
-            tp: 止盈价格，0表示不设置
-            profit_amount: 目标盈利金额（美元），0表示不设置
+            sl: 不使用，止损在成交后由attach_stops设置
+            tp: 不使用，止盈在成交后由attach_stops设置
+            profit_amount: 不使用，由attach_stops按实际均价计算止盈
             deviation: 允许的最大价格偏差（点数）
             comment: 订单注释
             
         Returns:
-            Dict: 订单发送结果
+            OrderResult: 订单发送结果（retcode成功为0，type为按volume正负实际下单的方向；
+                         市价单发送时成交价未知，price为None，成交均价由attach_stops返回）
         """
         if not self.is_connected():
             logger.error("Bybit未连接")
             return None
         
         try:
-            # 获取品种信息以检查最小交易量
-            instrument_response = self.session.get_instruments_info(category="linear", symbol=symbol)
-            
-            if not instrument_response or instrument_response.get("retCode") != 0:
-                logger.error(f"获取品种信息失败: {instrument_response}")
+            # 品种信息用于检查最小交易量
+            instrument = self.get_instrument(symbol)
+            if instrument is None:
                 return None
-            
-            instrument_result = instrument_response.get("result", {})
-            instrument_list = instrument_result.get("list", [])
-            
-            if not instrument_list:
-                logger.error(f"无法获取品种信息: {symbol}")
-                return None
-            
-            instrument = instrument_list[0]
-            min_order_qty = float(instrument.get("minOrderQty", "0.001"))
-            qty_step = float(instrument.get("qtyStep", "0.001"))
+            min_order_qty = instrument['min_order_qty']
+            qty_step = instrument['qty_step']
             
             # 根据交易量的正负数判断买卖方向
             if volume > 0:
@@ -242,45 +237,7 @@ class BybitTrader:
             # 调整交易量到合适的步长
             actual_volume = round(actual_volume / qty_step) * qty_step
             
-
-            
-            # 获取当前价格
-            ticker_response = self.session.get_tickers(category="linear", symbol=symbol)
-            
-            if not ticker_response or ticker_response.get("retCode") != 0:
-                logger.error(f"获取价格信息失败: {ticker_response}")
-                return None
-            
-            result = ticker_response.get("result", {})
-            list_data = result.get("list", [])
-            
-            if not list_data:
-                logger.error(f"无法获取价格信息: {symbol}")
-                return None
-            
-            ticker = list_data[0]
-            current_price = float(ticker.get("lastPrice", "0"))
-            
-            # 如果价格为0，使用当前市价
-            if price == 0:
-                price = current_price
-            
-            # 如果指定了盈利金额，计算止盈价格
-            if profit_amount > 0:
-                # 简化计算：假设每点价值为1美元
-                tp_distance = profit_amount / actual_volume
-                if actual_order_type == "BUY":
-                    tp = price + tp_distance
-                else:  # SELL
-                    tp = price - tp_distance
-                logger.info(f"基于盈利金额 ${profit_amount:.2f} 计算的止盈价格: {tp:.5f}")
-            
-            # 如果没有设置止损，自动设置10%止损
-            if sl == 0:
-                sl = self.calculate_sl_by_percentage(symbol, actual_order_type, price, 10.0)
-                logger.info(f"自动设置10%止损价格: {sl:.5f}")
-            
-            # 准备订单参数
+            # 市价单不带止损止盈立即发送，止损止盈在成交后按实际均价设置（attach_stops）
             order_params = {
                 "category": "linear",
                 "symbol": symbol,
@@ -292,58 +249,109 @@ class BybitTrader:
             logger.info(f"订单详情: 原始量={volume}, 方向={side}({actual_order_type}), 实际量={actual_volume}")
             logger.info(f"品种信息: 最小量={min_order_qty}, 步长={qty_step}")
             
-            # 添加止损止盈（可选）
-            if sl > 0:
-                order_params["stopLoss"] = str(sl)
-            if tp > 0:
-                order_params["takeProfit"] = str(tp)
-            
             # 发送订单
             logger.info(f"正在发送订单: {order_params}")
+            response = self.session.place_order(**order_params)
             
-            try:
-                response = self.session.place_order(**order_params)
-            except Exception as api_error:
-                # 如果是余额不足或其他API错误，尝试无止损止盈的订单
-                logger.warning(f"带止损止盈的订单失败: {api_error}")
-                logger.info("尝试发送无止损止盈的订单...")
-                
-                simple_params = {
-                    "category": "linear",
-                    "symbol": symbol,
-                    "side": side,
-                    "orderType": "Market",
-                    "qty": str(actual_volume),
-                }
-                
-                response = self.session.place_order(**simple_params)
-            
+            ORDER_RETCODES.inc('bybit', response.get("retCode") if response else 'none')
             if response and response.get("retCode") == 0:
                 result = response.get("result", {})
                 order_id = result.get("orderId", "")
                 logger.info(f"订单发送成功，订单号: {order_id}")
                 
-                return {
-                    "retcode": 0,  # 模拟MT5的成功码
-                    "order": order_id,
-                    "price": price,
-                    "comment": "Success"
-                }
+                return OrderResult(retcode=0, order=order_id, volume=actual_volume, price=price or None,
+                                   comment="Success", type=actual_order_type)
             else:
                 error_msg = response.get("retMsg", "未知错误") if response else "请求失败"
                 logger.error(f"订单发送失败: {error_msg}")
                 
-                return {
-                    "retcode": 10001,  # 模拟MT5的错误码
-                    "comment": error_msg
-                }
+                return OrderResult(retcode=10001, comment=error_msg)  # 模拟MT5的错误码
                 
         except Exception as e:
             logger.error(f"开仓处理异常: {str(e)}")
-            return {
-                "retcode": 10001,
-                "comment": f"开仓异常: {str(e)}"
-            }
+            return OrderResult(retcode=10001, comment=f"开仓异常: {str(e)}")
+    
+    def attach_stops(self, symbol: str, order_id: str, order_type: str, sl: float = 0.0, tp: float = 0.0,
+                     profit_amount: float = 0.0, sl_percentage: float = 0.0) -> Dict[str, Any]:
+        """
+        按开仓订单的实际成交均价和成交量设置止损止盈
+        使用Partial模式（tpSize/slSize为本订单成交量），只作用于本订单的成交部分，
+        加仓时不会覆盖已有持仓的止损止盈，也不按整个持仓的均价和持仓量计算
+        
+        Args:
+            symbol: 交易品种
+            order_id: 开仓订单号
+            order_type: 实际下单方向，"BUY"或"SELL"
+            sl: 止损价格，0表示按sl_percentage计算
+            tp: 止盈价格，0表示按profit_amount计算
+            profit_amount: 目标盈利金额（USDT），大于0时按成交均价和成交量计算止盈
+            sl_percentage: 止损百分比，大于0且未指定sl时按成交均价计算止损
+            
+        Returns:
+            dict: retcode（Bybit retCode，订单尚未成交为None）/message/avg_price（成交均价）/size（成交量）/sl/tp
+        """
+        outcome = {'retcode': None, 'message': '', 'avg_price': None, 'size': None, 'sl': sl, 'tp': tp}
+        
+        instrument = self.get_instrument(symbol)
+        if instrument is None:
+            outcome['message'] = '无法获取品种信息'
+            return outcome
+        
+        response = self.session.get_order_history(category="linear", symbol=symbol, orderId=order_id)
+        if not response or response.get("retCode") != 0:
+            outcome['message'] = f"获取订单信息失败: {response.get('retMsg') if response else '请求失败'}"
+            return outcome
+        
+        orders = response.get("result", {}).get("list", [])
+        order = orders[0] if orders else None
+        size = float(order.get("cumExecQty") or "0") if order else 0.0
+        if size <= 0:
+            if order is not None and order.get("orderStatus") in ("Rejected", "Cancelled", "Deactivated"):
+                outcome['retcode'] = 10001  # 模拟MT5的错误码，不再重试
+                outcome['message'] = f"订单未成交: {order.get('orderStatus')} {order.get('rejectReason', '')}"
+            else:
+                outcome['message'] = '订单尚未成交'
+            return outcome
+        
+        avg_price = float(order.get("avgPrice") or "0")
+        outcome['avg_price'] = avg_price
+        outcome['size'] = size
+        
+        direction = 1 if order_type.upper() == "BUY" else -1
+        tick_size = instrument['tick_size']
+        if tp == 0 and profit_amount > 0:
+            # 线性合约盈亏 = 成交量 * 价格变化
+            tp = self.round_price(avg_price + direction * profit_amount / size, tick_size)
+        if sl == 0 and sl_percentage > 0:
+            sl = self.round_price(avg_price * (1 - direction * sl_percentage / 100.0), tick_size)
+        outcome['sl'] = sl
+        outcome['tp'] = tp
+        if sl <= 0 and tp <= 0:
+            outcome['retcode'] = 0
+            outcome['message'] = '无需设置'
+            return outcome
+        
+        stop_params = {"category": "linear", "symbol": symbol, "tpslMode": "Partial",
+                       "positionIdx": order.get("positionIdx", 0)}
+        if sl > 0:
+            stop_params["stopLoss"] = str(sl)
+            stop_params["slSize"] = str(size)
+        if tp > 0:
+            stop_params["takeProfit"] = str(tp)
+            stop_params["tpSize"] = str(size)
+        
+        logger.info(f"正在设置止损止盈: {stop_params} (订单={order_id}, 成交均价={avg_price})")
+        try:
+            response = self.session.set_trading_stop(**stop_params)
+        except Exception as e:
+            # pybit对retCode非0的响应抛出InvalidRequestError，status_code为retCode
+            outcome['retcode'] = getattr(e, 'status_code', 10001)
+            outcome['message'] = str(e)
+            return outcome
+        
+        outcome['retcode'] = response.get("retCode") if response else 10001
+        outcome['message'] = response.get("retMsg", "") if response else "请求失败"
+        return outcome
     
     def close_position_by_ticket(self, ticket: str) -> bool:
         """
@@ -401,6 +409,7 @@ class BybitTrader:
             # 发送平仓订单
             logger.info(f"正在关闭持仓: {order_params}")
             response = self.session.place_order(**order_params)
+            ORDER_RETCODES.inc('bybit', response.get("retCode") if response else 'none')
             
             if response and response.get("retCode") == 0:
                 logger.info(f"成功关闭持仓，持仓票据: {ticket}")
@@ -498,7 +507,7 @@ class BybitTrader:
             logger.error(f"关闭所有持仓异常: {str(e)}")
             return False
     
-    def get_positions(self, symbol: str = "") -> List[Dict[str, Any]]:
+    def get_positions(self, symbol: str = "") -> List[Position]:
         """
         获取当前持仓信息
         
@@ -506,7 +515,7 @@ class BybitTrader:
             symbol: 交易品种，为空则获取所有持仓
             
         Returns:
-            List[Dict]: 持仓信息列表
+            List[Position]: 持仓列表
         """
         if not self.is_connected():
             logger.error("Bybit未连接")
@@ -529,27 +538,27 @@ class BybitTrader:
             result = response.get("result", {})
             list_data = result.get("list", [])
             
-            # 转换为字典列表
             positions = []
             for position in list_data:
                 # 只返回有持仓的数据
                 size = float(position.get("size", "0"))
                 if size > 0:
-                    position_dict = {
-                        "ticket": position.get("positionIdx", ""),
-                        "time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        "type": "BUY" if position.get("side") == "Buy" else "SELL",
-                        "volume": size,
-                        "symbol": position.get("symbol", ""),
-                        "price_open": float(position.get("avgPrice", "0")),
-                        "price_current": float(position.get("markPrice", "0")),
-                        "sl": float(position.get("stopLoss", "0")),
-                        "tp": float(position.get("takeProfit", "0")),
-                        "profit": float(position.get("unrealisedPnl", "0")),
-                        "swap": 0.0,
-                        "comment": position.get("positionIdx", "")
-                    }
-                    positions.append(position_dict)
+                    created_msc = int(position.get("createdTime") or time.time() * 1000)
+                    positions.append(Position(
+                        ticket=position.get("positionIdx", ""),
+                        time=created_msc // 1000,
+                        time_msc=created_msc,
+                        type="BUY" if position.get("side") == "Buy" else "SELL",
+                        volume=size,
+                        symbol=position.get("symbol", ""),
+                        price_open=float(position.get("avgPrice", "0")),
+                        price_current=float(position.get("markPrice", "0")),
+                        sl=float(position.get("stopLoss") or "0"),
+                        tp=float(position.get("takeProfit") or "0"),
+                        profit=float(position.get("unrealisedPnl") or "0"),
+                        swap=0.0,
+                        comment=position.get("positionIdx", "")
+                    ))
             
             return positions
             
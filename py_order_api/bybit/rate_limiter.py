@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_WAIT = REGISTRY.histogram(
+    'bybit_rate_limit_wait_seconds', 'Bybit请求在限流器中等待的时间（秒）', ('group',)
+)
+RATE_LIMIT_REMAINING = REGISTRY.gauge(
+    'bybit_rate_limit_remaining', 'Bybit响应头X-Bapi-Limit-Status报告的剩余请求数', ('group',)
+)
+
+# 默认每秒请求数（Bybit按UID、按接口限流；全局为IP限制 600次/5秒）
+DEFAULT_LIMITS = {
+    'order': 10,
+    'trading_stop': 10,
+    'position': 50,
+    'account': 50,
+    'market': 50,
+    'global': 120,
+}
+
+# pybit方法 -> 接口组
+ENDPOINT_GROUPS = {
+    'place_order': 'order',
+    'amend_order': 'order',
+    'cancel_order': 'order',
+    'cancel_all_orders': 'order',
+    'set_trading_stop': 'trading_stop',
+    'get_positions': 'position',
+    'get_order_history': 'position',
+    'get_wallet_balance': 'account',
+    'get_tickers': 'market',
+    'get_instruments_info': 'market',
+}
+
+# 下单类接口优先：读取类请求不能使用全局令牌桶中为它们保留的部分，且有下单请求等待时让行
+PRIORITY_GROUPS = ('order', 'trading_stop')
+
+# 全局令牌桶为下单类请求保留的比例
+GLOBAL_RESERVE = 0.2
+
+class TokenBucket:
+    """令牌桶：按rate每秒补充，最多capacity个；可以根据响应头暂停到重置时间"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'blocked_until')
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now, reserve=0.0):
+        """还需要等待多久才能取得一个令牌（保留reserve个不用）"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.refill(now)
+        missing = 1 + reserve - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self):
+        self.tokens -= 1
+
+class RateLimiter:
+    """
+    Bybit接口限流器
+    每个接口组一个令牌桶，另有一个全局令牌桶；每次响应后按X-Bapi-Limit/X-Bapi-Limit-Status/
+    X-Bapi-Limit-Reset-Timestamp校正令牌数，剩余为0时暂停该组直到重置时间
+    所有方法在交易线程中调用（阻塞等待）
+    """
+
+    def __init__(self, limits=None):
+        """
+        初始化限流器
+
+        Args:
+            limits: 覆盖DEFAULT_LIMITS的每秒请求数，如 {"position": 20}
+        """
+        limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.buckets = {group: TokenBucket(rate) for group, rate in limits.items()}
+        self.global_bucket = self.buckets.pop('global')
+        self._condition = threading.Condition()
+        self._priority_waiting = 0
+
+    def group_for(self, endpoint):
+        return ENDPOINT_GROUPS.get(endpoint, 'market')
+
+    def acquire(self, endpoint):
+        """
+        等待并取得一个请求令牌
+
+        Args:
+            endpoint: pybit方法名
+
+        Returns:
+            float: 等待的秒数
+        """
+        group = self.group_for(endpoint)
+        bucket = self.buckets[group]
+        priority = group in PRIORITY_GROUPS
+        reserve = 0.0 if priority else self.global_bucket.capacity * GLOBAL_RESERVE
+        started = time.monotonic()
+
+        with self._condition:
+            if priority:
+                self._priority_waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    if not priority and self._priority_waiting:
+                        wait = 0.005
+                    else:
+                        wait = max(bucket.wait_time(now), self.global_bucket.wait_time(now, reserve))
+                    if wait <= 0:
+                        bucket.take()
+                        self.global_bucket.take()
+                        break
+                    self._condition.wait(wait)
+            finally:
+                if priority:
+                    self._priority_waiting -= 1
+                    self._condition.notify_all()
+
+        waited = time.monotonic() - started
+        RATE_LIMIT_WAIT.observe(waited, group)
+        if waited > 0.5:
+            logger.warning(f"Bybit请求限流等待 {waited * 1000:.0f}ms: {endpoint}")
+        return waited
+
+    def update(self, endpoint, headers):
+        """
+        根据响应头校正令牌桶
+
+        Args:
+            endpoint: pybit方法名
+            headers: 响应头
+        """
+        if not headers:
+            return
+        remaining = headers.get('X-Bapi-Limit-Status')
+        if remaining is None:
+            return
+        group = self.group_for(endpoint)
+        bucket = self.buckets[group]
+        remaining = int(remaining)
+        limit = headers.get('X-Bapi-Limit')
+        reset_ms = headers.get('X-Bapi-Limit-Reset-Timestamp')
+
+        with self._condition:
+            now = time.monotonic()
+            bucket.refill(now)
+            if limit:
+                # 账户实际的限额可能与默认值不同（VIP等级）
+                bucket.rate = bucket.capacity = float(limit)
+            bucket.tokens = min(bucket.tokens, float(remaining))
+            if remaining <= 0 and reset_ms:
+                bucket.blocked_until = now + max(0.0, int(reset_ms) / 1000 - time.time())
+            self._condition.notify_all()
+        RATE_LIMIT_REMAINING.set(remaining, group)
+
+    def status(self):
+        """获取各接口组的令牌数"""
+        with self._condition:
+            now = time.monotonic()
+            groups = {}
+            for group, bucket in list(self.buckets.items()) + [('global', self.global_bucket)]:
+                bucket.refill(now)
+                groups[group] = {
+                    'rate': bucket.rate,
+                    'tokens': round(bucket.tokens, 2),
+                    'blocked_ms': round(max(0.0, bucket.blocked_until - now) * 1000, 1)
+                }
+            return groups
+
+class RateLimitedSession:
+    """
+    pybit HTTP会话代理：调用前在限流器中取得令牌，调用后用响应头校正
+    被代理的会话需要以return_response_headers=True创建，这里把(响应, 耗时, 响应头)还原为响应
+    """
+
+    def __init__(self, session, limiter):
+        self._session = session
+        self._limiter = limiter
+
+    def __getattr__(self, name):
+        function = getattr(self._session, name)
+        if not callable(function):
+            return function
+        limiter = self._limiter
+
+        def limited(*args, **kwargs):
+            limiter.acquire(name)
+            try:
+                response = function(*args, **kwargs)
+            except Exception as e:
+                # pybit的请求异常也带有响应头
+                limiter.update(name, getattr(e, 'resp_headers', None))
+                raise
+            if isinstance(response, tuple):
+                response, _, headers = response
+                limiter.update(name, headers)
+            return response
+
+        self.__dict__[name] = limited
+        return limited
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+from stop_attacher import StopAttacher, RETRY
+
+# 成功: 设置完成 / 止损止盈未变化
+SUCCESS_RETCODES = (0, 34040)
+
+# 可以重试的retCode: 请求超时 / 时间戳错误 / 请求过于频繁 / 服务器错误；None为订单尚未成交或请求失败
+RETRY_RETCODES = (None, 10000, 10002, 10006, 10016)
+
+class TradingStopAttacher(StopAttacher):
+    """
+    Bybit开仓后在后台设置止损止盈
+    成交后按该订单的成交均价和成交量调用set_trading_stop（Partial模式）
+    """
+
+    def __init__(self, trader, max_attempts=5, retry_ms=200, sl_percentage=10.0, on_result=None):
+        """
+        初始化
+
+        Args:
+            trader: BybitTrader
+            max_attempts: 最大尝试次数（含第一次）
+            retry_ms: 重试退避基础间隔（毫秒），每次翻倍
+            sl_percentage: 未指定止损时按成交均价设置的止损百分比，0表示不设置
+            on_result: 完成后调用的协程函数，参数为结果dict
+        """
+        super().__init__(max_attempts, retry_ms, on_result)
+        self.trader = trader
+        self.sl_percentage = sl_percentage
+
+    def attach(self, symbol, order_id, order_type, profit_amount=0.0, sl=0.0, tp=0.0):
+        """
+        为刚成交的开仓订单在后台设置止损止盈
+
+        Args:
+            symbol: 交易品种
+            order_id: 开仓订单号
+            order_type: 实际下单方向，BUY或SELL
+            profit_amount: 目标盈利金额，大于0时按成交均价和成交量计算止盈
+            sl: 止损价格，0表示按sl_percentage计算
+            tp: 止盈价格，0表示按profit_amount计算
+
+        Returns:
+            dict: 开仓响应中返回的止损止盈状态
+        """
+        return self._submit(order_id, {
+            'symbol': symbol, 'order_id': order_id, 'type': order_type,
+            'profit_amount': profit_amount or None, 'sl': sl, 'tp': tp
+        }, {'sl': sl, 'tp': tp, 'profit_amount': profit_amount or 0.0})
+
+    async def _attempt(self, state, request):
+        # 每次尝试都按订单成交结果重新计算，不使用上一次计算的价格
+        loop = asyncio.get_running_loop()
+        outcome = await loop.run_in_executor(None, lambda: self.trader.attach_stops(
+            state['symbol'], state['order_id'], state['type'], sl=request['sl'], tp=request['tp'],
+            profit_amount=request['profit_amount'], sl_percentage=self.sl_percentage
+        ))
+        state.update(outcome)
+        return outcome.get('retcode')
+
+    def _classify(self, retcode):
+        if retcode in SUCCESS_RETCODES:
+            return 'attached'
+        if retcode in RETRY_RETCODES:
+            return RETRY
+        return 'failed'
+
+    def _describe(self, state):
+        return f"{state['symbol']} 订单={state['order_id']}"
@@ -6,9 +6,16 @@ import json
 import logging
 import os
 import sys
+import time
+from http import HTTPStatus
 import websockets
 from bybit_trader import BybitTrader
 from symbol_mapper import get_mapper
+from metrics import REGISTRY
+from loop_monitor import LoopLagMonitor
+from read_cache import ReadCache
+from records import json_default
+from trading_stops import TradingStopAttacher
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -36,6 +43,32 @@ symbol_mapper = get_mapper('config_bybit.json')
 # 初始化Bybit交易者
 trader = None
 
+# 只读请求的合并与短时缓存，交易操作后失效
+read_cache = ReadCache(config.get("read_cache_ttl_ms", {"get_account_info": 250, "get_positions": 100}))
+
+# 会改变账户或持仓状态的操作，完成后清空只读缓存
+TRADING_ACTIONS = ('open_position', 'close_position_by_ticket', 'close_positions_by_symbol', 'close_all_positions')
+
+# 开仓成交后在后台设置止损止盈（在start_server中创建）
+stop_attacher = None
+
+# 事件循环延迟监控（在start_server中创建，loop_lag_threshold_ms为0时不启用）
+loop_monitor = None
+
+# 服务指标（get_metrics和Prometheus /metrics）
+REQUESTS = REGISTRY.counter('ws_requests_total', 'WebSocket请求数', ('action', 'status'))
+REQUEST_ERRORS = REGISTRY.counter('ws_request_errors_total', 'WebSocket请求失败数', ('action', 'reason'))
+REQUEST_SECONDS = REGISTRY.histogram('ws_request_seconds', 'WebSocket请求处理耗时（秒）', ('action',))
+IN_FLIGHT = REGISTRY.gauge('ws_requests_in_flight', '正在处理的WebSocket请求数')
+REGISTRY.gauge('ws_connected_clients', '已连接的客户端数', function=lambda: len(connected_clients))
+
+# 已知的操作，其他操作在指标中记为unknown，避免标签无限增长
+ACTIONS = (
+    'health_check', 'get_account_info', 'open_position', 'close_position_by_ticket',
+    'close_positions_by_symbol', 'close_all_positions', 'get_positions', 'get_symbol_mappings',
+    'add_symbol_mapping', 'remove_symbol_mapping', 'get_metrics'
+)
+
 def initialize_bybit():
     """初始化Bybit连接"""
     global trader
@@ -47,7 +80,8 @@ def initialize_bybit():
         api_key=config.get("bybit_api_key", ""),
         secret_key=config.get("bybit_secret_key", ""),
         testnet=config.get("bybit_testnet", False),
-        demo_trading=config.get("bybit_demo_trading", False)
+        demo_trading=config.get("bybit_demo_trading", False),
+        rate_limits=config.get("bybit_rate_limits")
     )
     
     try:
@@ -84,6 +118,10 @@ async def handle_message(websocket, message):
         
         response = {'id': data.get('id'), 'status': 'error', 'message': '未知操作'}
         
+        metric_action = action if action in ACTIONS else 'unknown'
+        started = time.perf_counter()
+        IN_FLIGHT.inc()
+        
         # 根据操作类型执行相应的功能
         if action == 'health_check':
             response = await health_check(params)
@@ -105,14 +143,24 @@ async def handle_message(websocket, message):
             response = await add_symbol_mapping(params)
         elif action == 'remove_symbol_mapping':
             response = await remove_symbol_mapping(params)
+        elif action == 'get_metrics':
+            response = await get_metrics(params)
         else:
             response = {'status': 'error', 'message': f'未知操作: {action}'}
         
+        IN_FLIGHT.dec()
+        if action in TRADING_ACTIONS:
+            read_cache.invalidate()
+        REQUEST_SECONDS.observe(time.perf_counter() - started, metric_action)
+        REQUESTS.inc(metric_action, response.get('status', 'unknown'))
+        if response.get('status') == 'error':
+            REQUEST_ERRORS.inc(metric_action, response.get('reason', 'error'))
+        
         # 添加请求ID到响应中，方便客户端匹配请求和响应
         if 'id' in data:
             response['id'] = data['id']
         
-        await websocket.send(json.dumps(response, ensure_ascii=False))
+        await websocket.send(json.dumps(response, ensure_ascii=False, default=json_default))
     except json.JSONDecodeError:
         await websocket.send(json.dumps({
             'status': 'error',
@@ -132,13 +180,18 @@ async def health_check(params):
     else:
         return {'status': 'error', 'message': 'Bybit连接异常'}
 
+def run_read(func, *args):
+    """在默认线程池中执行只读的Bybit请求"""
+    return asyncio.get_running_loop().run_in_executor(None, func, *args)
+
 async def get_account_info(params):
     """获取账户信息"""
     if not trader or not trader.is_connected():
         return {'status': 'error', 'message': 'Bybit未连接'}
     
     try:
-        account_info = trader.get_account_info()
+        # 并发的相同请求只发送一次REST请求，在线程池中执行避免阻塞事件循环
+        account_info = await read_cache.get('get_account_info', None, lambda: run_read(trader.get_account_info))
         if account_info:
             return {'status': 'success', 'data': account_info}
         else:
@@ -208,25 +261,28 @@ async def open_position(params):
             timeout=90
         )
         
-        if result and result.get('retcode') == 0:
-            logger.info(f"开仓成功: 品种={symbol}, 订单号={result.get('order')}, 价格={result.get('price')}")
+        if result and result.retcode == 0:
+            logger.info(f"开仓成功: 品种={symbol}, 订单号={result.order}, 方向={result.type}")
+            # 市价单不带止损止盈，按实际均价设置的结果（含成交均价avg_price）通过stops_result事件推送
+            # 实际方向由交易量正负决定，可能与客户端传入的order_type不同
+            stops = stop_attacher.attach(symbol, result.order, result.type, profit_amount=profit_amount)
             return {
                 'status': 'success',
                 'message': '开仓成功',
                 'data': {
-                    'ticket': result.get('order'),
+                    'ticket': result.order,
                     'volume': volume,
-                    'price': result.get('price'),
                     'symbol': symbol,
-                    'type': order_type,
-                    'profit_amount_target': profit_amount if profit_amount > 0 else None
+                    'type': result.type,
+                    'profit_amount_target': profit_amount if profit_amount > 0 else None,
+                    'stops': stops
                 }
             }
         else:
-            error_code = result.get('retcode', 'Unknown') if result else 'Unknown'
+            error_code = result.retcode if result else 'Unknown'
             error_message = f"开仓失败，错误码: {error_code}"
-            if result and 'comment' in result:
-                error_message += f", 错误信息: {result['comment']}"
+            if result and result.comment:
+                error_message += f", 错误信息: {result.comment}"
             logger.error(error_message)
             return {'status': 'error', 'message': error_message}
     
@@ -316,6 +372,20 @@ async def close_all_positions(params):
         logger.exception(error_message)
         return {'status': 'error', 'message': error_message}
 
+async def fetch_positions(symbol, external_symbol):
+    """读取持仓并添加原始标的名称（结果会被缓存共享，返回后不再修改）"""
+    positions = await run_read(trader.get_positions, symbol)
+    
+    # 为持仓信息添加原始标的名称（保持兼容性）
+    for position in positions:
+        # 如果原始请求有@符号，则保持格式；否则直接使用bybit符号
+        if external_symbol and '@' in external_symbol:
+            position.original_symbol = f"{position.symbol}@{external_symbol.split('@')[1]}"
+        else:
+            position.original_symbol = position.symbol
+    
+    return positions
+
 async def get_positions(params):
     """获取持仓信息"""
     if not trader or not trader.is_connected():
@@ -337,18 +407,9 @@ async def get_positions(params):
         else:
             logger.info("获取所有持仓信息")
         
-        positions = trader.get_positions(symbol)
-        
-        # 为持仓信息添加原始标的名称（保持兼容性）
-        if positions and isinstance(positions, list):
-            for position in positions:
-                if 'symbol' in position:
-                    bybit_symbol = position['symbol']
-                    # 如果原始请求有@符号，则保持格式；否则直接使用bybit符号
-                    if external_symbol and '@' in external_symbol:
-                        position['original_symbol'] = f"{bybit_symbol}@{external_symbol.split('@')[1]}"
-                    else:
-                        position['original_symbol'] = bybit_symbol
+        positions = await read_cache.get(
+            'get_positions', external_symbol, lambda: fetch_positions(symbol, external_symbol)
+        )
         
         return {'status': 'success', 'data': positions}
             
@@ -357,6 +418,25 @@ async def get_positions(params):
         logger.exception(error_message)
         return {'status': 'error', 'message': error_message}
 
+async def get_metrics(params):
+    """获取服务指标"""
+    data = {
+        'metrics': REGISTRY.snapshot(),
+        'event_loop': loop_monitor.status() if loop_monitor else None,
+        'rate_limits': trader.rate_limiter.status() if trader else None,
+        'stops': stop_attacher.status()['stats'] if stop_attacher else None
+    }
+    return {'status': 'success', 'data': data}
+
+def process_request(connection, request):
+    """HTTP请求钩子：在WebSocket端口上提供Prometheus格式的/metrics，其他路径继续WebSocket握手"""
+    if request.path != config.get("metrics_path", "/metrics"):
+        return None
+    response = connection.respond(HTTPStatus.OK, REGISTRY.render_prometheus())
+    del response.headers['Content-Type']
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
 async def websocket_handler(websocket):
     """WebSocket连接处理函数"""
     client_address = websocket.remote_address
@@ -399,14 +479,34 @@ async def broadcast_message(message):
         return_exceptions=True
     )
 
+async def on_stops_result(event):
+    """止损止盈设置完成：清空只读缓存并推送结果"""
+    read_cache.invalidate()
+    await broadcast_message(event)
+
 async def start_server():
     """启动WebSocket服务器"""
+    global loop_monitor, stop_attacher
+    
     # 初始化Bybit连接
     initialize_bybit()
     
+    stop_attacher = TradingStopAttacher(
+        trader,
+        max_attempts=config.get("stops_max_attempts", 5),
+        retry_ms=config.get("stops_retry_ms", 200),
+        sl_percentage=config.get("stop_loss_percentage", 10.0),
+        on_result=on_stops_result
+    )
+    
     # 开始定期任务，如广播价格更新等
     asyncio.create_task(periodic_tasks())
     
+    # 监控事件循环延迟，记录阻塞事件循环的同步调用（如Bybit REST请求）
+    if config.get("loop_lag_threshold_ms", 100):
+        loop_monitor = LoopLagMonitor(config.get("loop_lag_threshold_ms", 100))
+        asyncio.create_task(loop_monitor.run())
+    
     # 启动WebSocket服务器
     host = "0.0.0.0"
     port = 8766  # 使用不同的端口避免冲突
@@ -417,7 +517,8 @@ async def start_server():
         "ping_timeout": 180,      # 180秒超时
         "max_size": 10 * 1024 * 1024,  # 最大消息大小10MB
         "max_queue": 1024,        # 最大队列大小
-        "close_timeout": 60       # 关闭超时时间
+        "close_timeout": 60,      # 关闭超时时间
+        "process_request": process_request  # 同一端口提供/metrics
     }
     
     logger.info(f"启动Bybit WebSocket服务器 ws://{host}:{port}")
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class ConnectionSupervisor:
+    """
+    MT5连接守护
+    在独立线程中检查连接状态并按指数退避（带随机抖动）重连，不阻塞事件循环；
+    重连期间交易请求可以在有界队列中等待，而不是直接被拒绝
+    """
+
+    def __init__(self, connect, is_connected, check_interval=2.0, first_retry_delay=0.1,
+                 base_delay=0.5, max_delay=30.0, jitter=0.2, max_held=100,
+                 on_connected=None, on_state_change=None):
+        """
+        初始化连接守护
+
+        Args:
+            connect: 建立连接的同步函数，返回bool
+            is_connected: 检查连接的同步函数，返回bool
+            check_interval: 连接正常时的检查间隔（秒）
+            first_retry_delay: 发现断开后第一次重连前的等待（秒）
+            base_delay: 退避基础间隔（秒），第n次（n>=2）重连前等待 base_delay * 2^(n-2)
+            max_delay: 退避最大间隔（秒）
+            jitter: 随机抖动比例，0.2表示在等待时间上下浮动20%
+            max_held: 重连期间最多等待的请求数
+            on_connected: 连接（或重连）成功后调用的协程函数
+            on_state_change: 状态变化时调用的函数，参数为新状态
+        """
+        self.connect = connect
+        self.is_connected = is_connected
+        self.check_interval = check_interval
+        self.first_retry_delay = first_retry_delay
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.max_held = max_held
+        self.on_connected = on_connected
+        self.on_state_change = on_state_change
+
+        # 状态: idle / connecting / connected / reconnecting
+        self.state = 'idle'
+        self.attempts = 0
+        self.reconnect_count = 0
+        self.held = 0
+        self.last_connected_at = None
+        self.last_disconnected_at = None
+
+        # 连接检查和重连都在专用线程执行，不占用下单的线程池
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='mt5-supervisor')
+        self._connected_event = asyncio.Event()
+        self._wakeup = asyncio.Event()
+
+    @property
+    def connected(self):
+        """最近一次检查的连接状态"""
+        return self._connected_event.is_set()
+
+    def _set_state(self, state):
+        """更新状态并通知"""
+        if state == self.state:
+            return
+        self.state = state
+        logger.info(f"MT5连接状态: {state}")
+        if self.on_state_change:
+            try:
+                self.on_state_change(state)
+            except Exception as e:
+                logger.exception(f"处理连接状态变化时出错: {str(e)}")
+
+    def retry_delay(self, attempt):
+        """
+        计算第attempt次重连前的等待时间（秒）
+
+        Args:
+            attempt: 重连次数，从1开始
+        """
+        if attempt <= 1:
+            delay = self.first_retry_delay
+        else:
+            delay = min(self.base_delay * (2 ** (attempt - 2)), self.max_delay)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def request_check(self):
+        """请求立即检查连接（如下单时发现连接异常）"""
+        self._wakeup.set()
+
+    async def _call(self, func):
+        """在守护线程中执行同步函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func)
+
+    async def _sleep_or_wakeup(self, delay):
+        """等待delay秒，或被request_check提前唤醒"""
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _on_connected(self):
+        """连接成功后的处理"""
+        self.attempts = 0
+        self.last_connected_at = time.time()
+        if self.on_connected:
+            try:
+                await self.on_connected()
+            except Exception as e:
+                logger.exception(f"连接成功回调执行出错: {str(e)}")
+        self._connected_event.set()
+        self._set_state('connected')
+
+    async def run(self):
+        """守护主循环"""
+        self._set_state('connecting')
+        while True:
+            try:
+                if self.connected:
+                    await self._sleep_or_wakeup(self.check_interval)
+                    if await self._call(self.is_connected):
+                        continue
+                    logger.warning("MT5连接已断开，开始重连...")
+                    self._connected_event.clear()
+                    self.last_disconnected_at = time.time()
+                    self.reconnect_count += 1
+                    self._set_state('reconnecting')
+                    await asyncio.sleep(self.retry_delay(1))
+
+                self.attempts += 1
+                logger.info(f"正在连接MT5（第{self.attempts}次尝试）")
+                if await self._call(self.connect):
+                    await self._on_connected()
+                    continue
+
+                delay = self.retry_delay(self.attempts + 1)
+                logger.warning(f"MT5连接失败，{delay:.2f}秒后重试")
+                await self._sleep_or_wakeup(delay)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"连接守护执行出错: {str(e)}")
+                await asyncio.sleep(self.max_delay)
+
+    async def hold_until_connected(self, timeout):
+        """
+        等待连接恢复（用于重连期间暂存交易请求）
+
+        Args:
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            tuple: (是否已连接, 失败原因)
+        """
+        if self.connected:
+            return True, None
+
+        if self.held >= self.max_held:
+            return False, f'MT5未连接，等待重连的请求已达上限({self.max_held})'
+
+        self.held += 1
+        self.request_check()
+        try:
+            await asyncio.wait_for(self._connected_event.wait(), timeout=timeout)
+            return True, None
+        except asyncio.TimeoutError:
+            return False, f'MT5未连接，等待重连超时({timeout:.1f}秒)'
+        finally:
+            self.held -= 1
+
+    def status(self):
+        """获取连接守护状态"""
+        return {
+            'state': self.state,
+            'connected': self.connected,
+            'attempts': self.attempts,
+            'reconnect_count': self.reconnect_count,
+            'held': self.held,
+            'last_connected_at': self.last_connected_at,
+            'last_disconnected_at': self.last_disconnected_at
+        }
+
+    def shutdown(self):
+        """关闭守护线程"""
+        self._executor.shutdown(wait=False)
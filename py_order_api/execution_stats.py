@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import math
+import time
+from collections import deque
+from datetime import datetime
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SIGNAL_AGE = REGISTRY.histogram('signal_age_seconds', 'ATAS信号从发出到服务端收到的时间（秒）', ('symbol',))
+SIGNAL_TO_FILL = REGISTRY.histogram('signal_to_fill_seconds', '服务端收到ATAS信号到MT5成交的时间（秒）', ('symbol',))
+SLIPPAGE_POINTS = REGISTRY.gauge('signal_slippage_points', '最近成交相对ATAS均价的滑点均值（点，正数为不利）', ('symbol',))
+SLIPPAGE_MONEY = REGISTRY.gauge('signal_slippage_money', '最近成交相对ATAS均价的滑点均值（账户货币，正数为不利）', ('symbol',))
+
+def parse_signal_time(value):
+    """
+    解析ATAS推送的timestamp
+
+    Args:
+        value: ISO 8601字符串（Json.NET序列化的DateTime，无时区时按本地时间），
+               或Unix时间戳（秒或毫秒）
+
+    Returns:
+        float: Unix时间戳（秒），无法解析返回None
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return value / 1000 if value > 1e11 else float(value)
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+class RollingStats:
+    """
+    增量统计：全部样本的均值/方差（Welford算法）和最近window个样本的均值/最大值
+    每次更新O(1)，不保存全部样本
+    """
+
+    __slots__ = ('count', 'mean', '_m2', 'min', 'max', '_window', '_window_sum')
+
+    def __init__(self, window=200):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+        self._window = deque(maxlen=window)
+        self._window_sum = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+        if len(self._window) == self._window.maxlen:
+            self._window_sum -= self._window[0]
+        self._window.append(value)
+        self._window_sum += value
+
+    @property
+    def std(self):
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    @property
+    def recent_mean(self):
+        return self._window_sum / len(self._window) if self._window else None
+
+    def snapshot(self, digits=3):
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean': round(self.mean, digits),
+            'std': round(self.std, digits),
+            'min': round(self.min, digits),
+            'max': round(self.max, digits),
+            'recent_mean': round(self.recent_mean, digits),
+            'recent_max': round(max(self._window), digits)
+        }
+
+class SymbolExecutionStats:
+    """单个MT5品种的信号执行统计"""
+
+    __slots__ = ('signal_age_ms', 'signal_to_fill_ms', 'slippage_points', 'slippage_money', 'last')
+
+    def __init__(self, window):
+        self.signal_age_ms = RollingStats(window)       # ATAS发出 -> 服务端收到
+        self.signal_to_fill_ms = RollingStats(window)   # 服务端收到 -> MT5成交
+        self.slippage_points = RollingStats(window)     # 成交价相对ATAS均价，正数为不利
+        self.slippage_money = RollingStats(window)
+        self.last = None
+
+class ExecutionStats:
+    """
+    ATAS信号与MT5成交的对照统计
+    把每次信号执行的订单与触发它的position_update关联，按品种统计信号延迟、成交耗时和滑点
+    滑点的参考价是ATAS推送的averagePrice，即整个ATAS持仓的均价而不是本次变化的成交价，
+    因此只统计从空仓开仓（含反向后开仓）的订单；加仓时参考价混合了之前的成交，不计入滑点
+    """
+
+    def __init__(self, spec_cache=None, window=200):
+        """
+        初始化统计
+
+        Args:
+            spec_cache: 品种规格缓存，用于把价格差换算为点数和金额
+            window: 最近样本窗口大小
+        """
+        self.spec_cache = spec_cache
+        self.window = window
+        self.symbols = {}
+
+    def _stats_for(self, symbol):
+        stats = self.symbols.get(symbol)
+        if stats is None:
+            stats = self.symbols[symbol] = SymbolExecutionStats(self.window)
+        return stats
+
+    def record_signal(self, symbol, signal, received):
+        """
+        记录信号到达
+
+        Args:
+            symbol: MT5品种
+            signal: position_update参数
+            received: 服务端收到的时间（Unix秒）
+        """
+        sent = parse_signal_time(signal.get('timestamp'))
+        if sent is None:
+            return
+        age = received - sent
+        self._stats_for(symbol).signal_age_ms.add(age * 1000)
+        SIGNAL_AGE.observe(max(age, 0.0), symbol)
+
+    def record_fill(self, symbol, signal, received, order):
+        """
+        记录信号产生的订单成交
+
+        Args:
+            symbol: MT5品种
+            signal: 触发下单的（合并窗口内最后一条）position_update参数
+            received: 服务端收到该信号的时间（Unix秒）
+            order: signal_result中的订单（action/type/volume/price/from_flat）
+
+        Returns:
+            dict: 本次的延迟和滑点
+        """
+        stats = self._stats_for(symbol)
+        elapsed = time.time() - received
+        stats.signal_to_fill_ms.add(elapsed * 1000)
+        SIGNAL_TO_FILL.observe(elapsed, symbol)
+        sample = {'signal_to_fill_ms': round(elapsed * 1000, 3)}
+
+        # 只有从空仓开仓时ATAS均价等于本次变化的成交价，加仓时均价包含之前的成交，不可比
+        reference = signal.get('averagePrice')
+        fill = order.get('price')
+        if order.get('action') == 'open' and order.get('from_flat') and reference and fill:
+            direction = 1 if order.get('type') == 'BUY' else -1
+            difference = (float(fill) - float(reference)) * direction
+            spec = self.spec_cache.get(symbol) if self.spec_cache is not None else None
+            if spec and spec.point:
+                points = difference / spec.point
+                stats.slippage_points.add(points)
+                SLIPPAGE_POINTS.set(stats.slippage_points.recent_mean, symbol)
+                sample['slippage_points'] = round(points, 3)
+            if spec and spec.trade_tick_size and spec.trade_tick_value:
+                money = difference / spec.trade_tick_size * spec.trade_tick_value * order.get('volume', 0)
+                stats.slippage_money.add(money)
+                SLIPPAGE_MONEY.set(stats.slippage_money.recent_mean, symbol)
+                sample['slippage_money'] = round(money, 4)
+
+        stats.last = sample
+        return sample
+
+    def status(self, symbol=None):
+        """
+        获取统计
+
+        Args:
+            symbol: MT5品种，为空则返回所有品种
+
+        Returns:
+            dict: 品种 -> 各项统计（毫秒/点/账户货币）
+        """
+        symbols = [symbol] if symbol else list(self.symbols)
+        result = {}
+        for name in symbols:
+            stats = self.symbols.get(name)
+            if stats is None:
+                continue
+            result[name] = {
+                'signal_age_ms': stats.signal_age_ms.snapshot(),
+                'signal_to_fill_ms': stats.signal_to_fill_ms.snapshot(),
+                'slippage_points': stats.slippage_points.snapshot(),
+                'slippage_money': stats.slippage_money.snapshot(4),
+                'last': stats.last
+            }
+        return result
@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+模拟的MetaTrader5后端（mt5_backend为fake或环境变量MT5_BACKEND=fake时使用）
+
+实现服务用到的MetaTrader5接口：连接、品种信息、报价、下单、持仓、历史和行情数据。
+报价固定（可用set_quote修改），票据号从1001开始递增，同样的请求序列得到同样的结果，
+用于在没有终端的机器上运行服务、回放抓包和基准测试。
+环境变量FAKE_MT5_LATENCY_MS模拟order_send的耗时（毫秒）；
+FAKE_MT5_NETTING=1模拟净额账户（同一品种只有一个持仓，加仓订单并入该持仓），默认为对冲账户。
+"""
+
+import collections
+import os
+import threading
+import time
+
+__version__ = 'fake'
+
+# 常量（与MetaTrader5一致）
+TRADE_RETCODE_REQUOTE = 10004
+TRADE_RETCODE_REJECT = 10006
+TRADE_RETCODE_DONE = 10009
+TRADE_RETCODE_INVALID_STOPS = 10016
+TRADE_RETCODE_PRICE_CHANGED = 10020
+TRADE_RETCODE_PRICE_OFF = 10021
+TRADE_RETCODE_POSITION_CLOSED = 10036
+
+TRADE_ACTION_DEAL = 1
+TRADE_ACTION_PENDING = 5
+TRADE_ACTION_SLTP = 6
+TRADE_ACTION_MODIFY = 7
+TRADE_ACTION_REMOVE = 8
+
+ORDER_TYPE_BUY = 0
+ORDER_TYPE_SELL = 1
+POSITION_TYPE_BUY = 0
+POSITION_TYPE_SELL = 1
+DEAL_TYPE_BUY = 0
+DEAL_TYPE_SELL = 1
+DEAL_ENTRY_IN = 0
+DEAL_ENTRY_OUT = 1
+DEAL_ENTRY_INOUT = 2
+ORDER_STATE_FILLED = 4
+
+ORDER_FILLING_FOK = 0
+ORDER_FILLING_IOC = 1
+ORDER_FILLING_RETURN = 2
+ORDER_TIME_GTC = 0
+
+SYMBOL_FILLING_FOK = 1
+SYMBOL_FILLING_IOC = 2
+
+COPY_TICKS_ALL = -1
+COPY_TICKS_INFO = 1
+COPY_TICKS_TRADE = 2
+
+TIMEFRAME_M1 = 1
+TIMEFRAME_M5 = 5
+TIMEFRAME_M15 = 15
+TIMEFRAME_M30 = 30
+TIMEFRAME_H1 = 16385
+TIMEFRAME_H4 = 16388
+TIMEFRAME_D1 = 16408
+
+_TIMEFRAME_SECONDS = {
+    TIMEFRAME_M1: 60, TIMEFRAME_M5: 300, TIMEFRAME_M15: 900, TIMEFRAME_M30: 1800,
+    TIMEFRAME_H1: 3600, TIMEFRAME_H4: 14400, TIMEFRAME_D1: 86400
+}
+
+# 返回的记录类型（字段与MetaTrader5一致）
+TerminalInfo = collections.namedtuple('TerminalInfo', 'name build connected trade_allowed company path')
+AccountInfo = collections.namedtuple(
+    'AccountInfo',
+    'login trade_mode leverage limit_orders margin_so_mode trade_allowed trade_expert margin_mode '
+    'currency_digits fifo_close balance credit profit equity margin margin_free margin_level '
+    'margin_so_call margin_so_so margin_initial margin_maintenance assets liabilities '
+    'commission_blocked name server currency company'
+)
+SymbolInfo = collections.namedtuple(
+    'SymbolInfo',
+    'name visible digits point spread trade_tick_value trade_tick_size trade_contract_size '
+    'trade_stops_level volume_min volume_max volume_step filling_mode bid ask'
+)
+Tick = collections.namedtuple('Tick', 'time bid ask last volume time_msc flags volume_real')
+OrderSendResult = collections.namedtuple(
+    'OrderSendResult', 'retcode deal order volume price bid ask comment request_id retcode_external request'
+)
+TradePosition = collections.namedtuple(
+    'TradePosition',
+    'ticket time time_msc time_update time_update_msc type magic identifier reason volume '
+    'price_open sl tp price_current swap profit symbol comment external_id'
+)
+TradeDeal = collections.namedtuple(
+    'TradeDeal',
+    'ticket order time time_msc type entry magic position_id reason volume price commission '
+    'swap profit fee symbol comment external_id'
+)
+TradeOrder = collections.namedtuple(
+    'TradeOrder',
+    'ticket time_setup time_setup_msc time_done time_done_msc type state type_filling magic '
+    'position_id reason volume_initial volume_current price_open sl tp price_current symbol '
+    'comment external_id'
+)
+
+# 默认报价: 品种 -> (bid, ask, digits)
+_DEFAULT_QUOTES = {
+    'EURUSD': (1.10000, 1.10002, 5),
+    'GBPUSD': (1.27000, 1.27003, 5),
+    'USDJPY': (150.000, 150.003, 3),
+    'XAUUSD': (2000.00, 2000.20, 2),
+}
+
+_lock = threading.RLock()
+_state = {'initialized': False, 'ticket': 1000, 'error': (1, 'Success')}
+_quotes = {}
+_positions = {}
+_deals = []
+_orders = []
+
+def reset():
+    """清空持仓、历史和报价（回放前调用，保证结果可重复）"""
+    with _lock:
+        _state.update(ticket=1000, error=(1, 'Success'))
+        _quotes.clear()
+        _positions.clear()
+        del _deals[:]
+        del _orders[:]
+
+def set_quote(symbol, bid, ask, digits=None):
+    """设置品种的报价"""
+    with _lock:
+        digits = digits if digits is not None else _quote(symbol)[2]
+        _quotes[symbol] = (bid, ask, digits)
+
+def _quote(symbol):
+    quote = _quotes.get(symbol)
+    if quote is None:
+        quote = _DEFAULT_QUOTES.get(symbol, (100.00, 100.10, 2))
+    return quote
+
+def _latency():
+    latency_ms = float(os.environ.get('FAKE_MT5_LATENCY_MS', 0) or 0)
+    if latency_ms > 0:
+        time.sleep(latency_ms / 1000)
+
+def _netting():
+    return os.environ.get('FAKE_MT5_NETTING', '') not in ('', '0')
+
+def _next_ticket():
+    _state['ticket'] += 1
+    return _state['ticket']
+
+# 连接
+
+def initialize(path=None, **kwargs):
+    _state['initialized'] = True
+    return True
+
+def login(login=0, password='', server='', timeout=60000):
+    return _state['initialized']
+
+def shutdown():
+    _state['initialized'] = False
+
+def last_error():
+    return _state['error']
+
+def version():
+    return (500, 4000, 'fake')
+
+def terminal_info():
+    if not _state['initialized']:
+        return None
+    return TerminalInfo('Fake MetaTrader 5', 4000, True, True, 'fake', '')
+
+def account_info():
+    if not _state['initialized']:
+        return None
+    with _lock:
+        balance = 10000.0 + sum(deal.profit for deal in _deals)
+        profit = sum(position.profit for position in _positions.values())
+    equity = balance + profit
+    return AccountInfo(
+        1, 0, 100, 200, 0, True, True, 0 if _netting() else 2, 2, False, round(balance, 2), 0.0, round(profit, 2),
+        round(equity, 2), 0.0, round(equity, 2), 0.0, 50.0, 30.0, 0.0, 0.0, 0.0, 0.0, 0.0,
+        'Fake', 'Fake-Server', 'USD', 'fake'
+    )
+
+# 品种和报价
+
+def symbol_info(symbol):
+    bid, ask, digits = _quote(symbol)
+    point = 10 ** -digits
+    contract_size = 100.0 if symbol.startswith('XAU') else 100000.0
+    return SymbolInfo(
+        symbol, True, digits, point, int(round((ask - bid) / point)), point * contract_size, point,
+        contract_size, 0, 0.01, 100.0, 0.01, SYMBOL_FILLING_FOK | SYMBOL_FILLING_IOC, bid, ask
+    )
+
+def symbol_select(symbol, enable=True):
+    return True
+
+def symbol_info_tick(symbol):
+    bid, ask, _ = _quote(symbol)
+    now = time.time()
+    return Tick(int(now), bid, ask, 0.0, 0, int(now * 1000), 6, 0.0)
+
+# 交易
+
+def _profit(position, price):
+    direction = 1 if position.type == POSITION_TYPE_BUY else -1
+    info = symbol_info(position.symbol)
+    return round((price - position.price_open) * direction * position.volume * info.trade_contract_size, 2)
+
+def _record(order_type, entry, request, volume, price, position_id, profit, now):
+    ticket = _next_ticket()
+    time_msc = int(now * 1000)
+    _orders.append(TradeOrder(
+        ticket, int(now), time_msc, int(now), time_msc, order_type, ORDER_STATE_FILLED,
+        request.get('type_filling', 0), request.get('magic', 0), position_id, 3, volume, 0.0,
+        price, request.get('sl', 0.0), request.get('tp', 0.0), price, request['symbol'],
+        request.get('comment', ''), ''
+    ))
+    _deals.append(TradeDeal(
+        ticket, ticket, int(now), time_msc, order_type, entry, request.get('magic', 0), position_id,
+        3, volume, price, 0.0, 0.0, profit, 0.0, request['symbol'], request.get('comment', ''), ''
+    ))
+    return ticket
+
+def _result(retcode, request, ticket=0, volume=0.0, price=0.0, comment='Request executed'):
+    bid, ask, _ = _quote(request.get('symbol', ''))
+    return OrderSendResult(retcode, ticket, ticket, volume, price, bid, ask, comment, 0, 0, request)
+
+def order_send(request):
+    _latency()
+    if not _state['initialized']:
+        _state['error'] = (-10004, 'No IPC connection')
+        return None
+
+    with _lock:
+        action = request.get('action')
+        symbol = request.get('symbol', '')
+        bid, ask, _ = _quote(symbol)
+        now = time.time()
+
+        if action == TRADE_ACTION_SLTP:
+            position = _positions.get(request.get('position'))
+            if position is None:
+                return _result(TRADE_RETCODE_POSITION_CLOSED, request, comment='Position doesn\'t exist')
+            _positions[position.ticket] = position._replace(
+                sl=request.get('sl', 0.0), tp=request.get('tp', 0.0),
+                time_update=int(now), time_update_msc=int(now * 1000)
+            )
+            return _result(TRADE_RETCODE_DONE, request)
+
+        if action != TRADE_ACTION_DEAL:
+            return _result(TRADE_RETCODE_REJECT, request, comment='Unsupported action')
+
+        order_type = request.get('type')
+        volume = float(request.get('volume', 0))
+        price = ask if order_type == ORDER_TYPE_BUY else bid
+
+        if 'position' in request:
+            position = _positions.get(request['position'])
+            if position is None:
+                return _result(TRADE_RETCODE_POSITION_CLOSED, request, comment='Position doesn\'t exist')
+            volume = min(volume, position.volume)
+            closed = position._replace(volume=volume)
+            ticket = _record(order_type, DEAL_ENTRY_OUT, request, volume, price, position.ticket,
+                             _profit(closed, price), now)
+            remaining = round(position.volume - volume, 8)
+            if remaining <= 0:
+                del _positions[position.ticket]
+            else:
+                _positions[position.ticket] = position._replace(volume=remaining)
+            return _result(TRADE_RETCODE_DONE, request, ticket, volume, price)
+
+        existing = next((p for p in _positions.values() if p.symbol == symbol), None) if _netting() else None
+        if existing is not None:
+            return _net(existing, order_type, request, volume, price, now)
+
+        ticket = _record(order_type, DEAL_ENTRY_IN, request, volume, price, 0, 0.0, now)
+        _orders[-1] = _orders[-1]._replace(position_id=ticket)
+        _deals[-1] = _deals[-1]._replace(position_id=ticket)
+        _positions[ticket] = TradePosition(
+            ticket, int(now), int(now * 1000), int(now), int(now * 1000),
+            POSITION_TYPE_BUY if order_type == ORDER_TYPE_BUY else POSITION_TYPE_SELL,
+            request.get('magic', 0), ticket, 3, volume, price, request.get('sl', 0.0),
+            request.get('tp', 0.0), price, 0.0, 0.0, symbol, request.get('comment', ''), ''
+        )
+        return _result(TRADE_RETCODE_DONE, request, ticket, volume, price)
+
+def _net(position, order_type, request, volume, price, now):
+    """净额账户：订单并入该品种的持仓（加仓、减仓或反手），持仓票据不变"""
+    if (position.type == POSITION_TYPE_BUY) == (order_type == ORDER_TYPE_BUY):
+        total = round(position.volume + volume, 8)
+        price_open = round((position.price_open * position.volume + price * volume) / total, _quote(position.symbol)[2])
+        ticket = _record(order_type, DEAL_ENTRY_IN, request, volume, price, position.ticket, 0.0, now)
+        _positions[position.ticket] = position._replace(volume=total, price_open=price_open)
+        return _result(TRADE_RETCODE_DONE, request, ticket, volume, price)
+
+    closed = min(volume, position.volume)
+    remaining = round(volume - position.volume, 8)
+    ticket = _record(order_type, DEAL_ENTRY_OUT if remaining <= 0 else DEAL_ENTRY_INOUT, request, volume, price,
+                     position.ticket, _profit(position._replace(volume=closed), price), now)
+    if remaining < 0:
+        _positions[position.ticket] = position._replace(volume=-remaining)
+    elif remaining == 0:
+        del _positions[position.ticket]
+    else:
+        _positions[position.ticket] = position._replace(
+            type=POSITION_TYPE_BUY if order_type == ORDER_TYPE_BUY else POSITION_TYPE_SELL,
+            volume=remaining, price_open=price
+        )
+    return _result(TRADE_RETCODE_DONE, request, ticket, volume, price)
+
+def positions_get(symbol=None, ticket=None, group=None):
+    with _lock:
+        positions = []
+        for position in _positions.values():
+            if symbol and position.symbol != symbol:
+                continue
+            if ticket and position.ticket != ticket:
+                continue
+            bid, ask, _ = _quote(position.symbol)
+            price = bid if position.type == POSITION_TYPE_BUY else ask
+            positions.append(position._replace(price_current=price, profit=_profit(position, price)))
+    return tuple(positions)
+
+def positions_total():
+    return len(_positions)
+
+# 历史
+
+def _in_range(records, time_field, date_from, date_to):
+    date_from = date_from.timestamp() if hasattr(date_from, 'timestamp') else date_from
+    date_to = date_to.timestamp() if hasattr(date_to, 'timestamp') else date_to
+    with _lock:
+        return tuple(record for record in records if date_from <= getattr(record, time_field) < date_to)
+
+def history_deals_get(date_from=None, date_to=None, group=None, ticket=None, position=None):
+    if ticket is not None or position is not None:
+        with _lock:
+            return tuple(
+                deal for deal in _deals
+                if (ticket is None or deal.order == ticket) and (position is None or deal.position_id == position)
+            )
+    return _in_range(_deals, 'time', date_from, date_to)
+
+def history_orders_get(date_from, date_to, group=None):
+    return _in_range(_orders, 'time_done', date_from, date_to)
+
+# 行情数据（固定报价生成的K线和Tick，需要numpy）
+
+def _seconds(value):
+    return int(value.timestamp() if hasattr(value, 'timestamp') else value)
+
+def copy_rates_range(symbol, timeframe, date_from, date_to):
+    import numpy as np
+
+    step = _TIMEFRAME_SECONDS.get(timeframe, 60)
+    times = np.arange(_seconds(date_from) // step * step, _seconds(date_to), step, dtype='<i8')
+    rates = np.zeros(len(times), dtype=[
+        ('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+        ('tick_volume', '<u8'), ('spread', '<i4'), ('real_volume', '<u8')
+    ])
+    bid, ask, digits = _quote(symbol)
+    rates['time'] = times
+    for field in ('open', 'high', 'low', 'close'):
+        rates[field] = bid
+    rates['tick_volume'] = 1
+    rates['spread'] = int(round((ask - bid) * 10 ** digits))
+    return rates
+
+def _ticks(symbol, start_msc, end_msc, count=None):
+    import numpy as np
+
+    # 每100毫秒一个Tick
+    first = -(-start_msc // 100) * 100
+    times = np.arange(first, end_msc, 100, dtype='<i8')
+    if count is not None:
+        times = times[:count]
+    ticks = np.zeros(len(times), dtype=[
+        ('time', '<i8'), ('bid', '<f8'), ('ask', '<f8'), ('last', '<f8'), ('volume', '<u8'),
+        ('time_msc', '<i8'), ('flags', '<u4'), ('volume_real', '<f8')
+    ])
+    bid, ask, _ = _quote(symbol)
+    ticks['time'] = times // 1000
+    ticks['time_msc'] = times
+    ticks['bid'] = bid
+    ticks['ask'] = ask
+    ticks['flags'] = 6
+    return ticks
+
+def copy_ticks_range(symbol, date_from, date_to, flags=COPY_TICKS_ALL):
+    return _ticks(symbol, _seconds(date_from) * 1000, _seconds(date_to) * 1000)
+
+def copy_ticks_from(symbol, date_from, count, flags=COPY_TICKS_ALL):
+    return _ticks(symbol, _seconds(date_from) * 1000, int(time.time() * 1000), count)
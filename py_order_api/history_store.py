@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 成交记录字段（mt5.history_deals_get返回的TradeDeal）
+DEAL_COLUMNS = (
+    "ticket", "order", "time", "time_msc", "type", "entry", "magic", "position_id", "reason",
+    "volume", "price", "commission", "swap", "profit", "fee", "symbol", "comment", "external_id"
+)
+
+# 历史订单字段（mt5.history_orders_get返回的TradeOrder）
+ORDER_COLUMNS = (
+    "ticket", "time_setup", "time_setup_msc", "time_done", "time_done_msc", "type", "state",
+    "type_filling", "magic", "position_id", "reason", "volume_initial", "volume_current",
+    "price_open", "sl", "tp", "price_current", "symbol", "comment", "external_id"
+)
+
+# 每个表按时间排序使用的列
+_TIME_COLUMN = {'deals': 'time_msc', 'orders': 'time_done_msc'}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS deals (
+    ticket INTEGER PRIMARY KEY, "order" INTEGER, time INTEGER, time_msc INTEGER, type INTEGER,
+    entry INTEGER, magic INTEGER, position_id INTEGER, reason INTEGER, volume REAL, price REAL,
+    commission REAL, swap REAL, profit REAL, fee REAL, symbol TEXT, comment TEXT, external_id TEXT
+);
+CREATE INDEX IF NOT EXISTS deals_time ON deals (time_msc, ticket);
+CREATE INDEX IF NOT EXISTS deals_symbol_time ON deals (symbol, time_msc, ticket);
+CREATE INDEX IF NOT EXISTS deals_position ON deals (position_id);
+CREATE TABLE IF NOT EXISTS orders (
+    ticket INTEGER PRIMARY KEY, time_setup INTEGER, time_setup_msc INTEGER, time_done INTEGER,
+    time_done_msc INTEGER, type INTEGER, state INTEGER, type_filling INTEGER, magic INTEGER,
+    position_id INTEGER, reason INTEGER, volume_initial REAL, volume_current REAL, price_open REAL,
+    sl REAL, tp REAL, price_current REAL, symbol TEXT, comment TEXT, external_id TEXT
+);
+CREATE INDEX IF NOT EXISTS orders_time ON orders (time_done_msc, ticket);
+CREATE INDEX IF NOT EXISTS orders_symbol_time ON orders (symbol, time_done_msc, ticket);
+CREATE INDEX IF NOT EXISTS orders_position ON orders (position_id);
+CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value INTEGER);
+"""
+
+class HistoryStore:
+    """
+    本地成交/历史订单库（SQLite）
+    从上次同步到的时间增量拉取MT5历史，查询（分页、每日盈亏、按持仓对账）不再访问终端
+    所有方法都是同步的，应在线程池中调用
+    """
+
+    def __init__(self, path='history.db', backfill_days=90, overlap_seconds=300):
+        """
+        初始化历史库
+
+        Args:
+            path: SQLite文件路径
+            backfill_days: 首次同步拉取的天数
+            overlap_seconds: 增量同步时向前重叠的秒数（重复记录按票据去重），
+                             覆盖终端延迟入库的成交
+        """
+        self.path = path
+        self.backfill_days = backfill_days
+        self.overlap_seconds = overlap_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        self.last_sync = None
+
+    def _get_state(self, key):
+        row = self._conn.execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _store(self, table, columns, records):
+        """按票据写入记录（已存在则覆盖）"""
+        if not records:
+            return 0
+        column_list = ', '.join(f'"{column}"' for column in columns)
+        placeholders = ', '.join('?' * len(columns))
+        rows = [tuple(getattr(record, column, None) for column in columns) for record in records]
+        self._conn.executemany(
+            f'INSERT OR REPLACE INTO {table} ({column_list}) VALUES ({placeholders})', rows
+        )
+        return len(rows)
+
+    def sync(self, fetch_deals, fetch_orders, now=None):
+        """
+        从MT5增量同步历史
+
+        Args:
+            fetch_deals: 函数(date_from, date_to)，返回TradeDeal元组（时间为Unix秒）
+            fetch_orders: 函数(date_from, date_to)，返回TradeOrder元组
+            now: 当前时间（Unix秒），为空则使用time.time()
+
+        Returns:
+            dict: 本次同步的成交数和订单数
+        """
+        now = now or time.time()
+        # MT5历史使用服务器时间，结束时间多留一天避免时区差导致漏掉最新记录
+        date_to = int(now) + 86400
+        started = time.perf_counter()
+
+        with self._lock:
+            result = {}
+            for table, columns, fetch in (('deals', DEAL_COLUMNS, fetch_deals),
+                                          ('orders', ORDER_COLUMNS, fetch_orders)):
+                synced_to = self._get_state(f'{table}_synced_to')
+                if synced_to is None:
+                    date_from = int(now) - self.backfill_days * 86400
+                else:
+                    date_from = synced_to - self.overlap_seconds
+
+                records = fetch(date_from, date_to)
+                if records is None:
+                    raise RuntimeError(f'读取MT5历史失败: {table}')
+
+                count = self._store(table, columns, records)
+                # 下次从本次拉取到的最新记录时间继续
+                latest = self._conn.execute(
+                    f'SELECT MAX({_TIME_COLUMN[table]}) FROM {table}'
+                ).fetchone()[0]
+                if latest is not None:
+                    self._conn.execute(
+                        'INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)',
+                        (f'{table}_synced_to', latest // 1000)
+                    )
+                elif synced_to is None:
+                    self._conn.execute(
+                        'INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)',
+                        (f'{table}_synced_to', int(now) - self.overlap_seconds)
+                    )
+                result[table] = count
+            self._conn.commit()
+
+        self.last_sync = time.time()
+        result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        logger.debug("历史同步完成: %s", result)
+        return result
+
+    def query(self, table, symbol=None, date_from=None, date_to=None, position_id=None,
+              magic=None, cursor=None, limit=500):
+        """
+        按时间顺序分页查询成交或历史订单（使用(时间, 票据)游标，不使用OFFSET）
+
+        Args:
+            table: deals或orders
+            symbol: MT5品种
+            date_from: 开始时间（Unix秒，含）
+            date_to: 结束时间（Unix秒，不含）
+            position_id: 持仓ID
+            magic: 魔术号
+            cursor: 上一页返回的next_cursor
+            limit: 每页记录数
+
+        Returns:
+            dict: {"items": 记录列表, "next_cursor": 下一页游标，没有更多则为None}
+        """
+        if table not in _TIME_COLUMN:
+            raise ValueError(f'未知的历史表: {table}')
+        time_column = _TIME_COLUMN[table]
+
+        conditions = []
+        args = []
+        if symbol:
+            conditions.append('symbol = ?')
+            args.append(symbol)
+        if date_from is not None:
+            conditions.append(f'{time_column} >= ?')
+            args.append(int(float(date_from) * 1000))
+        if date_to is not None:
+            conditions.append(f'{time_column} < ?')
+            args.append(int(float(date_to) * 1000))
+        if position_id is not None:
+            conditions.append('position_id = ?')
+            args.append(int(position_id))
+        if magic is not None:
+            conditions.append('magic = ?')
+            args.append(int(magic))
+        if cursor:
+            cursor_time, cursor_ticket = (int(part) for part in str(cursor).split(':'))
+            conditions.append(f'({time_column}, ticket) > (?, ?)')
+            args.extend((cursor_time, cursor_ticket))
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        limit = max(1, min(int(limit), 10000))
+        sql = f'SELECT * FROM {table} {where} ORDER BY {time_column}, ticket LIMIT ?'
+
+        with self._lock:
+            rows = self._conn.execute(sql, args + [limit + 1]).fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        items = [dict(row) for row in rows]
+        next_cursor = None
+        if has_more and rows:
+            last = rows[-1]
+            next_cursor = f"{last[time_column]}:{last['ticket']}"
+        return {'items': items, 'next_cursor': next_cursor}
+
+    def daily_pnl(self, date_from=None, date_to=None, symbol=None, utc_offset_hours=0):
+        """
+        按日汇总成交盈亏（profit + commission + swap + fee）
+
+        Args:
+            date_from: 开始时间（Unix秒，含）
+            date_to: 结束时间（Unix秒，不含）
+            symbol: MT5品种，为空则汇总所有品种
+            utc_offset_hours: 划分日期使用的时区偏移（小时）
+
+        Returns:
+            list: [{"date", "deals", "profit", "commission", "swap", "fee", "net"}]
+        """
+        conditions = []
+        args = [int(utc_offset_hours) * 3600]
+        if symbol:
+            conditions.append('symbol = ?')
+            args.append(symbol)
+        if date_from is not None:
+            conditions.append('time_msc >= ?')
+            args.append(int(float(date_from) * 1000))
+        if date_to is not None:
+            conditions.append('time_msc < ?')
+            args.append(int(float(date_to) * 1000))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        sql = f"""
+            SELECT date(time + ?, 'unixepoch') AS date, COUNT(*) AS deals,
+                   SUM(profit) AS profit, SUM(commission) AS commission,
+                   SUM(swap) AS swap, SUM(COALESCE(fee, 0)) AS fee,
+                   SUM(profit + commission + swap + COALESCE(fee, 0)) AS net
+            FROM deals {where}
+            GROUP BY 1 ORDER BY 1
+        """
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [dict(row) for row in rows]
+
+    def status(self):
+        """获取历史库状态"""
+        with self._lock:
+            deals = self._conn.execute('SELECT COUNT(*) FROM deals').fetchone()[0]
+            orders = self._conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+            deals_synced_to = self._get_state('deals_synced_to')
+        return {'deals': deals, 'orders': orders, 'synced_to': deals_synced_to, 'last_sync': self.last_sync}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import importlib
+import logging
+import sys
+import threading
+import time
+import types
+
+logger = logging.getLogger(__name__)
+
+# 已完成的延迟导入及耗时(毫秒)
+_import_times = {}
+_lock = threading.Lock()
+
+class LazyModule(types.ModuleType):
+    """
+    延迟导入的模块代理
+    第一次访问属性时才真正导入模块，用于推迟MetaTrader5/numpy等重量级依赖，
+    让服务器在导入它们之前就能开始监听端口
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__['_lazy_name'] = name
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self):
+        """导入真实模块（线程安全，只导入一次）"""
+        module = self.__dict__['_lazy_module']
+        if module is not None:
+            return module
+
+        with _lock:
+            module = self.__dict__['_lazy_module']
+            if module is None:
+                name = self.__dict__['_lazy_name']
+                start = time.perf_counter()
+                module = importlib.import_module(name)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                _import_times[name] = elapsed_ms
+                self.__dict__['_lazy_module'] = module
+                logger.info(f"延迟导入模块 {name} 耗时 {elapsed_ms:.1f}ms")
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    @property
+    def is_loaded(self):
+        """模块是否已经导入"""
+        return self.__dict__['_lazy_module'] is not None
+
+def lazy_module(name):
+    """
+    获取延迟导入的模块代理
+
+    Args:
+        name: 模块名
+
+    Returns:
+        模块已导入时直接返回模块，否则返回LazyModule代理
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+def preload(*modules):
+    """
+    立即导入延迟模块（eager启动模式使用）
+
+    Args:
+        modules: lazy_module返回的模块或代理
+    """
+    for module in modules:
+        if isinstance(module, LazyModule):
+            module._load()
+
+def get_import_times():
+    """获取已完成的延迟导入耗时"""
+    return dict(_import_times)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+
+# 交易记录专用logger，每笔订单输出一行JSON
+TRADE_LOGGER = 'trades'
+
+trade_logger = logging.getLogger(TRADE_LOGGER)
+
+# setup_logging创建的日志队列，其他进程转发来的记录直接放入（见forward_record）
+_log_queue = None
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    只把日志记录放入队列的QueueHandler
+    标准QueueHandler在调用线程中格式化消息，这里推迟到后台监听线程，
+    因此日志参数放入队列后不能再被修改（需要时传入副本）
+    """
+
+    def prepare(self, record):
+        # 异常堆栈必须在调用线程中展开
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class SymbolSampleFilter(logging.Filter):
+    """
+    按品种对DEBUG日志抽样
+    带有extra={'symbol': ...}的DEBUG日志，每个品种每sample_every条只输出1条
+    """
+
+    def __init__(self, sample_every=100):
+        super().__init__()
+        self.sample_every = max(1, int(sample_every))
+        self._counts = {}
+
+    def filter(self, record):
+        if record.levelno != logging.DEBUG or self.sample_every == 1:
+            return True
+        symbol = getattr(record, 'symbol', None)
+        if symbol is None:
+            return True
+        count = self._counts.get(symbol, 0)
+        self._counts[symbol] = count + 1
+        return count % self.sample_every == 0
+
+class TradeRecordFormatter(logging.Formatter):
+    """把交易记录（dict）格式化为一行JSON"""
+
+    def format(self, record):
+        data = {'ts': round(record.created, 6)}
+        if isinstance(record.msg, dict):
+            data.update(record.msg)
+        else:
+            data['message'] = record.getMessage()
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class ForwardHandler(logging.Handler):
+    """
+    把日志记录发送给另一个进程写入（分进程模式的交易进程，在日志线程中执行）
+    发送前把消息格式化为字符串、交易记录转换为JSON兼容的值，接收进程不需要还原参数对象
+    """
+
+    def __init__(self, send):
+        super().__init__()
+        self.send = send
+
+    def emit(self, record):
+        try:
+            if isinstance(record.msg, dict):
+                record.msg = json.loads(json.dumps(record.msg, ensure_ascii=False, default=str))
+            else:
+                record.msg = record.getMessage()
+            record.args = None
+            self.send(record)
+        except Exception:
+            self.handleError(record)
+
+class _ExcludeLogger(logging.Filter):
+    """排除指定logger的日志"""
+
+    def filter(self, record):
+        return not record.name.startswith(self.name)
+
+def record_trade(**fields):
+    """
+    写入一条交易记录（JSON格式化在后台线程完成）
+
+    Args:
+        fields: 交易记录字段，如action/symbol/volume/price/retcode
+    """
+    if trade_logger.isEnabledFor(logging.INFO):
+        trade_logger.info(fields)
+
+def forward_record(record):
+    """
+    把其他进程通过ForwardHandler发来的日志记录交给本进程的日志线程写入
+    记录已在发送进程中按级别过滤和抽样，不再经过本进程的logger
+
+    Args:
+        record: logging.LogRecord
+    """
+    if _log_queue is not None:
+        _log_queue.put(record)
+
+def setup_logging(config=None, forward=None):
+    """
+    配置异步日志：所有logger只把记录放入队列，由后台线程格式化并写入控制台/文件
+    forward不为空时（分进程模式的交易进程）不打开日志文件，记录由后台线程发送给服务进程写入，
+    避免两个进程同时追加同一个文件
+
+    配置项:
+        log_level: 日志级别，默认INFO
+        log_file: 日志文件，为空则只输出到控制台
+        log_debug_sample: 带品种的DEBUG日志抽样间隔，默认100
+        trade_log_file: 交易记录文件（JSONL），为空则不记录
+
+    Args:
+        config: 配置dict
+        forward: 发送日志记录的函数，接收进程调用forward_record写入
+
+    Returns:
+        QueueListener: 后台日志监听器（程序退出时自动停止）
+    """
+    global _log_queue
+    config = config or {}
+    level = getattr(logging, str(config.get('log_level', 'INFO')).upper(), logging.INFO)
+    trade_log_file = config.get('trade_log_file', 'trades.jsonl')
+    trade_logger.setLevel(logging.INFO if trade_log_file else logging.CRITICAL + 1)
+
+    if forward is not None:
+        handlers = [ForwardHandler(forward)]
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+        handlers = []
+        console = logging.StreamHandler()
+        handlers.append(console)
+        if config.get('log_file'):
+            handlers.append(logging.FileHandler(config['log_file'], encoding='utf-8'))
+
+        for handler in handlers:
+            handler.setFormatter(formatter)
+            handler.addFilter(_ExcludeLogger(TRADE_LOGGER))
+
+        if trade_log_file:
+            trade_handler = logging.FileHandler(trade_log_file, encoding='utf-8')
+            trade_handler.setFormatter(TradeRecordFormatter())
+            trade_handler.addFilter(logging.Filter(TRADE_LOGGER))
+            handlers.append(trade_handler)
+
+    log_queue = _log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    queue_handler = DeferredQueueHandler(log_queue)
+    # 抽样在入队前完成，被丢弃的DEBUG日志不进入队列
+    queue_handler.addFilter(SymbolSampleFilter(config.get('log_debug_sample', 100)))
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
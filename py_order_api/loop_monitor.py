@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# 应用代码所在目录，阻塞调用点取调用栈中最内层的应用代码
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_THIS_FILE = os.path.abspath(__file__)
+
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    'event_loop_lag_seconds', '事件循环调度延迟（秒）',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+LOOP_BLOCKED = REGISTRY.counter(
+    'event_loop_blocked_total', '事件循环被阻塞超过阈值的次数（按调用点）', ('site',)
+)
+
+class LoopLagMonitor:
+    """
+    事件循环延迟监控
+    - 事件循环中的心跳协程定期记录调度延迟
+    - 看门狗线程发现心跳超过阈值未更新时，读取事件循环线程的调用栈，
+      按最内层的应用代码调用点统计阻塞来源，并记录日志
+    """
+
+    def __init__(self, threshold_ms=100, interval_ms=50, max_sites=200):
+        """
+        初始化延迟监控
+
+        Args:
+            threshold_ms: 心跳超过该时间未更新即视为阻塞（毫秒）
+            interval_ms: 心跳和看门狗检查间隔（毫秒）
+            max_sites: 最多统计的调用点数量
+        """
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.max_sites = max_sites
+        self.sites = Counter()
+        self.stalls = 0
+        self.max_lag = 0.0
+        self._beat = time.perf_counter()
+        self._loop_thread = None
+        self._stop = threading.Event()
+        self._watchdog = None
+
+    async def run(self):
+        """心跳协程，在事件循环中运行"""
+        self._loop_thread = threading.get_ident()
+        self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._watchdog.start()
+        logger.info("事件循环延迟监控已启动: 阈值 %.0fms", self.threshold * 1000)
+
+        try:
+            while True:
+                started = time.perf_counter()
+                self._beat = started
+                await asyncio.sleep(self.interval)
+                lag = max(0.0, time.perf_counter() - started - self.interval)
+                LOOP_LAG_SECONDS.observe(lag)
+                if lag > self.max_lag:
+                    self.max_lag = lag
+        finally:
+            self._stop.set()
+
+    def _watch(self):
+        """看门狗线程：检测阻塞并抓取事件循环线程的调用栈"""
+        captured_beat = None
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            stalled = time.perf_counter() - beat
+            if stalled < self.threshold or beat == captured_beat:
+                continue
+
+            # 同一次阻塞只记录一次
+            captured_beat = beat
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            try:
+                self._record(frame, stalled)
+            except Exception as e:
+                logger.error("记录事件循环阻塞时出错: %s", e)
+            finally:
+                del frame
+
+    def _record(self, frame, stalled):
+        """统计阻塞调用点并记录调用栈"""
+        site = self.call_site(frame)
+        self.stalls += 1
+        if site in self.sites or len(self.sites) < self.max_sites:
+            self.sites[site] += 1
+            LOOP_BLOCKED.inc(site)
+        stack = ''.join(traceback.format_stack(frame))
+        logger.warning("事件循环已阻塞 %.0fms，调用点: %s\n%s", stalled * 1000, site, stack)
+
+    @staticmethod
+    def call_site(frame):
+        """
+        获取调用栈中最内层的应用代码位置
+
+        Args:
+            frame: 事件循环线程的当前栈帧
+
+        Returns:
+            str: 如 get_positions (websocket_server.py:512)
+        """
+        innermost = frame
+        while frame is not None:
+            filename = os.path.abspath(frame.f_code.co_filename)
+            if filename.startswith(APP_DIR) and filename != _THIS_FILE:
+                return f"{frame.f_code.co_name} ({os.path.basename(filename)}:{frame.f_lineno})"
+            frame = frame.f_back
+        code = innermost.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{innermost.f_lineno})"
+
+    def status(self, top=10):
+        """获取监控状态和最常见的阻塞调用点"""
+        return {
+            'threshold_ms': self.threshold * 1000,
+            'stalls': self.stalls,
+            'max_lag_ms': round(self.max_lag * 1000, 3),
+            'top_sites': [{'site': site, 'count': count} for site, count in self.sites.most_common(top)]
+        }
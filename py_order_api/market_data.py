@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import itertools
+import json
+import struct
+import zlib
+
+# 二进制帧前缀: stream_id(uint32) + seq(uint32)，小端
+FRAME_PREFIX = struct.Struct('<II')
+
+# 每个二进制块的默认大小（字节）
+DEFAULT_CHUNK_BYTES = 1024 * 1024
+
+# 分配给每次流式传输的编号，客户端按stream_id匹配二进制帧
+_stream_ids = itertools.count(1)
+
+class RecordBuffer:
+    """
+    结构化数组的dtype描述和记录字节
+    分进程模式下交易进程以这种形式返回K线/Tick，服务进程原样分块发送，不需要导入numpy
+    """
+
+    __slots__ = ('dtype', 'itemsize', 'data')
+
+    def __init__(self, dtype, itemsize, data):
+        self.dtype = dtype
+        self.itemsize = itemsize
+        self.data = data
+
+    @classmethod
+    def from_array(cls, array):
+        """从numpy结构化数组创建（复制一次记录字节）"""
+        return cls([list(field) for field in array.dtype.descr], array.dtype.itemsize, array.tobytes())
+
+    def __len__(self):
+        return len(self.data) // self.itemsize
+
+def _records(array):
+    """
+    取得数组的描述和记录内存，numpy数组不复制数据
+
+    Args:
+        array: numpy结构化数组（copy_rates_range/copy_ticks_range的返回值）或RecordBuffer
+
+    Returns:
+        tuple: (dtype描述, 记录大小, 记录数, 记录字节的memoryview)
+    """
+    if isinstance(array, RecordBuffer):
+        return array.dtype, array.itemsize, len(array), memoryview(array.data)
+    if not array.flags['C_CONTIGUOUS']:
+        array = array.copy()
+    return ([list(field) for field in array.dtype.descr], array.dtype.itemsize, int(len(array)),
+            memoryview(array.view('u1')))
+
+def array_chunks(buffer, itemsize, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    按大小切分记录内存，不复制数据
+
+    Args:
+        buffer: 记录字节的memoryview
+        itemsize: 每条记录的字节数
+        chunk_bytes: 每块的最大字节数（按整条记录对齐）
+
+    Yields:
+        memoryview: 每块的字节视图
+    """
+    step = max(1, chunk_bytes // itemsize) * itemsize
+    for start in range(0, buffer.nbytes, step):
+        yield buffer[start:start + step]
+
+async def stream_array(websocket, request_id, kind, array, meta=None, chunk_bytes=DEFAULT_CHUNK_BYTES,
+                       compress=False):
+    """
+    以二进制帧流式发送结构化数组
+
+    协议:
+        1. 文本消息 {"id", "event": "market_data_header", "stream_id", "kind", "dtype", "itemsize",
+           "count", "chunks", "compression", ...meta}
+        2. chunks个二进制消息，每个为 FRAME_PREFIX(stream_id, seq) + 记录字节（compression为zlib时为压缩后的字节）
+        调用方随后发送普通的JSON响应表示结束
+
+    Args:
+        websocket: WebSocket连接
+        request_id: 请求ID
+        kind: 数据类型，如rates/ticks
+        array: numpy结构化数组或RecordBuffer
+        meta: 附加到头消息的字段（如symbol/timeframe）
+        chunk_bytes: 每块的最大字节数
+        compress: 是否使用zlib压缩每块
+
+    Returns:
+        dict: stream_id、块数、原始字节数和发送字节数
+    """
+    dtype, itemsize, count, buffer = _records(array)
+
+    stream_id = next(_stream_ids)
+    chunks = list(array_chunks(buffer, itemsize, chunk_bytes)) if count else []
+    header = {
+        'id': request_id,
+        'event': 'market_data_header',
+        'stream_id': stream_id,
+        'kind': kind,
+        'chunks': len(chunks),
+        'compression': 'zlib' if compress else None
+    }
+    header.update({'dtype': dtype, 'itemsize': itemsize, 'count': count})
+    header.update(meta or {})
+    await websocket.send(json.dumps(header, ensure_ascii=False))
+
+    loop = asyncio.get_running_loop()
+    sent_bytes = 0
+    for seq, chunk in enumerate(chunks):
+        prefix = FRAME_PREFIX.pack(stream_id, seq)
+        if compress:
+            # 压缩在线程池中进行，不阻塞事件循环
+            payload = await loop.run_in_executor(None, zlib.compress, chunk, 1)
+            await websocket.send(prefix + payload)
+            sent_bytes += len(payload)
+        else:
+            # 前缀和记录内存作为同一消息的两个分片发送，记录不复制
+            await websocket.send([prefix, chunk])
+            sent_bytes += chunk.nbytes
+
+    return {
+        'stream_id': stream_id,
+        'chunks': len(chunks),
+        'count': count,
+        'raw_bytes': buffer.nbytes,
+        'sent_bytes': sent_bytes
+    }
+
+def decode_stream(header, frames):
+    """
+    客户端使用：把头消息和二进制帧还原为numpy结构化数组
+
+    Args:
+        header: market_data_header消息（dict）
+        frames: 收到的二进制消息列表（任意顺序）
+
+    Returns:
+        numpy.ndarray: 结构化数组
+    """
+    import numpy as np
+
+    dtype = np.dtype([tuple(field) for field in header['dtype']])
+    parts = {}
+    for frame in frames:
+        stream_id, seq = FRAME_PREFIX.unpack_from(frame)
+        if stream_id != header['stream_id']:
+            continue
+        payload = bytes(frame[FRAME_PREFIX.size:])
+        if header.get('compression') == 'zlib':
+            payload = zlib.decompress(payload)
+        parts[seq] = payload
+    data = b''.join(parts[seq] for seq in sorted(parts))
+    return np.frombuffer(data, dtype=dtype)
@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import types
+from bisect import bisect_left
+
+# 延迟直方图的默认分桶（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    """生成Prometheus标签文本，如 {action="open_position"}"""
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    text = ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + text + '}'
+
+def _format_value(value):
+    """Prometheus数值格式"""
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Metric:
+    """指标基类，按标签值元组保存各序列的数据"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labelvalues):
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f'{self.name} 需要标签 {self.labelnames}，实际为 {labelvalues}')
+        return labelvalues
+
+    def samples(self):
+        """返回 [(指标名, 标签文本, 值)]"""
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, _format_labels(self.labelnames, key), value) for key, value in items]
+
+    def snapshot(self):
+        """返回用于get_metrics的dict"""
+        with self._lock:
+            items = list(self._values.items())
+        if not self.labelnames:
+            return items[0][1] if items else 0
+        return {'|'.join(str(v) for v in key): value for key, value in items}
+
+class Counter(Metric):
+    """只增不减的计数器"""
+
+    kind = 'counter'
+
+    def inc(self, *labelvalues, amount=1):
+        """
+        计数器加amount
+
+        Args:
+            labelvalues: 按labelnames顺序的标签值
+            amount: 增加量
+        """
+        key = self._key(labelvalues)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """可增可减的当前值，也可以在采集时通过回调函数读取"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, *labelvalues):
+        key = self._key(labelvalues)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, *labelvalues, amount=1):
+        key = self._key(labelvalues)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set_function(self, function):
+        """
+        设置采集时调用的回调函数（只用于无标签的指标）
+
+        Args:
+            function: 返回当前值的函数
+        """
+        self.function = function
+
+    def _collect(self):
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                value = float('nan')
+            with self._lock:
+                self._values[()] = value
+
+    def samples(self):
+        self._collect()
+        return super().samples()
+
+    def snapshot(self):
+        self._collect()
+        return super().snapshot()
+
+class Histogram(Metric):
+    """延迟直方图：累计分桶计数、总和和次数"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labelvalues):
+        """
+        记录一次观测值
+
+        Args:
+            value: 观测值（延迟使用秒）
+            labelvalues: 按labelnames顺序的标签值
+        """
+        key = self._key(labelvalues)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # [各分桶计数..., +Inf计数, 总和]
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *labelvalues):
+        """计时上下文管理器"""
+        return _Timer(self, labelvalues)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._values.items()]
+        result = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(float(bound))))
+                result.append((self.name + '_bucket', labels, cumulative))
+            labels = _format_labels(self.labelnames, key)
+            result.append((self.name + '_sum', labels, series[-1]))
+            result.append((self.name + '_count', labels, cumulative))
+        return result
+
+    def snapshot(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._values.items()]
+        result = {}
+        for key, series in items:
+            count = sum(series[:-1])
+            result['|'.join(str(v) for v in key) or 'all'] = {
+                'count': count,
+                'sum': round(series[-1], 6),
+                'avg_ms': round(series[-1] / count * 1000, 3) if count else None,
+                'p50_ms': self._quantile_ms(series, count, 0.5),
+                'p99_ms': self._quantile_ms(series, count, 0.99)
+            }
+        return result
+
+    def _quantile_ms(self, series, count, q):
+        """按分桶上界估算分位数（毫秒）"""
+        if not count:
+            return None
+        rank = q * count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, series):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return bound * 1000
+        return None
+
+class _Timer:
+    """Histogram.time()使用的计时器"""
+
+    __slots__ = ('histogram', 'labelvalues', 'started')
+
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labelvalues)
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f'指标 {name} 已注册为 {metric.kind}')
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """获取或创建计数器"""
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        """获取或创建Gauge"""
+        return self._register(Gauge, name, documentation, labelnames, function=function)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """获取或创建直方图"""
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def snapshot(self):
+        """
+        获取所有指标的当前值
+
+        Returns:
+            dict: {指标名: 值}，有标签的指标按"标签值|标签值"分组
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def render_prometheus(self):
+        """
+        生成Prometheus文本格式
+
+        Returns:
+            str: 指标文本
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+# 默认注册表
+REGISTRY = MetricsRegistry()
+
+# 券商接口调用（mt5.*、Bybit HTTP）的通用指标
+BROKER_CALL_SECONDS = REGISTRY.histogram(
+    'broker_call_seconds', '券商接口调用耗时（秒）', ('api', 'call')
+)
+BROKER_CALL_ERRORS = REGISTRY.counter(
+    'broker_call_errors_total', '券商接口调用抛出异常的次数', ('api', 'call')
+)
+ORDER_RETCODES = REGISTRY.counter(
+    'order_retcodes_total', '下单返回码计数', ('api', 'retcode')
+)
+
+class TimedCalls:
+    """
+    为模块或客户端对象的方法调用计时的代理
+    方法第一次访问时生成计时包装并缓存；模块的常量也会缓存，之后直接读取实例属性
+    """
+
+    def __init__(self, target, api, histogram=BROKER_CALL_SECONDS, errors=BROKER_CALL_ERRORS):
+        """
+        初始化计时代理（不会访问target的任何属性，延迟导入的模块不会被提前导入）
+
+        Args:
+            target: 被代理的模块或对象
+            api: 指标中的api标签，如mt5/bybit
+            histogram: 记录耗时的直方图，标签为(api, call)
+            errors: 记录异常次数的计数器，标签为(api, call)
+        """
+        self._target = target
+        self._api = api
+        self._histogram = histogram
+        self._errors = errors
+        self._cache_constants = isinstance(target, types.ModuleType)
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if callable(value) and not isinstance(value, type):
+            value = self._wrap(name, value)
+        elif not self._cache_constants:
+            return value
+        setattr(self, name, value)
+        return value
+
+    def _wrap(self, name, function):
+        histogram = self._histogram
+        errors = self._errors
+        api = self._api
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                errors.inc(api, name)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started, api, name)
+
+        timed.__name__ = name
+        timed.__wrapped__ = function
+        return timed
@@ -1,16 +1,59 @@
-import MetaTrader5 as mt5
+import importlib
 import logging
+import random
+import sys
 import time
-from datetime import datetime
-from typing import Union, Dict, List, Any, Optional
+from typing import Union, Dict, List, Any, Optional, Tuple
+from lazy_import import lazy_module
+from spec_cache import SymbolSpecCache
+from order_normalizer import normalize_volume, normalize_price, tp_for_profit, ROUND_DOWN
+from log_setup import record_trade
+from metrics import TimedCalls, ORDER_RETCODES
+from records import Position, AccountSnapshot, OrderResult
+from order_scheduler import OrderRejected
+
+# MetaTrader5（及其依赖的numpy）导入较慢，推迟到第一次调用时再导入
+mt5_module = lazy_module('MetaTrader5')
+
+# 每次mt5.*调用的耗时计入broker_call_seconds指标
+mt5 = TimedCalls(mt5_module, 'mt5')
+
+# 可选的MT5后端: mt5为真实终端，fake为模拟后端（回放和基准测试使用）
+MT5_BACKENDS = {'mt5': 'MetaTrader5', 'fake': 'fake_mt5'}
+
+# get_positions默认返回的持仓字段
+POSITION_FIELDS = (
+    "ticket", "time", "type", "volume", "symbol", "price_open", "price_current",
+    "sl", "tp", "profit", "swap", "comment"
+)
+
+# 可以用最新价格重试的返回码: 重新报价 / 价格已变化 / 无报价
+RETRY_RETCODES = (10004, 10020, 10021)
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+def select_backend(backend):
+    """
+    选择MT5后端，必须在第一次调用mt5之前执行
+
+    Args:
+        backend: MT5_BACKENDS中的名称
+    """
+    if backend not in MT5_BACKENDS:
+        raise ValueError(f'未知的MT5后端: {backend}')
+    if backend != 'mt5':
+        # 延迟导入的MetaTrader5代理在第一次使用时从sys.modules取到模拟模块
+        sys.modules['MetaTrader5'] = importlib.import_module(MT5_BACKENDS[backend])
+        logger.warning("使用模拟的MT5后端: %s", MT5_BACKENDS[backend])
+
 class MT5Trader:
     """MetaTrader 5交易类，封装MT5交易相关功能"""
     
-    def __init__(self, mt5_path: str = "", server: str = "", login: int = 0, password: str = ""):
+    def __init__(self, mt5_path: str = "", server: str = "", login: int = 0, password: str = "",
+                 spec_cache: Optional[SymbolSpecCache] = None, volume_rounding: str = ROUND_DOWN,
+                 volume_clamp: bool = True, retry_max_attempts: int = 3, retry_budget_ms: float = 1500,
+                 retry_backoff_ms: float = 20, retry_jitter: float = 0.5, tick_max_age_ms: float = 200):
         """
         初始化MT5交易类
         
@@ -19,11 +62,29 @@ class MT5Trader:
             server: 交易服务器名称
             login: 账号
             password: 密码
+            spec_cache: 品种规格缓存，为空则不缓存
+            volume_rounding: 交易量对齐步长的取整方式，down/up/nearest
+            volume_clamp: 交易量超出最小/最大值时是否自动调整，否则拒绝下单
+            retry_max_attempts: 重新报价/价格变化时的最大发送次数（含第一次）
+            retry_budget_ms: 重试的总时间预算（毫秒），超出后不再重试
+            retry_backoff_ms: 重试退避基础间隔（毫秒），每次翻倍
+            retry_jitter: 退避间隔的随机抖动比例
+            tick_max_age_ms: 缓存报价的最大有效期（毫秒），首次发送时在有效期内直接使用缓存
         """
         self.mt5_path = mt5_path
         self.server = server
         self.login = login
         self.password = password
+        self.spec_cache = spec_cache
+        self.volume_rounding = volume_rounding
+        self.volume_clamp = volume_clamp
+        self.retry_max_attempts = max(1, retry_max_attempts)
+        self.retry_budget_ms = retry_budget_ms
+        self.retry_backoff_ms = retry_backoff_ms
+        self.retry_jitter = retry_jitter
+        self.tick_max_age_ms = tick_max_age_ms
+        # 报价缓存: symbol -> (获取时间, tick)
+        self._ticks = {}
         self.initialized = False
     
     def initialize(self) -> bool:
@@ -127,126 +188,78 @@ class MT5Trader:
         """
         return self.initialized and mt5.terminal_info() is not None
     
-    def get_account_info(self) -> Dict[str, Any]:
+    def warm_symbols(self, symbols: List[str]) -> Dict[str, bool]:
         """
-        获取账户信息
+        预热交易品种：添加到行情窗口并预取品种规格，避免首单时再做这些调用
         
+        Args:
+            symbols: MT5交易品种列表
+            
         Returns:
-            Dict: 账户信息字典
+            Dict[str, bool]: 每个品种是否预热成功
         """
-        if not self.is_connected():
-            logger.error("MT5未连接")
-            return {}
+        results = {}
+        for symbol in symbols:
+            if not mt5.symbol_select(symbol, True):
+                logger.warning(f"预热品种失败，无法添加到行情窗口: {symbol}, 错误码: {mt5.last_error()}")
+                results[symbol] = False
+                continue
+            
+            symbol_info = mt5.symbol_info(symbol)
+            if symbol_info is None:
+                logger.warning(f"预热品种失败，无法获取品种信息: {symbol}")
+                results[symbol] = False
+                continue
+            
+            if self.spec_cache is not None:
+                self.spec_cache.update_from_info(symbol, symbol_info)
+            results[symbol] = True
         
-        account_info = mt5.account_info()
-        if not account_info:
-            logger.error(f"获取账户信息失败，错误码: {mt5.last_error()}")
-            return {}
-        
-        # 转换为字典
-        return {
-            "login": account_info.login,
-            "server": account_info.server,
-            "currency": account_info.currency,
-            "leverage": account_info.leverage,
-            "balance": account_info.balance,
-            "equity": account_info.equity,
-            "margin": account_info.margin,
-            "margin_free": account_info.margin_free,
-            "margin_level": account_info.margin_level,
-            "margin_so_mode": account_info.margin_so_mode,
-            "margin_so_call": account_info.margin_so_call,
-            "margin_so_so": account_info.margin_so_so,
-            "margin_initial": account_info.margin_initial,
-            "margin_maintenance": account_info.margin_maintenance,
-            "assets": account_info.assets,
-            "liabilities": account_info.liabilities,
-            "commission_blocked": account_info.commission_blocked,
-            "name": account_info.name,
-            "trade_mode": account_info.trade_mode,
-            "limit_orders": account_info.limit_orders
-        }
+        if self.spec_cache is not None:
+            self.spec_cache.save()
+        
+        logger.info(f"品种预热完成: 成功 {sum(results.values())}/{len(results)}")
+        return results
     
-    def calculate_tp_by_profit_amount(self, symbol: str, order_type: str, volume: float, 
-                                     entry_price: float, profit_amount: float) -> float:
+    def get_tick(self, symbol: str, max_age_ms: float = 0):
         """
-        根据盈利金额计算止盈价格
+        获取最新报价，缓存未过期时直接使用缓存
         
         Args:
             symbol: 交易品种
-            order_type: 订单类型，"BUY"或"SELL"
-            volume: 交易量
-            entry_price: 开仓价格
-            profit_amount: 目标盈利金额
+            max_age_ms: 缓存最大有效期（毫秒），0表示强制从终端获取
             
         Returns:
-            float: 止盈价格，如果计算失败返回0
+            Tick: 报价对象，获取失败返回None
         """
-        try:
-            # 获取交易品种信息
-            symbol_info = mt5.symbol_info(symbol)
-            if symbol_info is None:
-                logger.error(f"无法获取交易品种信息: {symbol}")
-                return 0.0
-            
-            # 获取当前价格信息
-            tick_info = mt5.symbol_info_tick(symbol)
-            if tick_info is None:
-                logger.error(f"无法获取价格信息: {symbol}")
-                return 0.0
-            
-            # 计算每点价值
-            tick_value = symbol_info.trade_tick_value
-            tick_size = symbol_info.trade_tick_size
-            
-            if tick_value == 0 or tick_size == 0:
-                logger.error(f"无法获取有效的点值信息: tick_value={tick_value}, tick_size={tick_size}")
-                return 0.0
-            
-            # 简化计算: 每个tick的实际价值
-            value_per_tick = tick_value * volume
-            
-            # 需要的tick数量
-            ticks_needed = profit_amount / value_per_tick
-            
-            # 计算止盈价格
-            if order_type.upper() == "BUY":
-                # 买入时，止盈价格 = 开仓价格 + (tick数量 * tick大小)
-                tp_price = entry_price + (ticks_needed * tick_size)
-            else:  # SELL
-                # 卖出时，止盈价格 = 开仓价格 - (tick数量 * tick大小)
-                tp_price = entry_price - (ticks_needed * tick_size)
-            
-            # 检查止盈价格是否符合最小距离要求
-            stops_level = symbol_info.trade_stops_level
-            min_distance = stops_level * symbol_info.point
-            
-            if order_type.upper() == "BUY":
-                # 买入止盈必须高于当前价格至少 min_distance
-                min_tp_price = entry_price + min_distance
-                if tp_price < min_tp_price:
-                    logger.warning(f"计算的止盈价格 {tp_price:.5f} 太接近开仓价格，调整为最小允许距离 {min_tp_price:.5f}")
-                    tp_price = min_tp_price
-            else:  # SELL
-                # 卖出止盈必须低于当前价格至少 min_distance
-                max_tp_price = entry_price - min_distance
-                if tp_price > max_tp_price:
-                    logger.warning(f"计算的止盈价格 {tp_price:.5f} 太接近开仓价格，调整为最小允许距离 {max_tp_price:.5f}")
-                    tp_price = max_tp_price
-            
-            # 四舍五入到合适的小数位数
-            tp_price = round(tp_price, symbol_info.digits)
-            
-            logger.info(f"盈利金额计算: 品种={symbol}, 类型={order_type}, 开仓价={entry_price:.5f}, "
-                       f"目标盈利=${profit_amount:.2f}, 止盈价={tp_price:.5f}, "
-                       f"最小距离={min_distance:.5f} (stops_level={stops_level})")
-            
-            return tp_price
-            
-        except Exception as e:
-            logger.error(f"计算止盈价格时出错: {e}")
-            return 0.0
-
+        if max_age_ms > 0:
+            cached = self._ticks.get(symbol)
+            if cached and (time.perf_counter() - cached[0]) * 1000 <= max_age_ms:
+                return cached[1]
+        
+        tick = mt5.symbol_info_tick(symbol)
+        if tick is not None:
+            self._ticks[symbol] = (time.perf_counter(), tick)
+        return tick
+    
+    def get_account_info(self) -> Optional[AccountSnapshot]:
+        """
+        获取账户信息
+        
+        Returns:
+            AccountSnapshot: 账户信息，失败返回None
+        """
+        if not self.is_connected():
+            logger.error("MT5未连接")
+            return None
+        
+        account_info = mt5.account_info()
+        if not account_info:
+            logger.error(f"获取账户信息失败，错误码: {mt5.last_error()}")
+            return None
+        
+        return AccountSnapshot.from_mt5(account_info)
+    
     def get_supported_filling_mode(self, symbol: str) -> int:
         """
         获取交易品种支持的订单填充模式
@@ -257,13 +270,18 @@ class MT5Trader:
         Returns:
             int: 支持的填充模式
         """
-        symbol_info = mt5.symbol_info(symbol)
-        if symbol_info is None:
-            logger.warning(f"无法获取品种 {symbol} 信息，使用默认填充模式")
-            return mt5.ORDER_FILLING_IOC
-        
-        # 检查支持的填充模式
-        filling_mode = symbol_info.filling_mode
+        # 优先使用预热时缓存的品种规格，省去一次symbol_info调用
+        spec = self.spec_cache.get(symbol) if self.spec_cache is not None else None
+        if spec and spec.filling_mode is not None:
+            filling_mode = spec.filling_mode
+        else:
+            symbol_info = mt5.symbol_info(symbol)
+            if symbol_info is None:
+                logger.warning(f"无法获取品种 {symbol} 信息，使用默认填充模式")
+                return mt5.ORDER_FILLING_IOC
+            
+            # 检查支持的填充模式
+            filling_mode = symbol_info.filling_mode
         
         # 按优先级检查支持的填充模式
         # 注意：这里需要检查symbol_info.filling_mode的位标志
@@ -278,10 +296,41 @@ class MT5Trader:
             logger.debug(f"品种 {symbol} 使用默认 RETURN 填充模式")
             return mt5.ORDER_FILLING_RETURN
 
+    def _load_symbol_spec(self, symbol: str):
+        """
+        从终端查询品种信息并更新品种规格缓存，品种在行情中不可见时添加到行情窗口
+
+        Raises:
+            OrderRejected: 品种不存在或无法添加到行情窗口
+        """
+        symbol_info = mt5.symbol_info(symbol)
+        if symbol_info is None:
+            logger.error("交易品种 %s 不存在", symbol)
+            raise OrderRejected(f'交易品种不存在: {symbol}', 'unknown_symbol')
+        
+        # 品种详细信息（调试用，按品种抽样输出）
+        logger.debug("交易品种信息: %s 最小交易量=%s 最大交易量=%s 交易量步长=%s 小数位数=%s 点大小=%s "
+                     "止损止盈级别=%s Tick价值=%s Tick大小=%s",
+                     symbol, symbol_info.volume_min, symbol_info.volume_max, symbol_info.volume_step,
+                     symbol_info.digits, symbol_info.point, symbol_info.trade_stops_level,
+                     symbol_info.trade_tick_value, symbol_info.trade_tick_size, extra={'symbol': symbol})
+        
+        # 如果该品种在行情中不可见，则添加
+        if not symbol_info.visible:
+            logger.info("添加交易品种 %s 到行情窗口", symbol)
+            if not mt5.symbol_select(symbol, True):
+                logger.error("添加交易品种 %s 失败", symbol)
+                raise OrderRejected(f'无法添加交易品种到行情窗口: {symbol}', 'symbol_unavailable')
+        
+        if self.spec_cache is not None:
+            return self.spec_cache.update_from_info(symbol, symbol_info)
+        return SymbolSpecCache.spec_from_info(symbol_info)
+
     def open_position(self, symbol: str, order_type: str, volume: float,
                      price: float = 0.0, sl: float = 0.0, tp: float = 0.0,
                      profit_amount: float = 0.0, deviation: int = 20, 
-                     comment: str = "") -> Optional[mt5.OrderSendResult]:
+                     comment: str = "", attempts: Optional[List[Dict[str, Any]]] = None,
+                     normalized: bool = False) -> Optional[OrderResult]:
         """
         开仓函数
         
@@ -295,66 +344,68 @@ class MT5Trader:
             profit_amount: 目标盈利金额（美元），0表示不设置，优先级高于tp
             deviation: 允许的最大价格偏差（点数）
             comment: 订单注释
+            attempts: 传入列表时，每次发送的价格、返回码和耗时会追加到该列表中
+            normalized: 调用方已按同一品种规格和规则规范化交易量时为True，不再重复规范化
             
         Returns:
-            OrderSendResult: 订单发送结果对象
-        """
-        # 获取交易品种信息
-        symbol_info = mt5.symbol_info(symbol)
-        if symbol_info is None:
-            logger.error(f"交易品种 {symbol} 不存在")
-            return None
-        
-        # 打印品种详细信息（用于调试）
-        logger.info(f"交易品种信息: {symbol}")
-        logger.info(f"  - 最小交易量: {symbol_info.volume_min}")
-        logger.info(f"  - 最大交易量: {symbol_info.volume_max}")
-        logger.info(f"  - 交易量步长: {symbol_info.volume_step}")
-        logger.info(f"  - 小数位数: {symbol_info.digits}")
-        logger.info(f"  - 点大小: {symbol_info.point}")
-        logger.info(f"  - 止损止盈级别: {symbol_info.trade_stops_level}")
-        logger.info(f"  - Tick价值: {symbol_info.trade_tick_value}")
-        logger.info(f"  - Tick大小: {symbol_info.trade_tick_size}")
-        
-        # 如果该品种在行情中不可见，则添加
-        if not symbol_info.visible:
-            logger.info(f"添加交易品种 {symbol} 到行情窗口")
-            if not mt5.symbol_select(symbol, True):
-                logger.error(f"添加交易品种 {symbol} 失败")
-                return None
-
-        if volume<0:
-            volume=volume*-1
+            OrderResult: 订单发送结果，未能发送到终端返回None
 
+        Raises:
+            OrderRejected: 品种不存在、交易量无效或订单类型未知，订单未发送
+        """
+        # 优先使用预热时缓存的品种规格，只有未缓存时才向终端查询品种信息
+        spec = self.spec_cache.get(symbol) if self.spec_cache is not None else None
+        spec_cached = spec is not None
+        if not spec_cached:
+            spec = self._load_symbol_spec(symbol)
 
+        # 按品种规格规范化交易量，避免终端因无效交易量拒单
+        if not normalized:
+            normalized_volume, reason = normalize_volume(volume, spec, self.volume_rounding, self.volume_clamp)
+            if normalized_volume is None:
+                logger.error("交易量无效，不发送订单: %s", reason)
+                raise OrderRejected(f'交易量无效: {reason}', 'invalid_volume')
+            if normalized_volume != volume:
+                logger.info("交易量已规范化: %s -> %s", volume, normalized_volume)
+            volume = normalized_volume
         
         # 确定订单类型
         if order_type == "BUY":
             order_direction = mt5.ORDER_TYPE_BUY
-            current_price = mt5.symbol_info_tick(symbol).ask
         elif order_type == "SELL":
             order_direction = mt5.ORDER_TYPE_SELL
-            current_price = mt5.symbol_info_tick(symbol).bid
         else:
-            logger.error(f"未知订单类型: {order_type}")
+            logger.error("未知订单类型: %s", order_type)
+            raise OrderRejected(f'未知订单类型: {order_type}', 'invalid_order_type')
+        
+        tick = self.get_tick(symbol, self.tick_max_age_ms)
+        if tick is None and spec_cached:
+            # 品种可能已从行情窗口中移除，重新查询并添加后再取报价
+            spec = self._load_symbol_spec(symbol)
+            tick = self.get_tick(symbol)
+        if tick is None:
+            logger.error("无法获取价格信息: %s", symbol)
             return None
+        current_price = tick.ask if order_type == "BUY" else tick.bid
         
         # 如果价格为0，则使用当前市场价格
         if price == 0:
             price = current_price
         
-        # 如果指定了盈利金额，则计算止盈价格
+        # 如果指定了盈利金额，则按品种规格计算止盈价格（不访问终端）
         if profit_amount > 0:
-            calculated_tp = self.calculate_tp_by_profit_amount(
-                symbol, order_type, volume, price, profit_amount
-            )
+            calculated_tp = tp_for_profit(spec, order_type, volume, price, profit_amount)
             if calculated_tp > 0:
                 tp = calculated_tp
-                logger.info(f"基于盈利金额 ${profit_amount:.2f} 计算的止盈价格: {tp:.5f}")
+                logger.info("基于盈利金额 $%.2f 计算的止盈价格: %.5f", profit_amount, tp)
             else:
                 logger.warning("无法计算止盈价格，将不设置止盈")
                 tp = 0.0
         
+        # 止损止盈价格对齐到最小价格变动
+        sl = normalize_price(sl, spec) if sl > 0 else 0.0
+        tp = normalize_price(tp, spec) if tp > 0 else 0.0
+        
         # 获取支持的填充模式
         filling_type = self.get_supported_filling_mode(symbol)
         
@@ -374,27 +425,146 @@ class MT5Trader:
             "type_filling": filling_type,  # 使用智能检测的填充模式
         }
         
-        # 发送订单
-        logger.info(f"正在发送订单: {request}")
-        result = mt5.order_send(request)
+        # 发送订单，遇到重新报价/价格变化时在时间预算内用最新价格重发
+        if attempts is None:
+            attempts = []
+        started = time.perf_counter()
+        for attempt in range(1, self.retry_max_attempts + 1):
+            if attempt > 1:
+                # 重试时强制获取最新报价，止盈按价格变化平移以保持相同的盈利距离
+                tick = self.get_tick(symbol)
+                if tick is None:
+                    logger.error("重试时无法获取价格信息: %s", symbol)
+                    break
+                new_price = tick.ask if order_type == "BUY" else tick.bid
+                if request["tp"] > 0 and profit_amount > 0:
+                    request["tp"] = normalize_price(request["tp"] + new_price - request["price"], spec)
+                request["price"] = float(new_price)
+            
+            # 请求在重试时会被修改，日志在后台线程格式化，因此传入副本
+            logger.debug("正在发送订单(第%d次): %s", attempt, dict(request), extra={'symbol': symbol})
+            sent_at = time.perf_counter()
+            result = mt5.order_send(request)
+            finished_at = time.perf_counter()
+            ORDER_RETCODES.inc('mt5', result.retcode if result is not None else 'none')
+            
+            attempts.append({
+                'attempt': attempt,
+                'price': request["price"],
+                'retcode': result.retcode if result is not None else None,
+                'comment': result.comment if result is not None else str(mt5.last_error()),
+                'elapsed_ms': round((finished_at - sent_at) * 1000, 3)
+            })
+            
+            if result is None or result.retcode not in RETRY_RETCODES:
+                break
+            
+            backoff_ms = self.retry_backoff_ms * (2 ** (attempt - 1))
+            backoff_ms *= random.uniform(1 - self.retry_jitter, 1 + self.retry_jitter)
+            elapsed_ms = (finished_at - started) * 1000
+            if attempt >= self.retry_max_attempts or elapsed_ms + backoff_ms > self.retry_budget_ms:
+                logger.warning("重新报价重试已达上限: 第%d次, 已用时 %.1fms", attempt, elapsed_ms)
+                break
+            
+            logger.warning("订单被重新报价(错误码: %s)，%.1fms后使用最新价格重试", result.retcode, backoff_ms)
+            time.sleep(backoff_ms / 1000)
+        
+        record_trade(
+            action='open', symbol=symbol, type=order_type, volume=volume,
+            price=result.price if result is not None and result.price else request["price"],
+            sl=request["sl"], tp=request["tp"],
+            retcode=result.retcode if result is not None else None,
+            order=result.order if result is not None else None,
+            attempts=len(attempts), elapsed_ms=round((time.perf_counter() - started) * 1000, 3),
+            comment=comment
+        )
         
         if result is None:
             error_code = mt5.last_error()
-            logger.error(f"订单发送失败，返回None，错误码: {error_code}")
+            logger.error("订单发送失败，返回None，错误码: %s", error_code)
             return None
         elif result.retcode != mt5.TRADE_RETCODE_DONE:
-            logger.error(f"订单发送失败，错误码: {result.retcode}, 说明: {result.comment}")
+            logger.error("订单发送失败，错误码: %s, 说明: %s", result.retcode, result.comment)
         else:
-            logger.info(f"订单发送成功，订单号: {result.order}")
+            logger.info("订单发送成功: %s %s %s 订单号=%s 价格=%s", symbol, order_type, volume, result.order, result.price)
+        
+        return OrderResult.from_mt5(result, order_type)
+    
+    def attach_stops(self, order: int, symbol: str, sl: float = 0.0, tp: float = 0.0, profit_amount: float = 0.0
+                     ) -> Tuple[Optional[OrderResult], Optional[int], float, float]:
+        """
+        为开仓订单所在的持仓设置止损止盈（TRADE_ACTION_SLTP）
+        持仓按订单的成交记录（position_id）查找：净额账户中加仓订单的票据不是持仓票据，
+        止盈按整个持仓的开仓均价和持仓量计算
+        
+        Args:
+            order: 开仓订单号
+            symbol: 交易品种
+            sl: 止损价格，0表示不设置
+            tp: 止盈价格，0表示不设置
+            profit_amount: 目标盈利金额，大于0时按持仓均价计算止盈，优先级高于tp
+            
+        Returns:
+            tuple: (修改结果，未找到成交或未能发送到终端为None, 持仓票据, 止损价, 止盈价)
+            
+        Raises:
+            OrderRejected: 订单所在的持仓已经不存在（reason为position_closed）或品种不可用
+        """
+        deals = mt5.history_deals_get(ticket=order)
+        if not deals:
+            logger.warning("未找到订单 %s 的成交记录", order)
+            return None, None, sl, tp
+        ticket = deals[-1].position_id
+        positions = mt5.positions_get(ticket=ticket)
+        if not positions:
+            raise OrderRejected(f'订单 {order} 所在的持仓 {ticket} 已不存在', 'position_closed')
+        position = positions[0]
+        
+        spec = self.spec_cache.get(symbol) if self.spec_cache is not None else None
+        if spec is None:
+            spec = self._load_symbol_spec(symbol)
+        
+        if profit_amount > 0:
+            position_type = "BUY" if position.type == mt5.POSITION_TYPE_BUY else "SELL"
+            tp = tp_for_profit(spec, position_type, position.volume, position.price_open, profit_amount)
+            logger.info("按持仓均价计算止盈: 品种=%s, 持仓=%s, 均价=%s, 持仓量=%s, 目标盈利=$%.2f, 止盈价=%s",
+                        symbol, ticket, position.price_open, position.volume, profit_amount, tp)
+        sl = normalize_price(sl, spec) if sl > 0 else 0.0
+        tp = normalize_price(tp, spec) if tp > 0 else 0.0
+        
+        request = {
+            "action": mt5.TRADE_ACTION_SLTP,
+            "symbol": symbol,
+            "position": ticket,
+            "sl": float(sl),
+            "tp": float(tp),
+            "magic": 123456,
+        }
+        started = time.perf_counter()
+        result = mt5.order_send(request)
+        ORDER_RETCODES.inc('mt5', result.retcode if result is not None else 'none')
+        
+        record_trade(
+            action='sltp', symbol=symbol, order=order, position=ticket, sl=sl, tp=tp,
+            retcode=result.retcode if result is not None else None,
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 3)
+        )
+        
+        if result is None:
+            logger.error("设置止损止盈失败，返回None，错误码: %s", mt5.last_error())
+            return None, ticket, sl, tp
+        if result.retcode != mt5.TRADE_RETCODE_DONE:
+            logger.warning("设置止损止盈失败: 持仓=%s, 错误码: %s, 说明: %s", ticket, result.retcode, result.comment)
         
-        return result
+        return OrderResult.from_mt5(result), ticket, sl, tp
     
-    def close_position_by_ticket(self, ticket: int) -> bool:
+    def close_position_by_ticket(self, ticket: int, volume: float = 0.0) -> bool:
         """
         通过持仓票据关闭单个持仓
         
         Args:
             ticket: 持仓票据号
+            volume: 平仓数量，0表示全部平仓
             
         Returns:
             bool: 是否成功关闭
@@ -430,10 +600,14 @@ class MT5Trader:
         # 获取支持的填充模式
         filling_type = self.get_supported_filling_mode(symbol)
         
+        close_volume = position.volume
+        if 0 < volume < position.volume:
+            close_volume = volume
+        
         request = {
             "action": mt5.TRADE_ACTION_DEAL,
             "symbol": symbol,
-            "volume": position.volume,
+            "volume": close_volume,
             "type": deal_type,
             "position": ticket,
             "price": price,
@@ -445,14 +619,22 @@ class MT5Trader:
         }
         
         # 发送订单
-        logger.info(f"正在关闭持仓: {request}")
+        logger.debug("正在关闭持仓: %s", request, extra={'symbol': symbol})
+        sent_at = time.perf_counter()
         result = mt5.order_send(request)
+        ORDER_RETCODES.inc('mt5', result.retcode if result is not None else 'none')
+        record_trade(
+            action='close', symbol=symbol, position=ticket, volume=close_volume, price=price,
+            retcode=result.retcode if result is not None else None,
+            order=result.order if result is not None else None,
+            elapsed_ms=round((time.perf_counter() - sent_at) * 1000, 3)
+        )
         
         if result.retcode != mt5.TRADE_RETCODE_DONE:
-            logger.error(f"关闭持仓失败，错误码: {result.retcode}, 说明: {result.comment}")
+            logger.error("关闭持仓失败，错误码: %s, 说明: %s", result.retcode, result.comment)
             return False
         else:
-            logger.info(f"成功关闭持仓，持仓票据: {ticket}")
+            logger.info("成功关闭持仓，持仓票据: %s", ticket)
             return True
     
     def close_positions_by_symbol(self, symbol: str) -> bool:
@@ -483,6 +665,72 @@ class MT5Trader:
         
         return all_closed
     
+    def reduce_position(self, symbol: str, volume: float) -> bool:
+        """
+        部分平仓：按开仓时间先后减少指定品种的持仓
+        
+        Args:
+            symbol: 交易品种
+            volume: 需要减少的数量
+            
+        Returns:
+            bool: 是否全部减仓成功
+        """
+        positions = mt5.positions_get(symbol=symbol)
+        if not positions:
+            logger.warning(f"没有找到持仓，无法减仓，品种: {symbol}")
+            return False
+        
+        remaining = volume
+        for position in sorted(positions, key=lambda p: p.time_msc):
+            if remaining <= 1e-9:
+                break
+            close_volume = min(position.volume, remaining)
+            if not self.close_position_by_ticket(position.ticket, close_volume):
+                return False
+            remaining = round(remaining - close_volume, 8)
+        
+        return remaining <= 1e-9
+    
+    def get_net_position(self, symbol: str) -> float:
+        """
+        获取指定品种的净持仓（多单为正，空单为负）
+        
+        Args:
+            symbol: 交易品种
+            
+        Returns:
+            float: 净持仓数量
+        """
+        positions = mt5.positions_get(symbol=symbol)
+        if not positions:
+            return 0.0
+        net = sum(p.volume if p.type == mt5.POSITION_TYPE_BUY else -p.volume for p in positions)
+        return round(net, 8)
+    
+    def get_net_positions(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        用一次positions_get计算每个品种的净持仓和持仓数（持仓对账使用）
+        
+        Returns:
+            dict: 品种 -> {'net': 净持仓, 'count': 持仓数}，读取失败返回None
+        """
+        positions = mt5.positions_get()
+        if positions is None:
+            logger.error(f"读取持仓失败，错误码: {mt5.last_error()}")
+            return None
+        
+        nets = {}
+        for position in positions:
+            entry = nets.get(position.symbol)
+            if entry is None:
+                entry = nets[position.symbol] = {'net': 0.0, 'count': 0}
+            entry['net'] += position.volume if position.type == mt5.POSITION_TYPE_BUY else -position.volume
+            entry['count'] += 1
+        for entry in nets.values():
+            entry['net'] = round(entry['net'], 8)
+        return nets
+    
     def close_all_positions(self) -> bool:
         """
         关闭所有持仓
@@ -508,49 +756,172 @@ class MT5Trader:
         
         return all_closed
     
-    def get_positions(self, symbol: str = "") -> List[Dict[str, Any]]:
+    def _select_positions(self, symbol: str = "", order_type: Optional[str] = None,
+                          magic: Optional[int] = None) -> tuple:
+        """
+        读取并筛选持仓（mt5.positions_get返回的原始元组）
+        
+        Args:
+            symbol: 交易品种，为空则获取所有持仓
+            order_type: 只保留"BUY"或"SELL"方向的持仓
+            magic: 只保留指定魔术号的持仓
+        """
+        if symbol:
+            positions = mt5.positions_get(symbol=symbol)
+        else:
+            positions = mt5.positions_get()
+        
+        if not positions:
+            return ()
+        
+        if order_type:
+            position_type = mt5.POSITION_TYPE_BUY if order_type.upper() == "BUY" else mt5.POSITION_TYPE_SELL
+            positions = tuple(p for p in positions if p.type == position_type)
+        if magic is not None:
+            positions = tuple(p for p in positions if p.magic == magic)
+        return positions
+    
+    def get_positions(self, symbol: str = "", order_type: Optional[str] = None,
+                      magic: Optional[int] = None) -> List[Position]:
         """
         获取当前持仓信息
         
         Args:
             symbol: 交易品种，为空则获取所有持仓
+            order_type: 只返回"BUY"或"SELL"方向的持仓
+            magic: 只返回指定魔术号的持仓
             
         Returns:
-            List[Dict]: 持仓信息列表
+            List[Position]: 持仓列表
         """
         if not self.is_connected():
             logger.error("MT5未连接")
             return []
         
-        # 获取持仓
-        if symbol:
-            positions = mt5.positions_get(symbol=symbol)
-        else:
-            positions = mt5.positions_get()
+        buy = mt5.POSITION_TYPE_BUY
+        return [Position.from_mt5(position, buy) for position in self._select_positions(symbol, order_type, magic)]
+    
+    def get_positions_columnar(self, symbol: str = "", order_type: Optional[str] = None,
+                               magic: Optional[int] = None, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        按列获取当前持仓信息：每个字段一个数组，不逐行构造字典
+        
+        与get_positions的区别: time为Unix秒（不格式化为字符串），其他字段为MT5原始值，type为"BUY"/"SELL"
         
+        Args:
+            symbol: 交易品种，为空则获取所有持仓
+            order_type: 只返回"BUY"或"SELL"方向的持仓
+            magic: 只返回指定魔术号的持仓
+            fields: 返回的字段，可以是TradePosition的任意字段，为空则返回POSITION_FIELDS
+            
+        Returns:
+            Dict: {"count": 持仓数, "fields": 字段列表, "columns": {字段: 数组}}
+        """
+        fields = list(fields or POSITION_FIELDS)
+        if not self.is_connected():
+            logger.error("MT5未连接")
+            return {"count": 0, "fields": fields, "columns": {field: [] for field in fields}}
+        
+        positions = self._select_positions(symbol, order_type, magic)
         if not positions:
-            return []
+            return {"count": 0, "fields": fields, "columns": {field: [] for field in fields}}
+        
+        # 元组按列转置，一次得到所有字段的数组
+        names = positions[0]._fields
+        unknown = [field for field in fields if field not in names]
+        if unknown:
+            raise ValueError(f"未知的持仓字段: {', '.join(unknown)}")
+        transposed = dict(zip(names, zip(*positions)))
+        
+        columns = {}
+        for field in fields:
+            column = transposed[field]
+            if field == "type":
+                buy = mt5.POSITION_TYPE_BUY
+                column = ["BUY" if value == buy else "SELL" for value in column]
+            columns[field] = list(column)
+        
+        return {"count": len(positions), "fields": fields, "columns": columns}
+    
+    def get_history_deals(self, date_from: int, date_to: int) -> Optional[tuple]:
+        """
+        读取历史成交
         
-        # 转换为字典列表
-        result = []
-        for position in positions:
-            position_dict = {
-                "ticket": position.ticket,
-                "time": datetime.fromtimestamp(position.time).strftime('%Y-%m-%d %H:%M:%S'),
-                "type": "BUY" if position.type == mt5.POSITION_TYPE_BUY else "SELL",
-                "volume": position.volume,
-                "symbol": position.symbol,
-                "price_open": position.price_open,
-                "price_current": position.price_current,
-                "sl": position.sl,
-                "tp": position.tp,
-                "profit": position.profit,
-                "swap": position.swap,
-                "comment": position.comment
-            }
-            result.append(position_dict)
-        
-        return result
+        Args:
+            date_from: 开始时间（Unix秒）
+            date_to: 结束时间（Unix秒）
+            
+        Returns:
+            tuple: TradeDeal元组，失败返回None
+        """
+        deals = mt5.history_deals_get(date_from, date_to)
+        if deals is None:
+            logger.error("读取历史成交失败，错误码: %s", mt5.last_error())
+        return deals
+    
+    def get_history_orders(self, date_from: int, date_to: int) -> Optional[tuple]:
+        """
+        读取历史订单
+        
+        Args:
+            date_from: 开始时间（Unix秒）
+            date_to: 结束时间（Unix秒）
+            
+        Returns:
+            tuple: TradeOrder元组，失败返回None
+        """
+        orders = mt5.history_orders_get(date_from, date_to)
+        if orders is None:
+            logger.error("读取历史订单失败，错误码: %s", mt5.last_error())
+        return orders
+    
+    def copy_rates_range(self, symbol: str, timeframe: str, date_from: int, date_to: int):
+        """
+        读取K线历史
+        
+        Args:
+            symbol: 交易品种
+            timeframe: 周期，如M1/M5/H1/D1（对应mt5.TIMEFRAME_*）
+            date_from: 开始时间（Unix秒）
+            date_to: 结束时间（Unix秒）
+            
+        Returns:
+            numpy.ndarray: K线结构化数组，失败返回None
+        """
+        mt5_timeframe = getattr(mt5, f"TIMEFRAME_{timeframe.upper()}", None)
+        if mt5_timeframe is None:
+            raise ValueError(f"未知的K线周期: {timeframe}")
+        if not mt5.symbol_select(symbol, True):
+            logger.error("添加交易品种 %s 失败", symbol)
+            return None
+        rates = mt5.copy_rates_range(symbol, mt5_timeframe, date_from, date_to)
+        if rates is None:
+            logger.error("读取K线失败: %s %s, 错误码: %s", symbol, timeframe, mt5.last_error())
+        return rates
+    
+    def copy_ticks_range(self, symbol: str, date_from: int, date_to: int, flags: str = "all"):
+        """
+        读取Tick历史
+        
+        Args:
+            symbol: 交易品种
+            date_from: 开始时间（Unix秒）
+            date_to: 结束时间（Unix秒）
+            flags: all/info/trade（对应mt5.COPY_TICKS_*）
+            
+        Returns:
+            numpy.ndarray: Tick结构化数组，失败返回None
+        """
+        mt5_flags = getattr(mt5, f"COPY_TICKS_{flags.upper()}", None)
+        if mt5_flags is None:
+            raise ValueError(f"未知的Tick类型: {flags}")
+        if not mt5.symbol_select(symbol, True):
+            logger.error("添加交易品种 %s 失败", symbol)
+            return None
+        ticks = mt5.copy_ticks_range(symbol, date_from, date_to, mt5_flags)
+        if ticks is None:
+            logger.error("读取Tick失败: %s, 错误码: %s", symbol, mt5.last_error())
+        return ticks
     
     def shutdown(self) -> None:
         """关闭MT5连接"""
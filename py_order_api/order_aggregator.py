@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class AggregatedBatch:
+    """一个聚合窗口内的开仓请求"""
+
+    __slots__ = ('key', 'members', 'deadline', 'order')
+
+    def __init__(self, key, order):
+        self.key = key
+        self.members = []      # [(交易量, future)]
+        self.deadline = None
+        self.order = order     # 第一个请求的下单参数（如comment）
+
+class OpenAggregator:
+    """
+    开仓请求聚合器
+    同一品种、同一方向的开仓请求在聚合窗口内合并为一笔订单，
+    每个原始请求按交易量比例分得成交结果
+    """
+
+    def __init__(self, window_ms, execute):
+        """
+        初始化聚合器
+
+        Args:
+            window_ms: 聚合窗口（毫秒）。数字表示所有品种相同；
+                       dict表示按MT5品种配置，"default"为其他品种的窗口，0表示不聚合
+            execute: 执行合并订单的协程函数 execute(symbol, order_type, volume, deadline, order)
+        """
+        self.window_ms = window_ms
+        self.execute = execute
+        self._batches = {}
+        self.stats = {'requests': 0, 'orders': 0}
+
+    def window_for(self, symbol):
+        """
+        获取品种的聚合窗口（毫秒）
+
+        Args:
+            symbol: MT5品种
+        """
+        if isinstance(self.window_ms, dict):
+            return self.window_ms.get(symbol, self.window_ms.get('default', 0)) or 0
+        return self.window_ms or 0
+
+    def enabled_for(self, symbol):
+        """品种是否启用聚合"""
+        return self.window_for(symbol) > 0
+
+    async def submit(self, symbol, order_type, volume, deadline=None, **order):
+        """
+        提交开仓请求，等待所在聚合窗口的合并订单执行完成
+
+        Args:
+            symbol: MT5品种
+            order_type: BUY或SELL
+            volume: 本请求的交易量（已规范化）
+            deadline: 截止时间（Unix秒），合并订单使用所有请求中最早的截止时间
+            order: 其他下单参数，使用窗口内第一个请求的参数
+
+        Returns:
+            tuple: (execute的返回值, 本请求占合并订单的比例, 合并的请求数, 合并后的总交易量)
+        """
+        key = (symbol, order_type)
+        loop = asyncio.get_running_loop()
+
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = AggregatedBatch(key, order)
+            loop.call_later(self.window_for(symbol) / 1000, self._close, key)
+
+        future = loop.create_future()
+        batch.members.append((volume, future))
+        if deadline is not None:
+            batch.deadline = deadline if batch.deadline is None else min(batch.deadline, deadline)
+        self.stats['requests'] += 1
+
+        return await future
+
+    def _close(self, key):
+        """聚合窗口结束，执行合并订单"""
+        batch = self._batches.pop(key, None)
+        if batch is not None:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch):
+        """执行合并订单并把结果分给每个请求"""
+        symbol, order_type = batch.key
+        total = round(sum(volume for volume, _ in batch.members), 8)
+        count = len(batch.members)
+        self.stats['orders'] += 1
+
+        if count > 1:
+            logger.info(f"合并 {count} 个开仓请求: {symbol} {order_type} 总交易量={total}")
+
+        try:
+            outcome = await self.execute(symbol, order_type, total, batch.deadline, batch.order)
+        except Exception as e:
+            for _, future in batch.members:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for volume, future in batch.members:
+            if not future.done():
+                future.set_result((outcome, volume / total if total else 0.0, count, total))
+
+    def status(self):
+        """获取聚合器状态"""
+        return {
+            'pending': {f"{symbol}:{order_type}": len(batch.members)
+                        for (symbol, order_type), batch in self._batches.items()},
+            'stats': dict(self.stats)
+        }
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import math
+from functools import lru_cache
+
+# 交易量取整方式
+ROUND_DOWN = 'down'
+ROUND_UP = 'up'
+ROUND_NEAREST = 'nearest'
+
+# 浮点误差容差，避免 0.3 / 0.1 = 2.9999999999999996 被向下取整为2
+_EPSILON = 1e-9
+
+@lru_cache(maxsize=256)
+def step_decimals(step):
+    """
+    步长对应的小数位数，如0.01 -> 2
+
+    Args:
+        step: 步长
+    """
+    text = f"{step:.10f}".rstrip('0')
+    return len(text.split('.')[1]) if '.' in text else 0
+
+def snap_to_step(value, step, rounding=ROUND_NEAREST):
+    """
+    将数值对齐到步长的整数倍
+
+    Args:
+        value: 原始数值
+        step: 步长
+        rounding: 取整方式，down/up/nearest
+
+    Returns:
+        float: 对齐后的数值
+    """
+    if not step or step <= 0:
+        return value
+
+    steps = value / step
+    if rounding == ROUND_DOWN:
+        steps = math.floor(steps + _EPSILON)
+    elif rounding == ROUND_UP:
+        steps = math.ceil(steps - _EPSILON)
+    else:
+        steps = math.floor(steps + 0.5)
+    return round(steps * step, step_decimals(step))
+
+def normalize_volume(volume, spec, rounding=ROUND_DOWN, clamp=True):
+    """
+    按品种规格规范化交易量：对齐volume_step，并检查volume_min/volume_max
+
+    Args:
+        volume: 交易量（取绝对值）
+        spec: 品种规格（SymbolSpec）
+        rounding: 对齐步长时的取整方式
+        clamp: 超出范围时是否调整到最小/最大值，否则拒绝
+
+    Returns:
+        tuple: (规范化后的交易量, 拒绝原因)，拒绝时交易量为None
+    """
+    volume = abs(volume)
+    if volume <= 0:
+        return None, '交易量必须大于0'
+
+    volume_min = spec.volume_min or 0
+    volume_max = spec.volume_max or 0
+    volume_step = spec.volume_step or volume_min
+
+    normalized = snap_to_step(volume, volume_step, rounding)
+
+    if volume_min and normalized < volume_min - _EPSILON:
+        if not clamp:
+            return None, f'交易量 {volume} 小于最小交易量 {volume_min}'
+        normalized = volume_min
+    if volume_max and normalized > volume_max + _EPSILON:
+        if not clamp:
+            return None, f'交易量 {volume} 大于最大交易量 {volume_max}'
+        normalized = snap_to_step(volume_max, volume_step, ROUND_DOWN)
+
+    if normalized <= 0:
+        return None, f'交易量 {volume} 按步长 {volume_step} 取整后为0'
+
+    return normalized, None
+
+def normalize_price(price, spec):
+    """
+    将价格对齐到最小价格变动（tick size）并按小数位数取整
+
+    Args:
+        price: 原始价格，0表示不设置
+        spec: 品种规格（SymbolSpec）
+
+    Returns:
+        float: 规范化后的价格
+    """
+    if not price:
+        return 0.0
+
+    tick_size = spec.trade_tick_size or spec.point or 0
+    normalized = snap_to_step(price, tick_size, ROUND_NEAREST)
+
+    digits = spec.digits
+    if digits is not None:
+        normalized = round(normalized, digits)
+    return normalized
+
+def tp_for_profit(spec, order_type, volume, entry_price, profit_amount):
+    """
+    根据目标盈利金额计算止盈价格（不访问终端，使用品种规格）
+
+    Args:
+        spec: 品种规格（SymbolSpec）
+        order_type: BUY或SELL
+        volume: 实际成交量
+        entry_price: 实际成交价
+        profit_amount: 目标盈利金额（账户货币）
+
+    Returns:
+        float: 规范化后的止盈价格，规格不完整时返回0
+    """
+    tick_value = spec.trade_tick_value
+    tick_size = spec.trade_tick_size
+    if not tick_value or not tick_size or not volume or profit_amount <= 0:
+        return 0.0
+
+    distance = profit_amount / (tick_value * volume) * tick_size
+    # 止盈与开仓价的距离不能小于止损止盈级别
+    distance = max(distance, (spec.trade_stops_level or 0) * (spec.point or 0))
+    direction = 1 if order_type.upper() == "BUY" else -1
+    return normalize_price(entry_price + direction * distance, spec)
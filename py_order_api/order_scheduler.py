@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 优先级，数值越小越先执行
+PRIORITY_CLOSE = 0   # 平仓、清仓
+PRIORITY_OPEN = 1    # 开仓
+
+# 不属于单一品种的请求（按票据平仓、清仓）共用的队列
+GLOBAL_LANE = '*'
+
+class OrderRejected(Exception):
+    """请求在执行前被调度器拒绝（过期或负载过高）"""
+
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason
+
+class BrokerError(Exception):
+    """交易进程不可用（已退出、被重启或调用超时）"""
+
+class OutcomeUnknown(BrokerError):
+    """交易调用执行期间交易进程被重启或调用超时，订单可能已经成交，客户端不应直接重试"""
+
+    reason = 'unknown_outcome'
+
+def request_deadline(params, now=None):
+    """
+    根据客户端参数计算请求的截止时间
+
+    支持的参数:
+        deadline_ms: 绝对截止时间（Unix毫秒时间戳）
+        max_age_ms: 最大存活时间（毫秒），从sent_at_ms（客户端发送时间）起算，未提供则从服务器收到时起算
+
+    Args:
+        params: 请求参数
+        now: 当前时间（秒），为空则使用time.time()
+
+    Returns:
+        float: 截止时间（Unix秒），没有设置则返回None
+    """
+    if now is None:
+        now = time.time()
+
+    deadlines = []
+    if params.get('deadline_ms'):
+        deadlines.append(float(params['deadline_ms']) / 1000)
+    if params.get('max_age_ms'):
+        start = float(params['sent_at_ms']) / 1000 if params.get('sent_at_ms') else now
+        deadlines.append(start + float(params['max_age_ms']) / 1000)
+
+    return min(deadlines) if deadlines else None
+
+class ScheduledOrder:
+    """调度队列中的一个请求"""
+
+    __slots__ = ('seq', 'lane', 'priority', 'job', 'deadline', 'future', 'enqueued_at', 'description')
+
+    def __init__(self, seq, lane, priority, job, deadline, future, description):
+        self.seq = seq
+        self.lane = lane
+        self.priority = priority
+        self.job = job
+        self.deadline = deadline
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+        self.description = description
+
+class OrderScheduler:
+    """
+    交易请求调度器
+    - 平仓/清仓优先于开仓
+    - 同一品种的请求严格按到达顺序执行（同一时间每个品种最多一个请求在执行）
+    - 执行前检查客户端给出的截止时间，过期请求直接丢弃
+    - 队列过深时拒绝新的开仓请求，平仓请求直到队列上限才拒绝
+    """
+
+    def __init__(self, workers=1, shed_depth=50, max_depth=200):
+        """
+        初始化调度器
+
+        Args:
+            workers: 同时执行的交易请求数
+            shed_depth: 队列深度达到该值后拒绝新的开仓请求
+            max_depth: 队列深度上限，达到后拒绝所有请求
+        """
+        self.workers = workers
+        self.shed_depth = shed_depth
+        self.max_depth = max_depth
+
+        self._lanes = {}
+        self._busy = set()
+        self._seq = itertools.count()
+        self._depth = 0
+        self._ready = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='order')
+        self._tasks = []
+
+        # 在线程池中执行前包装任务的函数（如cProfile分析），为空则直接执行
+        self.job_wrapper = None
+
+        self.stats = {'submitted': 0, 'executed': 0, 'expired': 0, 'shed': 0, 'failed': 0}
+
+    def start(self):
+        """启动调度协程"""
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    @property
+    def depth(self):
+        """排队中的请求数（不含正在执行的）"""
+        return self._depth
+
+    @property
+    def in_flight(self):
+        """正在执行的请求数"""
+        return len(self._busy)
+
+    async def submit(self, job, lane=GLOBAL_LANE, priority=PRIORITY_OPEN, deadline=None, description=''):
+        """
+        提交交易请求并等待执行结果
+
+        Args:
+            job: 在线程池中执行的同步函数
+            lane: 排序队列（通常为MT5品种），同一队列内按到达顺序执行
+            priority: 优先级，PRIORITY_CLOSE或PRIORITY_OPEN
+            deadline: 截止时间（Unix秒），执行前已过期则丢弃
+            description: 日志中使用的请求描述
+
+        Returns:
+            tuple: (job的返回值, 耗时信息dict)
+
+        Raises:
+            OrderRejected: 请求过期或因负载过高被拒绝
+        """
+        if self._depth >= self.max_depth or (priority > PRIORITY_CLOSE and self._depth >= self.shed_depth):
+            self.stats['shed'] += 1
+            logger.warning(f"交易队列过深({self._depth})，拒绝请求: {description}")
+            raise OrderRejected(f'服务繁忙，交易队列已满({self._depth})，请求被拒绝', 'overloaded')
+
+        if deadline is not None and time.time() >= deadline:
+            self.stats['expired'] += 1
+            raise OrderRejected('请求已过期，未执行', 'expired')
+
+        future = asyncio.get_running_loop().create_future()
+        entry = ScheduledOrder(next(self._seq), lane, priority, job, deadline, future, description)
+        self._lanes.setdefault(lane, deque()).append(entry)
+        self._depth += 1
+        self.stats['submitted'] += 1
+        self._ready.set()
+
+        return await future
+
+    def _pop_next(self):
+        """从空闲队列的队首中选出优先级最高、到达最早的请求"""
+        best = None
+        for lane, entries in self._lanes.items():
+            if lane in self._busy or not entries:
+                continue
+            head = entries[0]
+            if best is None or (head.priority, head.seq) < (best.priority, best.seq):
+                best = head
+
+        if best is None:
+            return None
+
+        entries = self._lanes[best.lane]
+        entries.popleft()
+        if not entries:
+            del self._lanes[best.lane]
+        self._depth -= 1
+        return best
+
+    async def _worker(self):
+        """调度协程：取出请求并在线程池中执行"""
+        while True:
+            entry = self._pop_next()
+            if entry is None:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            self._busy.add(entry.lane)
+            try:
+                await self._dispatch(entry)
+            except Exception as e:
+                logger.exception(f"调度交易请求时出错: {str(e)}")
+            finally:
+                self._busy.discard(entry.lane)
+                self._ready.set()
+
+    async def _dispatch(self, entry):
+        """执行单个请求"""
+        # 客户端已放弃等待（如超时），不再执行
+        if entry.future.done():
+            return
+
+        started_at = time.perf_counter()
+        queue_ms = (started_at - entry.enqueued_at) * 1000
+
+        if entry.deadline is not None and time.time() >= entry.deadline:
+            self.stats['expired'] += 1
+            logger.warning(f"请求在队列中过期，已丢弃: {entry.description}, 排队 {queue_ms:.1f}ms")
+            entry.future.set_exception(OrderRejected(f'请求已过期，未执行（排队 {queue_ms:.1f}ms）', 'expired'))
+            return
+
+        loop = asyncio.get_running_loop()
+        try:
+            job = entry.job if self.job_wrapper is None else self.job_wrapper(entry.job)
+            result = await loop.run_in_executor(self._executor, job)
+        except Exception as e:
+            self.stats['failed'] += 1
+            if not entry.future.done():
+                entry.future.set_exception(e)
+            return
+
+        self.stats['executed'] += 1
+        timing = {
+            'queue_ms': round(queue_ms, 3),
+            'exec_ms': round((time.perf_counter() - started_at) * 1000, 3)
+        }
+        if not entry.future.done():
+            entry.future.set_result((result, timing))
+
+    def status(self):
+        """获取调度器状态"""
+        return {
+            'depth': self._depth,
+            'in_flight': self.in_flight,
+            'lanes': {lane: len(entries) for lane, entries in self._lanes.items()},
+            'stats': dict(self.stats)
+        }
+
+    def shutdown(self):
+        """停止调度协程"""
+        for task in self._tasks:
+            task.cancel()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import time
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DRIFTS = REGISTRY.counter('position_drift_total', 'ATAS预期净持仓与MT5实际净持仓不一致的次数', ('symbol',))
+DRIFT_VOLUME = REGISTRY.gauge('position_drift_volume', 'MT5实际净持仓减去ATAS预期净持仓（MT5手数）', ('symbol',))
+CORRECTIONS = REGISTRY.counter('position_drift_corrections_total', '持仓偏差自动修正的次数', ('symbol',))
+
+_EPSILON = 1e-9
+
+# 没有持仓的品种
+_FLAT = {'net': 0.0, 'count': 0}
+
+class SymbolReconcileState:
+    """单个MT5品种的对账状态"""
+
+    __slots__ = ('drift_key', 'drift_checks', 'drifting', 'corrections', 'last_drift')
+
+    def __init__(self):
+        self.drift_key = None      # 已报告偏差时的(预期净持仓, 实际净持仓)
+        self.drift_checks = 0      # 连续不一致的检查次数
+        self.drifting = False      # 已发出偏差事件，尚未恢复一致
+        self.corrections = 0       # 本次偏差已自动修正的次数
+        self.last_drift = None
+
+class PositionReconciler:
+    """
+    持仓对账
+    信号引擎按处理过的position_update保存每个品种的预期净持仓，定期与MT5实际持仓比较：
+    - 每次检查只调用一次positions_get，直接比较每个品种的预期净持仓和实际净持仓
+    - 已报告的偏差在预期和实际净持仓都没有变化（且不能再自动修正）时不重复读取持仓明细
+    - 连续confirmations次不一致才认定为偏差（避免与正在成交的订单竞争），推送position_drift事件
+    - 启用auto_correct时让信号引擎从MT5重新读取持仓并按预期净持仓补单
+    """
+
+    def __init__(self, trader, signal_engine, spec_cache=None, interval=5.0, confirmations=2,
+                 auto_correct=False, max_corrections=3, on_event=None, is_connected=None):
+        """
+        初始化持仓对账
+
+        Args:
+            trader: MT5Trader
+            signal_engine: SignalEngine，提供预期净持仓和补单
+            spec_cache: 品种规格缓存，净持仓差小于半个交易量步长时视为一致
+            interval: 检查间隔（秒）
+            confirmations: 连续不一致多少次后认定为偏差
+            auto_correct: 是否自动修正偏差
+            max_corrections: 每次偏差最多自动修正的次数
+            on_event: 偏差和恢复一致时调用的协程函数，参数为事件dict
+            is_connected: 返回MT5是否已连接的函数，未连接时跳过检查
+        """
+        self.trader = trader
+        self.signal_engine = signal_engine
+        self.spec_cache = spec_cache
+        self.interval = interval
+        self.confirmations = max(1, confirmations)
+        self.auto_correct = auto_correct
+        self.max_corrections = max_corrections
+        self.on_event = on_event
+        self.is_connected = is_connected
+        self.symbols = {}
+        self.last_check = None
+        self.stats = {'checks': 0, 'skipped': 0, 'compared': 0, 'drifts': 0, 'corrections': 0, 'resolved': 0}
+
+    async def run(self):
+        """定期对账"""
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.is_connected is not None and not self.is_connected():
+                continue
+            try:
+                await self.check()
+            except Exception as e:
+                logger.exception(f"持仓对账时出错: {str(e)}")
+
+    def _tolerance(self, symbol):
+        spec = self.spec_cache.get(symbol) if self.spec_cache is not None else None
+        step = (spec.volume_step or spec.volume_min) if spec else None
+        return step / 2 if step else _EPSILON
+
+    async def check(self):
+        """
+        检查一次所有有信号的品种
+
+        Returns:
+            list: 本次产生的事件
+        """
+        states = self.signal_engine.states
+        if not states:
+            return []
+
+        loop = asyncio.get_running_loop()
+        nets = await loop.run_in_executor(None, self.trader.get_net_positions)
+        if nets is None:
+            return []
+        self.stats['checks'] += 1
+        self.last_check = time.time()
+
+        events = []
+        for symbol, signal_state in list(states.items()):
+            entry = self.symbols.get(symbol)
+            if entry is None:
+                entry = self.symbols[symbol] = SymbolReconcileState()
+
+            # 有信号在合并或执行中时持仓正在变化，下次再比较
+            if self.signal_engine.is_busy(symbol):
+                entry.drift_checks = 0
+                continue
+
+            expected = signal_state.target
+            live = nets.get(symbol, _FLAT)
+            self.stats['compared'] += 1
+            difference = round(live['net'] - expected, 8)
+            if abs(difference) <= self._tolerance(symbol):
+                entry.drift_key = None
+                entry.drift_checks = 0
+                entry.corrections = 0
+                DRIFT_VOLUME.set(0, symbol)
+                if entry.drifting:
+                    entry.drifting = False
+                    self.stats['resolved'] += 1
+                    logger.info(f"持仓已恢复一致: {symbol} 净持仓={live['net']}")
+                    events.append({'event': 'position_drift_resolved', 'symbol': symbol,
+                                   'security': signal_state.security, 'net': live['net']})
+                continue
+
+            key = (expected, live['net'])
+            can_correct = self.auto_correct and entry.corrections < self.max_corrections
+            if key == entry.drift_key and not can_correct:
+                self.stats['skipped'] += 1
+                continue
+
+            entry.drift_checks += 1
+            if entry.drift_checks < self.confirmations:
+                continue
+
+            DRIFT_VOLUME.set(difference, symbol)
+            event = await self._drift_event(symbol, signal_state, expected, live, difference)
+            entry.last_drift = event
+            if key != entry.drift_key:
+                # 新的偏差（或偏差后持仓又发生了变化）
+                entry.drift_key = key
+                entry.drifting = True
+                self.stats['drifts'] += 1
+                DRIFTS.inc(symbol)
+                logger.error(f"持仓偏差: {symbol}({signal_state.security}) 预期={expected} 实际={live['net']} "
+                             f"差额={difference}, 持仓={event['positions']}")
+                events.append(event)
+
+            if can_correct:
+                if self.signal_engine.resync(symbol):
+                    entry.corrections += 1
+                    entry.drift_checks = 0
+                    self.stats['corrections'] += 1
+                    CORRECTIONS.inc(symbol)
+                    logger.warning(f"自动修正持仓偏差: {symbol} 按预期净持仓 {expected} 补单 (第{entry.corrections}次)")
+                    events.append(dict(event, event='position_drift_correcting', correction=entry.corrections))
+
+        if self.on_event is not None:
+            for event in events:
+                try:
+                    await self.on_event(event)
+                except Exception as e:
+                    logger.exception(f"推送持仓对账事件时出错: {str(e)}")
+        return events
+
+    async def _drift_event(self, symbol, signal_state, expected, live, difference):
+        """偏差事件：附带该品种的持仓明细"""
+        loop = asyncio.get_running_loop()
+        positions = await loop.run_in_executor(None, self.trader.get_positions, symbol)
+        return {
+            'event': 'position_drift',
+            'symbol': symbol,
+            'security': signal_state.security,
+            'expected': expected,
+            'actual': live['net'],
+            'difference': difference,
+            'positions': [
+                {'ticket': p.ticket, 'type': p.type, 'volume': p.volume, 'magic': p.magic} for p in positions
+            ],
+            'auto_correct': self.auto_correct,
+            'time': time.time()
+        }
+
+    def status(self):
+        """获取对账状态"""
+        return {
+            'stats': dict(self.stats),
+            'last_check': self.last_check,
+            'drifting': {symbol: entry.last_drift for symbol, entry in self.symbols.items() if entry.drifting}
+        }
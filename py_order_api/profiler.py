@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# 采样/分析模式
+MODE_SAMPLE = 'sample'
+MODE_CPROFILE = 'cprofile'
+
+# 单次分析的最长时间（秒），避免误操作长时间影响交易进程
+MAX_DURATION = 60.0
+
+def _frame_label(code):
+    """栈帧标签，如 open_position (mt5_trader.py:371)"""
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+    """
+    采样分析器
+    后台线程定期读取所有线程（事件循环、交易线程、连接守护等）的调用栈，
+    不修改被采样线程的执行，可以在实盘进程中安全使用
+    """
+
+    def __init__(self, interval=0.005):
+        """
+        Args:
+            interval: 采样间隔（秒）
+        """
+        self.interval = max(0.001, interval)
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            labels.append(names.get(ident, str(ident)))
+            labels.reverse()
+            self.stacks[';'.join(labels)] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except Exception as e:
+                logger.error("采样调用栈时出错: %s", e)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def write(self, path):
+        """写入collapsed-stack格式（可直接用于flamegraph.pl/speedscope）"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def summary(self, top=20):
+        """
+        按函数汇总采样结果
+
+        Returns:
+            dict: self为栈顶函数的采样数，inclusive为出现在栈中的采样数
+        """
+        leaf = Counter()
+        inclusive = Counter()
+        total = 0
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            total += count
+            # 第一个元素是线程名，栈顶是最后一个元素
+            leaf[f"{frames[0]}: {frames[-1]}"] += count
+            for label in set(frames[1:]):
+                inclusive[label] += count
+
+        def rows(counter):
+            return [
+                {'function': label, 'samples': count,
+                 'percent': round(count * 100 / total, 2) if total else 0.0}
+                for label, count in counter.most_common(top)
+            ]
+
+        return {'samples': self.samples, 'stacks': total, 'self': rows(leaf), 'inclusive': rows(inclusive)}
+
+class DeterministicProfiler:
+    """
+    cProfile分析器
+    cProfile只记录启用它的线程，因此事件循环线程使用一个Profile，
+    交易线程中执行的任务通过wrap()各自记录，结束时合并
+    """
+
+    def __init__(self):
+        self.loop_profile = cProfile.Profile()
+        self._job_profiles = []
+        self._lock = threading.Lock()
+        self.active = False
+
+    def start(self):
+        self.loop_profile.enable()
+        self.active = True
+
+    def stop(self):
+        self.active = False
+        self.loop_profile.disable()
+
+    def wrap(self, job):
+        """包装在线程池中执行的任务，分析期间记录其调用"""
+        def profiled():
+            if not self.active:
+                return job()
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # 新版本Python同一时间只允许一个分析器，此时事件循环的Profile已覆盖所有线程
+                return job()
+            try:
+                return job()
+            finally:
+                profile.disable()
+                with self._lock:
+                    self._job_profiles.append(profile)
+        return profiled
+
+    def stats(self):
+        stats = pstats.Stats(self.loop_profile)
+        with self._lock:
+            for profile in self._job_profiles:
+                stats.add(profile)
+        return stats
+
+    def write(self, path):
+        """写入pstats文件（python -m pstats / snakeviz可读取）"""
+        self.stats().dump_stats(path)
+
+    def summary(self, top=20):
+        """按自身耗时和累计耗时汇总"""
+        stats = self.stats()
+        entries = []
+        for (filename, line, name), (cc, nc, tottime, cumtime, callers) in stats.stats.items():
+            entries.append({
+                'function': f"{name} ({os.path.basename(filename)}:{line})",
+                'calls': nc,
+                'tottime_ms': round(tottime * 1000, 3),
+                'cumtime_ms': round(cumtime * 1000, 3)
+            })
+        return {
+            'profiled_jobs': len(self._job_profiles),
+            'self': sorted(entries, key=lambda e: e['tottime_ms'], reverse=True)[:top],
+            'inclusive': sorted(entries, key=lambda e: e['cumtime_ms'], reverse=True)[:top]
+        }
+
+class ProfileSession:
+    """同一时间只允许一次分析的管理器"""
+
+    def __init__(self, output_dir='profiles', scheduler=None):
+        """
+        Args:
+            output_dir: 分析结果文件目录
+            scheduler: OrderScheduler，cprofile模式下记录其交易线程中执行的任务
+        """
+        self.output_dir = output_dir
+        self.scheduler = scheduler
+        self._running = False
+
+    @property
+    def running(self):
+        return self._running
+
+    async def capture(self, mode=MODE_SAMPLE, duration=10.0, interval_ms=5.0, top=20):
+        """
+        分析指定时长并写入文件
+
+        Args:
+            mode: sample（采样，collapsed-stack）或cprofile（确定性，pstats）
+            duration: 分析时长（秒），最长MAX_DURATION
+            interval_ms: 采样间隔（毫秒），仅sample模式
+            top: 汇总返回的函数数量
+
+        Returns:
+            dict: 分析结果摘要和文件路径
+        """
+        if self._running:
+            raise RuntimeError('已有分析正在进行')
+        if mode not in (MODE_SAMPLE, MODE_CPROFILE):
+            raise ValueError(f'未知的分析模式: {mode}')
+
+        duration = min(max(float(duration), 0.1), MAX_DURATION)
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+
+        self._running = True
+        logger.info("开始%s分析，时长 %.1f 秒", mode, duration)
+        try:
+            if mode == MODE_SAMPLE:
+                profiler = SamplingProfiler(interval_ms / 1000)
+                path = os.path.join(self.output_dir, f'profile-{stamp}.collapsed')
+            else:
+                profiler = DeterministicProfiler()
+                path = os.path.join(self.output_dir, f'profile-{stamp}.pstats')
+                if self.scheduler is not None:
+                    self.scheduler.job_wrapper = profiler.wrap
+
+            profiler.start()
+            try:
+                await asyncio.sleep(duration)
+            finally:
+                profiler.stop()
+                if mode == MODE_CPROFILE and self.scheduler is not None:
+                    self.scheduler.job_wrapper = None
+
+            # 写文件和汇总可能较慢，放到线程池中执行
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, profiler.write, path)
+            summary = await loop.run_in_executor(None, profiler.summary, top)
+        finally:
+            self._running = False
+
+        logger.info("分析完成，结果已写入 %s", path)
+        return {'mode': mode, 'duration': duration, 'file': os.path.abspath(path), 'summary': summary}
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import time
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+READ_CACHE = REGISTRY.counter(
+    'read_cache_total', '只读请求缓存结果（hit: 缓存命中, shared: 合并到进行中的请求, miss: 调用后端）',
+    ('action', 'result')
+)
+
+class ReadCache:
+    """
+    只读请求的合并与短时缓存
+    - 相同的并发请求只调用一次后端，所有请求共享同一个结果
+    - 结果在TTL内直接从内存返回
+    - 交易操作后调用invalidate()清空缓存，之后的读取一定在交易完成后调用后端
+    缓存的结果会被多个请求共享，调用方不能修改返回值
+    """
+
+    def __init__(self, ttl_ms=None, default_ttl_ms=0):
+        """
+        初始化缓存
+
+        Args:
+            ttl_ms: 按操作配置的TTL（毫秒），如 {"get_positions": 100}
+            default_ttl_ms: 未配置的操作使用的TTL，0表示只合并并发请求不缓存
+        """
+        self.ttl_ms = dict(ttl_ms or {})
+        self.default_ttl_ms = default_ttl_ms
+        self._entries = {}     # key -> (过期时间, 结果)
+        self._inflight = {}    # key -> (代数, future)
+        self._generation = 0
+
+    def ttl_for(self, action):
+        """获取操作的TTL（秒）"""
+        return self.ttl_ms.get(action, self.default_ttl_ms) / 1000
+
+    async def get(self, action, key, fetch):
+        """
+        获取只读请求的结果
+
+        Args:
+            action: 操作名（决定TTL，也用作指标标签）
+            key: 请求参数组成的可哈希键
+            fetch: 调用后端的协程函数（无参数）
+
+        Returns:
+            fetch的返回值（可能与其他请求共享）
+        """
+        cache_key = (action, key)
+        now = time.monotonic()
+
+        entry = self._entries.get(cache_key)
+        if entry is not None:
+            if entry[0] > now:
+                READ_CACHE.inc(action, 'hit')
+                return entry[1]
+            del self._entries[cache_key]
+
+        inflight = self._inflight.get(cache_key)
+        if inflight is not None and inflight[0] == self._generation:
+            READ_CACHE.inc(action, 'shared')
+            return await asyncio.shield(inflight[1])
+
+        READ_CACHE.inc(action, 'miss')
+        generation = self._generation
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = (generation, future)
+        try:
+            result = await fetch()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他请求等待时避免"exception was never retrieved"警告
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            ttl = self.ttl_for(action)
+            # 请求期间发生了交易（缓存已失效），结果可能是交易前的状态，不缓存
+            if ttl > 0 and generation == self._generation:
+                self._entries[cache_key] = (time.monotonic() + ttl, result)
+            return result
+        finally:
+            if self._inflight.get(cache_key, (None, None))[1] is future:
+                del self._inflight[cache_key]
+
+    def invalidate(self):
+        """清空缓存（交易操作后调用），进行中的请求结果也不会被后续请求复用"""
+        self._generation += 1
+        self._entries.clear()
+        self._inflight.clear()
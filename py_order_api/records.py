@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import struct
+from datetime import datetime
+
+# 二进制编码: 每个字段一个类型标记 + 值
+_NONE = b'N'
+_INT = b'q'
+_FLOAT = b'd'
+_STR = b's'
+_BOOL = b'?'
+
+_INT_VALUE = struct.Struct('<q')
+_FLOAT_VALUE = struct.Struct('<d')
+_LENGTH = struct.Struct('<I')
+
+def _encode_value(value, out):
+    if value is None:
+        out.append(_NONE)
+    elif isinstance(value, bool):
+        out.append(_BOOL + (b'\x01' if value else b'\x00'))
+    elif isinstance(value, int):
+        out.append(_INT + _INT_VALUE.pack(value))
+    elif isinstance(value, float):
+        out.append(_FLOAT + _FLOAT_VALUE.pack(value))
+    else:
+        data = str(value).encode('utf-8')
+        out.append(_STR + _LENGTH.pack(len(data)) + data)
+
+def _decode_value(view, offset):
+    tag = view[offset:offset + 1].tobytes()
+    offset += 1
+    if tag == _NONE:
+        return None, offset
+    if tag == _BOOL:
+        return view[offset] != 0, offset + 1
+    if tag == _INT:
+        return _INT_VALUE.unpack_from(view, offset)[0], offset + _INT_VALUE.size
+    if tag == _FLOAT:
+        return _FLOAT_VALUE.unpack_from(view, offset)[0], offset + _FLOAT_VALUE.size
+    if tag == _STR:
+        length = _LENGTH.unpack_from(view, offset)[0]
+        offset += _LENGTH.size
+        return str(view[offset:offset + length], 'utf-8'), offset + length
+    raise ValueError(f'无效的字段类型标记: {tag!r}')
+
+class Record:
+    """
+    交易记录基类（__slots__，不创建实例__dict__）
+    交易类返回记录对象，服务端在发送时才序列化（json.dumps(default=json_default)），
+    缓存中的记录可以被多个请求共享，不需要复制
+    """
+
+    __slots__ = ()
+
+    # 默认输出到JSON的字段，为空则输出全部字段
+    JSON_FIELDS = ()
+
+    def __init__(self, **values):
+        for field in self.__slots__:
+            setattr(self, field, values.pop(field, None))
+        if values:
+            raise TypeError(f"{type(self).__name__}未知的字段: {', '.join(values)}")
+
+    def _json_value(self, field):
+        return getattr(self, field)
+
+    def to_json(self, fields=None):
+        """
+        转换为可以JSON序列化的dict
+
+        Args:
+            fields: 输出的字段，为空则使用JSON_FIELDS（或全部字段）
+        """
+        fields = fields or self.JSON_FIELDS or self.__slots__
+        try:
+            return {field: self._json_value(field) for field in fields}
+        except AttributeError as e:
+            raise ValueError(f"{type(self).__name__}未知的字段: {e.name}") from None
+
+    def to_dict(self):
+        """转换为包含全部原始字段值的dict"""
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, values):
+        """从dict创建（忽略未知字段）"""
+        record = cls.__new__(cls)
+        for field in cls.__slots__:
+            setattr(record, field, values.get(field))
+        return record
+
+    def pack(self):
+        """编码为二进制"""
+        out = []
+        for field in self.__slots__:
+            _encode_value(getattr(self, field), out)
+        return b''.join(out)
+
+    @classmethod
+    def unpack_from(cls, buffer, offset=0):
+        """
+        从二进制解码
+
+        Returns:
+            tuple: (记录, 结束位置)
+        """
+        view = memoryview(buffer)
+        record = cls.__new__(cls)
+        for field in cls.__slots__:
+            value, offset = _decode_value(view, offset)
+            setattr(record, field, value)
+        return record, offset
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self):
+        values = ', '.join(f'{field}={getattr(self, field)!r}' for field in self.__slots__)
+        return f'{type(self).__name__}({values})'
+
+class Position(Record):
+    """持仓"""
+
+    __slots__ = (
+        'ticket', 'time', 'time_msc', 'type', 'magic', 'identifier', 'volume', 'symbol', 'price_open',
+        'price_current', 'sl', 'tp', 'profit', 'swap', 'comment', 'original_symbol'
+    )
+
+    JSON_FIELDS = (
+        'ticket', 'time', 'type', 'volume', 'symbol', 'price_open', 'price_current', 'sl', 'tp',
+        'profit', 'swap', 'comment', 'original_symbol'
+    )
+
+    def _json_value(self, field):
+        # time为Unix秒，JSON中保持原有的本地时间字符串格式
+        if field == 'time' and self.time is not None:
+            return datetime.fromtimestamp(self.time).strftime('%Y-%m-%d %H:%M:%S')
+        return getattr(self, field)
+
+    @classmethod
+    def from_mt5(cls, position, buy_type=0):
+        """
+        从mt5.positions_get返回的TradePosition创建
+
+        Args:
+            position: TradePosition
+            buy_type: mt5.POSITION_TYPE_BUY
+        """
+        record = cls.__new__(cls)
+        record.ticket = position.ticket
+        record.time = position.time
+        record.time_msc = position.time_msc
+        record.type = 'BUY' if position.type == buy_type else 'SELL'
+        record.magic = position.magic
+        record.identifier = position.identifier
+        record.volume = position.volume
+        record.symbol = position.symbol
+        record.price_open = position.price_open
+        record.price_current = position.price_current
+        record.sl = position.sl
+        record.tp = position.tp
+        record.profit = position.profit
+        record.swap = position.swap
+        record.comment = position.comment
+        record.original_symbol = None
+        return record
+
+class AccountSnapshot(Record):
+    """账户信息"""
+
+    __slots__ = (
+        'login', 'server', 'currency', 'leverage', 'balance', 'equity', 'margin', 'margin_free',
+        'margin_level', 'margin_so_mode', 'margin_so_call', 'margin_so_so', 'margin_initial',
+        'margin_maintenance', 'assets', 'liabilities', 'commission_blocked', 'name', 'trade_mode',
+        'limit_orders'
+    )
+
+    @classmethod
+    def from_mt5(cls, account_info):
+        """从mt5.account_info返回的AccountInfo创建"""
+        record = cls.__new__(cls)
+        for field in cls.__slots__:
+            setattr(record, field, getattr(account_info, field))
+        return record
+
+class OrderResult(Record):
+    """下单结果（retcode使用MT5返回码，Bybit成功为0；type为实际下单方向BUY/SELL）"""
+
+    __slots__ = ('retcode', 'order', 'deal', 'volume', 'price', 'bid', 'ask', 'comment', 'request_id', 'type')
+
+    @classmethod
+    def from_mt5(cls, result, order_type=None):
+        """从mt5.order_send返回的OrderSendResult创建"""
+        record = cls.__new__(cls)
+        for field in cls.__slots__[:-1]:
+            setattr(record, field, getattr(result, field))
+        record.type = order_type
+        return record
+
+class SymbolSpec(Record):
+    """品种规格（规格缓存保存的symbol_info静态字段）"""
+
+    __slots__ = (
+        'volume_min', 'volume_max', 'volume_step', 'digits', 'point', 'trade_tick_value',
+        'trade_tick_size', 'trade_stops_level', 'trade_contract_size', 'filling_mode'
+    )
+
+    @classmethod
+    def from_mt5(cls, symbol_info):
+        """从mt5.symbol_info返回的SymbolInfo创建"""
+        record = cls.__new__(cls)
+        for field in cls.__slots__:
+            setattr(record, field, getattr(symbol_info, field, None))
+        return record
+
+def json_default(value):
+    """json.dumps的default参数：序列化记录对象"""
+    if isinstance(value, Record):
+        return value.to_json()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def pack_records(records):
+    """
+    把同类型的记录列表编码为二进制: 记录数(uint32) + 每条记录
+
+    Args:
+        records: 记录列表
+    """
+    return _LENGTH.pack(len(records)) + b''.join(record.pack() for record in records)
+
+def unpack_records(cls, buffer):
+    """
+    解码pack_records的结果
+
+    Args:
+        cls: 记录类型
+        buffer: 二进制数据
+    """
+    count = _LENGTH.unpack_from(buffer, 0)[0]
+    offset = _LENGTH.size
+    records = []
+    for _ in range(count):
+        record, offset = cls.unpack_from(buffer, offset)
+        records.append(record)
+    return records
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+回放抓包文件（config.json中capture_file生成）
+
+按原始时间间隔（或N倍速）把每个连接收到的消息重新发送给服务器，统计每个请求的延迟，
+并把响应与抓包时的响应比较（忽略时间、耗时等每次都会变化的字段），报告不一致的请求。
+抓包时已替换的敏感参数（管理令牌等）在回放时去掉，不发送占位值。
+
+用法:
+  python replay_capture.py capture.bin --start-server            # 启动使用模拟MT5后端的服务器并回放
+  python replay_capture.py capture.bin --speed 10                 # 10倍速回放到已运行的服务器
+  python replay_capture.py capture.bin --speed 0 --json           # 不等待，尽快发送
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import websockets
+
+from traffic_capture import read_capture, INBOUND, OUTBOUND, CLOSED, SECRET_PARAMS, REDACTED
+from bench_startup import wait_for_listen
+
+# 每次运行都会变化的字段，比较响应时忽略
+DEFAULT_IGNORE = (
+    'timing', 'attempts', 'elapsed_ms', 'time', 'time_msc', 'time_update', 'time_update_msc',
+    'time_setup', 'time_setup_msc', 'time_done', 'time_done_msc', 'timestamp', 'since',
+    'readiness', 'last_update', 'last_sync', 'synced_to', 'signal_to_fill_ms', 'stream_id'
+)
+
+# 响应本身就是运行状态的操作，只统计延迟不比较
+UNCOMPARED_ACTIONS = ('health_check', 'get_metrics', 'admin_profile', 'get_execution_stats')
+
+def load_sessions(path):
+    """
+    按连接整理抓包记录
+
+    Returns:
+        tuple: (第一条记录的时间, {连接编号: {'inbound': [(time_ns, 消息)], 'expected': {请求ID: 响应}}})
+    """
+    sessions = {}
+    start_ns = None
+    for time_ns, connection_id, kind, message in read_capture(path):
+        if start_ns is None:
+            start_ns = time_ns
+        session = sessions.setdefault(connection_id, {'inbound': [], 'expected': {}})
+        if kind == INBOUND:
+            session['inbound'].append((time_ns, message))
+        elif kind == OUTBOUND:
+            try:
+                response = json.loads(message)
+            except ValueError:
+                continue
+            if response.get('id') is not None:
+                session['expected'][json.dumps(response['id'])] = response
+        elif kind == CLOSED:
+            session['closed_ns'] = time_ns
+    return start_ns, sessions
+
+def strip_redacted(data):
+    """去掉抓包时被替换的敏感参数，返回是否有改动"""
+    changed = False
+    for container in (data, data.get('params')):
+        if isinstance(container, dict):
+            for name in SECRET_PARAMS:
+                if container.get(name) == REDACTED:
+                    del container[name]
+                    changed = True
+    return changed
+
+def normalize(value, ignore):
+    """去掉忽略的字段，用于比较响应"""
+    if isinstance(value, dict):
+        return {key: normalize(item, ignore) for key, item in value.items() if key not in ignore}
+    if isinstance(value, list):
+        return [normalize(item, ignore) for item in value]
+    return value
+
+async def replay_session(args, start_ns, replay_start, connection_id, session, results):
+    """回放一个连接: 发送任务按时间发送，同时接收响应并计算延迟"""
+    sent = {}        # 请求ID -> (发送时间, 操作)
+    responded = asyncio.Event()
+
+    async def receive(websocket):
+        async for message in websocket:
+            if isinstance(message, bytes):
+                continue
+            response = json.loads(message)
+            if response.get('id') is None:
+                continue
+            key = json.dumps(response['id'])
+            request = sent.pop(key, None)
+            if request is None:
+                continue
+            sent_at, action = request
+            results.append({
+                'connection': connection_id,
+                'id': response['id'],
+                'action': action,
+                'latency_ms': (time.perf_counter() - sent_at) * 1000,
+                'response': response,
+                'expected': session['expected'].get(key)
+            })
+            if not sent:
+                responded.set()
+
+    async with websockets.connect(args.url, max_size=None) as websocket:
+        await websocket.recv()  # 欢迎消息
+        receiver = asyncio.create_task(receive(websocket))
+        for time_ns, message in session['inbound']:
+            if args.speed > 0:
+                delay = replay_start + (time_ns - start_ns) / 1e9 / args.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            try:
+                data = json.loads(message)
+            except ValueError:
+                data = {}
+            if not isinstance(data, dict):
+                data = {}
+            if strip_redacted(data):
+                message = json.dumps(data, ensure_ascii=False)
+            if data.get('id') is not None:
+                sent[json.dumps(data['id'])] = (time.perf_counter(), data.get('action'))
+                responded.clear()
+            await websocket.send(message)
+
+        if sent:
+            try:
+                await asyncio.wait_for(responded.wait(), args.timeout)
+            except asyncio.TimeoutError:
+                for key, (_, action) in sent.items():
+                    results.append({'connection': connection_id, 'id': json.loads(key), 'action': action,
+                                    'latency_ms': None, 'response': None, 'expected': None})
+        receiver.cancel()
+
+async def replay(args):
+    start_ns, sessions = load_sessions(args.capture)
+    if start_ns is None:
+        raise ValueError('抓包文件为空')
+    results = []
+    replay_start = time.perf_counter()
+    await asyncio.gather(*[
+        replay_session(args, start_ns, replay_start, connection_id, session, results)
+        for connection_id, session in sessions.items() if session['inbound']
+    ])
+    return results, time.perf_counter() - replay_start
+
+def summarize(results, ignore):
+    """按操作汇总延迟，比较响应"""
+    actions = {}
+    divergences = []
+    timeouts = 0
+    for result in results:
+        if result['latency_ms'] is None:
+            timeouts += 1
+            continue
+        actions.setdefault(result['action'] or 'unknown', []).append(result['latency_ms'])
+        expected = result['expected']
+        if expected is None or result['action'] in UNCOMPARED_ACTIONS:
+            continue
+        if normalize(result['response'], ignore) != normalize(expected, ignore):
+            divergences.append({
+                'connection': result['connection'],
+                'id': result['id'],
+                'action': result['action'],
+                'expected': normalize(expected, ignore),
+                'actual': normalize(result['response'], ignore)
+            })
+
+    latency = {}
+    for action, values in sorted(actions.items()):
+        values.sort()
+        latency[action] = {
+            'count': len(values),
+            'p50_ms': round(statistics.median(values), 3),
+            'p99_ms': round(values[min(len(values) - 1, int(len(values) * 0.99))], 3),
+            'max_ms': round(values[-1], 3)
+        }
+    return {'requests': len(results), 'timeouts': timeouts, 'latency': latency, 'divergences': divergences}
+
+def start_server(args):
+    """启动使用模拟MT5后端的服务器"""
+    env = dict(os.environ, MT5_BACKEND='fake')
+    process = subprocess.Popen(
+        [sys.executable, 'websocket_server.py'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    host, port = args.url.split('://', 1)[1].split('/')[0].rsplit(':', 1)
+    asyncio.run(wait_for_listen(host, int(port), time.perf_counter() + args.timeout, process))
+    return process
+
+def main():
+    parser = argparse.ArgumentParser(description="回放WebSocket抓包文件")
+    parser.add_argument('capture', help='抓包文件路径')
+    parser.add_argument('--url', default='ws://127.0.0.1:8766')
+    parser.add_argument('--speed', type=float, default=1.0, help='回放速度倍数，0表示不等待')
+    parser.add_argument('--timeout', type=float, default=30, help='等待响应的超时（秒）')
+    parser.add_argument('--ignore', default='', help='比较响应时额外忽略的字段（逗号分隔）')
+    parser.add_argument('--start-server', action='store_true', help='启动使用模拟MT5后端的服务器')
+    parser.add_argument('--show', type=int, default=5, help='显示的不一致请求数')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    args = parser.parse_args()
+
+    ignore = set(DEFAULT_IGNORE) | {field for field in args.ignore.split(',') if field}
+    process = start_server(args) if args.start_server else None
+    try:
+        results, elapsed = asyncio.run(replay(args))
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    summary = summarize(results, ignore)
+    summary['elapsed_s'] = round(elapsed, 3)
+
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        return
+
+    print(f"请求数: {summary['requests']}, 超时: {summary['timeouts']}, "
+          f"不一致: {len(summary['divergences'])}, 耗时: {summary['elapsed_s']}s")
+    print("=" * 60)
+    for action, stats in summary['latency'].items():
+        print(f"{action:<28} n={stats['count']:<6} p50={stats['p50_ms']:8.2f}ms  "
+              f"p99={stats['p99_ms']:8.2f}ms  max={stats['max_ms']:8.2f}ms")
+    for divergence in summary['divergences'][:args.show]:
+        print("-" * 60)
+        print(f"不一致: 连接 {divergence['connection']} 请求 {divergence['id']} ({divergence['action']})")
+        print(f"  抓包: {json.dumps(divergence['expected'], ensure_ascii=False)[:500]}")
+        print(f"  回放: {json.dumps(divergence['actual'], ensure_ascii=False)[:500]}")
+
+if __name__ == "__main__":
+    main()
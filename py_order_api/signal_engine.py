@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import time
+
+from order_normalizer import normalize_volume
+from order_scheduler import OrderRejected, OutcomeUnknown, PRIORITY_OPEN, PRIORITY_CLOSE
+
+logger = logging.getLogger(__name__)
+
+# ATAS OrderLogStrategy 推送的持仓变化类型
+SIGNAL_LONG = '开多'
+SIGNAL_SHORT = '开空'
+SIGNAL_FLAT = '平仓'
+
+# mt5.TRADE_RETCODE_DONE
+TRADE_RETCODE_DONE = 10009
+
+_EPSILON = 1e-9
+
+class SymbolSignalState:
+    """单个MT5品种的信号状态"""
+
+    __slots__ = ('symbol', 'security', 'target', 'executed', 'updates', 'scheduled',
+                 'lock', 'last_update', 'last_signal')
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.security = None
+        self.target = 0.0          # ATAS最新的目标净持仓（MT5手数，多为正空为负）
+        self.executed = None       # 已在MT5执行的净持仓，None表示尚未从MT5读取
+        self.updates = 0           # 当前合并窗口内收到的更新数
+        self.scheduled = False
+        self.lock = asyncio.Lock()
+        self.last_update = None
+        self.last_signal = None    # 最近一次持仓更新的原始参数
+
+class SignalEngine:
+    """
+    ATAS持仓信号引擎
+    将position_update推送转换为目标净持仓，在合并窗口结束后按目标与已执行持仓的差额下单：
+    - 开多/开空/平仓在窗口内多次变化只按最终目标执行，开了又平的来回信号不产生任何订单
+    - 目标方向相反时先平仓再反向开仓
+    - 同方向数量变化时加仓或部分平仓
+    """
+
+    def __init__(self, trader, scheduler, symbol_mapper, spec_cache, coalesce_ms=200,
+                 volume_rounding='nearest', wait_connected=None, on_result=None, execution_stats=None):
+        """
+        初始化信号引擎
+
+        Args:
+            trader: MT5Trader
+            scheduler: OrderScheduler，所有下单都通过调度器执行
+            symbol_mapper: 符号映射器
+            spec_cache: 品种规格缓存，用于规范化差额交易量
+            coalesce_ms: 合并窗口（毫秒），0表示收到后立即执行
+            volume_rounding: 差额交易量对齐步长的取整方式
+            wait_connected: 下单前等待MT5连接的协程函数，返回(是否已连接, 原因)
+            on_result: 每次执行完成后调用的协程函数，参数为结果dict
+            execution_stats: ExecutionStats，记录信号延迟、成交耗时和滑点
+        """
+        self.trader = trader
+        self.scheduler = scheduler
+        self.symbol_mapper = symbol_mapper
+        self.spec_cache = spec_cache
+        self.coalesce_ms = coalesce_ms
+        self.volume_rounding = volume_rounding
+        self.wait_connected = wait_connected
+        self.on_result = on_result
+        self.execution_stats = execution_stats
+        self.states = {}
+        self.stats = {'updates': 0, 'flushes': 0, 'coalesced': 0, 'orders': 0, 'failed': 0}
+
+    def target_from_update(self, update):
+        """
+        根据持仓更新计算外部系统的目标净持仓
+
+        Args:
+            update: position_update参数
+
+        Returns:
+            float: 目标净持仓（外部系统手数，多为正空为负）
+        """
+        signal = update.get('action')
+        volume = abs(float(update.get('volume') or 0))
+
+        if signal == SIGNAL_FLAT:
+            return 0.0
+        if signal == SIGNAL_LONG:
+            return volume
+        if signal == SIGNAL_SHORT:
+            return -volume
+        raise ValueError(f'未知的持仓变化类型: {signal}')
+
+    def submit(self, update):
+        """
+        接收一条持仓更新，在合并窗口结束后执行
+
+        Args:
+            update: position_update参数（action/security/volume/averagePrice/timestamp）
+
+        Returns:
+            dict: 映射后的品种和目标持仓
+        """
+        security = update.get('security')
+        if not security:
+            raise ValueError('缺少必要参数: security')
+
+        external_target = self.target_from_update(update)
+        symbol = self.symbol_mapper.map_to_mt5(security)
+        target = self.symbol_mapper.map_volume(security, external_target)
+
+        state = self.states.get(symbol)
+        if state is None:
+            state = self.states[symbol] = SymbolSignalState(symbol)
+        state.security = security
+        state.target = target
+        state.updates += 1
+        state.last_update = time.time()
+        state.last_signal = update
+        self.stats['updates'] += 1
+        if self.execution_stats is not None:
+            self.execution_stats.record_signal(symbol, update, state.last_update)
+
+        logger.info(f"收到持仓更新: {security} {update.get('action')} {update.get('volume')} -> {symbol} 目标净持仓 {target}")
+
+        if not state.scheduled:
+            state.scheduled = True
+            asyncio.get_running_loop().call_later(
+                self.coalesce_ms / 1000,
+                lambda: asyncio.ensure_future(self._flush(state))
+            )
+
+        return {'symbol': symbol, 'target': target, 'coalesce_ms': self.coalesce_ms}
+
+    def is_busy(self, symbol):
+        """品种是否有等待合并或正在执行的信号"""
+        state = self.states.get(symbol)
+        return state is not None and (state.scheduled or state.lock.locked())
+
+    def resync(self, symbol):
+        """
+        丢弃已执行持仓，从MT5重新读取后按目标持仓补单（持仓对账发现偏差时使用）
+
+        Args:
+            symbol: MT5品种
+
+        Returns:
+            bool: 是否已安排执行
+        """
+        state = self.states.get(symbol)
+        if state is None or state.scheduled:
+            return False
+        state.executed = None
+        state.scheduled = True
+        asyncio.ensure_future(self._flush(state))
+        return True
+
+    async def _run(self, state, job, priority, description):
+        """通过调度器在交易线程中执行"""
+        result, timing = await self.scheduler.submit(
+            job,
+            lane=state.symbol,
+            priority=priority,
+            description=description
+        )
+        return result
+
+    def _record_fill(self, symbol, signal, received, order):
+        """把成交的订单与触发它的信号关联，统计成交耗时和滑点（结果附加到订单中推送）"""
+        if self.execution_stats is None or not order['success'] or signal is None:
+            return
+        try:
+            order.update(self.execution_stats.record_fill(symbol, signal, received, order))
+        except Exception as e:
+            logger.error(f"记录信号执行统计时出错: {symbol} {str(e)}")
+
+    def _normalize(self, symbol, volume):
+        """规范化差额交易量，不自动放大到最小交易量以免超出目标持仓"""
+        spec = self.spec_cache.get(symbol) if self.spec_cache is not None else None
+        if not spec:
+            return abs(volume), None
+        return normalize_volume(volume, spec, self.volume_rounding, clamp=False)
+
+    async def _flush(self, state):
+        """合并窗口结束，按目标持仓与已执行持仓的差额下单"""
+        async with state.lock:
+            state.scheduled = False
+            updates, state.updates = state.updates, 0
+            # 本次执行对应的信号（合并窗口内最后一条）及其到达时间
+            signal, received = state.last_signal, state.last_update
+            symbol = state.symbol
+            self.stats['flushes'] += 1
+            orders = []
+            event = {'event': 'signal_result', 'symbol': symbol, 'security': state.security,
+                     'updates': updates, 'orders': orders}
+
+            try:
+                if self.wait_connected is not None:
+                    connected, reason = await self.wait_connected()
+                    if not connected:
+                        raise RuntimeError(reason)
+
+                if state.executed is None:
+                    state.executed = await self._run(
+                        state, lambda: self.trader.get_net_position(symbol), PRIORITY_CLOSE, f"读取净持仓 {symbol}"
+                    )
+
+                target = state.target
+                executed = state.executed
+                event['target'] = target
+
+                if abs(target - executed) < _EPSILON:
+                    self.stats['coalesced'] += updates
+                    logger.info(f"持仓更新已合并，无需下单: {symbol} 目标={target} 已执行={executed} (合并 {updates} 条)")
+                    event.update({'status': 'success', 'executed': executed})
+                    return
+
+                # 平仓或反向：先平掉当前持仓
+                if abs(executed) > _EPSILON and (abs(target) < _EPSILON or (target > 0) != (executed > 0)):
+                    ok = await self._run(
+                        state, lambda: self.trader.close_positions_by_symbol(symbol), PRIORITY_CLOSE, f"信号平仓 {symbol}"
+                    )
+                    orders.append({'action': 'close', 'volume': abs(executed), 'success': bool(ok)})
+                    self._record_fill(symbol, signal, received, orders[-1])
+                    self.stats['orders'] += 1
+                    if not ok:
+                        raise RuntimeError(f'平仓失败: {symbol}')
+                    executed = state.executed = 0.0
+
+                if abs(target) > _EPSILON:
+                    if abs(executed) < _EPSILON or abs(target) > abs(executed):
+                        # 开仓或加仓
+                        order_type = 'BUY' if target > 0 else 'SELL'
+                        volume, reason = self._normalize(symbol, abs(target) - abs(executed))
+                        if volume is None:
+                            raise RuntimeError(f'差额交易量无效: {reason}')
+                        result = await self._run(
+                            state,
+                            lambda: self.trader.open_position(
+                                symbol=symbol, order_type=order_type, volume=volume,
+                                deviation=100, comment="ATAS信号"
+                            ),
+                            PRIORITY_OPEN,
+                            f"信号开仓 {symbol} {order_type} {volume}"
+                        )
+                        ok = result is not None and result.retcode == TRADE_RETCODE_DONE
+                        orders.append({
+                            'action': 'open', 'type': order_type, 'volume': volume, 'success': ok,
+                            'from_flat': abs(executed) < _EPSILON,
+                            'ticket': result.order if ok else None,
+                            'price': result.price if ok else None,
+                            'retcode': result.retcode if result is not None else None
+                        })
+                        self._record_fill(symbol, signal, received, orders[-1])
+                        self.stats['orders'] += 1
+                        if not ok:
+                            raise RuntimeError(f'开仓失败: {symbol}')
+                        filled = result.volume or volume
+                        executed = state.executed = round(executed + (filled if target > 0 else -filled), 8)
+                    else:
+                        # 同方向减仓
+                        volume, reason = self._normalize(symbol, abs(executed) - abs(target))
+                        if volume is None:
+                            raise RuntimeError(f'差额交易量无效: {reason}')
+                        ok = await self._run(
+                            state, lambda: self.trader.reduce_position(symbol, volume), PRIORITY_CLOSE,
+                            f"信号减仓 {symbol} {volume}"
+                        )
+                        orders.append({'action': 'reduce', 'volume': volume, 'success': bool(ok)})
+                        self._record_fill(symbol, signal, received, orders[-1])
+                        self.stats['orders'] += 1
+                        if not ok:
+                            raise RuntimeError(f'减仓失败: {symbol}')
+                        executed = state.executed = round(executed - volume if executed > 0 else executed + volume, 8)
+
+                event.update({'status': 'success', 'executed': executed})
+                logger.info(f"持仓信号执行完成: {symbol} 目标={target} 已执行={executed}, 订单数={len(orders)}")
+
+            except OrderRejected as e:
+                self.stats['failed'] += 1
+                event.update({'status': 'error', 'message': str(e), 'reason': e.reason})
+                logger.warning(f"持仓信号被拒绝: {symbol} {str(e)}")
+            except Exception as e:
+                self.stats['failed'] += 1
+                # 执行失败后重新从MT5读取实际持仓
+                state.executed = None
+                event.update({'status': 'error', 'message': str(e)})
+                if isinstance(e, OutcomeUnknown):
+                    event['reason'] = e.reason
+                logger.error(f"持仓信号执行失败: {symbol} {str(e)}")
+            finally:
+                if self.on_result is not None:
+                    try:
+                        await self.on_result(event)
+                    except Exception as e:
+                        logger.exception(f"推送信号执行结果时出错: {str(e)}")
+
+    def status(self):
+        """获取信号引擎状态"""
+        return {
+            'stats': dict(self.stats),
+            'symbols': {
+                symbol: {
+                    'security': state.security,
+                    'target': state.target,
+                    'executed': state.executed,
+                    'pending': state.scheduled,
+                    'last_update': state.last_update
+                }
+                for symbol, state in self.states.items()
+            }
+        }
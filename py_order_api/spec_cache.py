@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+import logging
+
+from records import SymbolSpec
+
+logger = logging.getLogger(__name__)
+
+class SymbolSpecCache:
+    """
+    交易品种规格缓存
+    保存volume_min/volume_step/tick_size等静态规格，并持久化到磁盘，
+    下次启动时无需等待MT5即可使用上一次运行的规格
+    """
+
+    # 需要缓存的symbol_info字段
+    FIELDS = SymbolSpec.__slots__
+
+    def __init__(self, cache_file='symbol_specs.json'):
+        """
+        初始化品种规格缓存
+
+        Args:
+            cache_file: 缓存文件路径
+        """
+        self.cache_file = cache_file
+        self.specs = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """从磁盘加载上一次运行保存的品种规格"""
+        try:
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, 'r') as f:
+                    specs = json.load(f)
+                if isinstance(specs, dict):
+                    specs = {symbol: SymbolSpec.from_dict(spec) for symbol, spec in specs.items()}
+                    with self._lock:
+                        self.specs = specs
+                    logger.info(f"已从 {self.cache_file} 加载 {len(specs)} 个品种规格")
+        except Exception as e:
+            logger.error(f"加载品种规格缓存时出错: {str(e)}")
+
+    def save(self):
+        """
+        将品种规格写入磁盘（先写临时文件再替换，避免写入一半时崩溃损坏缓存）
+
+        Returns:
+            bool: 是否保存成功
+        """
+        try:
+            with self._lock:
+                data = {symbol: spec.to_dict() for symbol, spec in self.specs.items()}
+            tmp_file = self.cache_file + '.tmp'
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f, indent=4)
+            os.replace(tmp_file, self.cache_file)
+            logger.info(f"品种规格已保存到 {self.cache_file}")
+            return True
+        except Exception as e:
+            logger.error(f"保存品种规格缓存时出错: {str(e)}")
+            return False
+
+    def get(self, symbol):
+        """
+        获取品种规格
+
+        Args:
+            symbol: MT5交易品种
+
+        Returns:
+            SymbolSpec: 品种规格，不存在则返回None
+        """
+        return self.specs.get(symbol)
+
+    @classmethod
+    def spec_from_info(cls, symbol_info):
+        """
+        从mt5.symbol_info的返回值中提取品种规格
+
+        Args:
+            symbol_info: mt5.symbol_info返回的对象
+
+        Returns:
+            SymbolSpec: 品种规格
+        """
+        return SymbolSpec.from_mt5(symbol_info)
+
+    def update_from_info(self, symbol, symbol_info):
+        """
+        使用mt5.symbol_info的返回值更新品种规格
+
+        Args:
+            symbol: MT5交易品种
+            symbol_info: mt5.symbol_info返回的对象
+
+        Returns:
+            SymbolSpec: 更新后的品种规格
+        """
+        spec = self.spec_from_info(symbol_info)
+        with self._lock:
+            self.specs[symbol] = spec
+        return spec
+
+    def symbols(self):
+        """获取已缓存的所有品种"""
+        return list(self.specs.keys())
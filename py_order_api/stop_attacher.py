@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+
+from metrics import REGISTRY
+from order_scheduler import OrderRejected, PRIORITY_CLOSE
+
+logger = logging.getLogger(__name__)
+
+STOPS_ATTACHED = REGISTRY.counter('stops_attach_total', '开仓成交后设置止损止盈的结果', ('status',))
+STOPS_UNPROTECTED = REGISTRY.histogram('stops_unprotected_seconds', '开仓从成交到止损止盈设置完成的时间（秒）')
+
+# _classify的返回值: 退避后重试
+RETRY = 'retry'
+
+# mt5.TRADE_RETCODE_DONE / TRADE_RETCODE_NO_CHANGES / TRADE_RETCODE_POSITION_CLOSED
+TRADE_RETCODE_DONE = 10009
+TRADE_RETCODE_NO_CHANGES = 10025
+TRADE_RETCODE_POSITION_CLOSED = 10036
+
+# 可以重试的返回码: 重新报价 / 超时 / 止损止盈无效（价格变化后可能有效）/ 价格变化 / 无报价 / 请求过于频繁 / 无连接
+RETRY_RETCODES = (10004, 10012, 10016, 10020, 10021, 10024, 10031)
+
+class StopAttacher(ABC):
+    """
+    开仓成交后在后台设置止损止盈
+    市价单不带止损止盈立即成交，之后由子类按实际成交结果发送修改请求，
+    失败时在重试次数内退避重试，完成后推送stops_result事件
+    子类实现_attempt（发送一次修改请求）和_classify（按返回码判断结果）
+    """
+
+    # 除attached外的最终状态
+    OUTCOMES = ('failed',)
+
+    def __init__(self, max_attempts=5, retry_ms=200, on_result=None):
+        """
+        初始化
+
+        Args:
+            max_attempts: 最大发送次数（含第一次）
+            retry_ms: 重试退避基础间隔（毫秒），每次翻倍
+            on_result: 完成后调用的协程函数，参数为结果dict
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.retry_ms = retry_ms
+        self.on_result = on_result
+        self.pending = {}
+        self.recent = deque(maxlen=50)
+        self.stats = dict({'submitted': 0, 'attached': 0, 'retries': 0}, **{outcome: 0 for outcome in self.OUTCOMES})
+
+    def _submit(self, key, state, request):
+        """
+        开始在后台设置止损止盈
+
+        Args:
+            key: 订单号或持仓票据
+            state: 推送的stops_result事件字段
+            request: 每次尝试使用的参数（客户端请求的值，不被上一次计算的结果覆盖）
+
+        Returns:
+            dict: 开仓响应中返回的止损止盈状态
+        """
+        state = dict({'event': 'stops_result', 'status': 'pending'}, **state, attempts=0)
+        self.pending[key] = state
+        self.stats['submitted'] += 1
+        asyncio.create_task(self._run(key, state, request, time.perf_counter()))
+        return {'status': 'pending', 'max_attempts': self.max_attempts}
+
+    @abstractmethod
+    async def _attempt(self, state, request):
+        """发送一次修改请求，更新state中的sl/tp/message等，返回返回码（未能发送为None）"""
+
+    @abstractmethod
+    def _classify(self, retcode):
+        """按返回码判断结果: attached / RETRY / OUTCOMES中的状态"""
+
+    def _describe(self, state):
+        """日志中的订单描述"""
+        return state['symbol']
+
+    async def _run(self, key, state, request, filled_at):
+        description = self._describe(state)
+        for attempt in range(1, self.max_attempts + 1):
+            state['attempts'] = attempt
+            try:
+                retcode = await self._attempt(state, request)
+            except Exception as e:
+                retcode = None
+                state['message'] = str(e)
+                logger.exception(f"设置止损止盈时出错: {description} {str(e)}")
+            state['retcode'] = retcode
+
+            status = self._classify(retcode)
+            if status != RETRY:
+                state['status'] = status
+                break
+            if attempt >= self.max_attempts:
+                state['status'] = 'failed'
+                break
+
+            self.stats['retries'] += 1
+            backoff_ms = self.retry_ms * (2 ** (attempt - 1))
+            logger.warning(f"设置止损止盈失败({retcode}: {state.get('message')})，{backoff_ms:.0f}ms后重试: {description}")
+            await asyncio.sleep(backoff_ms / 1000)
+
+        elapsed = time.perf_counter() - filled_at
+        state['elapsed_ms'] = round(elapsed * 1000, 3)
+        self.pending.pop(key, None)
+        self.recent.append(state)
+        self.stats[state['status']] += 1
+        STOPS_ATTACHED.inc(state['status'])
+        if state['status'] == 'attached':
+            STOPS_UNPROTECTED.observe(elapsed)
+            logger.info(f"止损止盈已设置: {description} sl={state['sl']} tp={state['tp']}, "
+                        f"成交后 {state['elapsed_ms']}ms, 第{state['attempts']}次")
+        else:
+            logger.error(f"持仓止损止盈未能设置: {description} 状态={state['status']} "
+                         f"错误码={state.get('retcode')} {state.get('message', '')}")
+
+        if self.on_result is not None:
+            try:
+                await self.on_result(dict(state))
+            except Exception as e:
+                logger.exception(f"推送止损止盈结果时出错: {str(e)}")
+
+    def status(self):
+        """获取状态"""
+        return {
+            'stats': dict(self.stats),
+            'pending': list(self.pending.values()),
+            'recent': list(self.recent)
+        }
+
+class MT5StopAttacher(StopAttacher):
+    """
+    MT5两阶段开仓的第二阶段
+    按订单的成交记录找到所在的持仓（净额账户中加仓订单的票据不是持仓票据），按持仓均价和持仓量计算止盈
+    并发送TRADE_ACTION_SLTP，与其他交易请求一样通过调度器按品种顺序执行
+    """
+
+    OUTCOMES = ('failed', 'position_closed')
+
+    def __init__(self, trader, scheduler, max_attempts=5, retry_ms=200, on_result=None):
+        """
+        初始化
+
+        Args:
+            trader: MT5Trader
+            scheduler: OrderScheduler
+            max_attempts: 最大发送次数（含第一次）
+            retry_ms: 重试退避基础间隔（毫秒），每次翻倍
+            on_result: 完成后调用的协程函数，参数为结果dict
+        """
+        super().__init__(max_attempts, retry_ms, on_result)
+        self.trader = trader
+        self.scheduler = scheduler
+
+    def attach(self, symbol, order, order_type, volume, fill_price, sl=0.0, tp=0.0, profit_amount=0.0):
+        """
+        为刚成交的开仓订单所在的持仓在后台设置止损止盈
+
+        Args:
+            symbol: MT5品种
+            order: 开仓订单号
+            order_type: BUY或SELL
+            volume: 实际成交量
+            fill_price: 实际成交价
+            sl: 止损价格，0表示不设置
+            tp: 止盈价格，0表示不设置
+            profit_amount: 目标盈利金额，大于0时按持仓均价计算止盈
+
+        Returns:
+            dict: 开仓响应中返回的止损止盈状态
+        """
+        return self._submit(order, {
+            'symbol': symbol, 'order': order, 'ticket': None, 'type': order_type, 'volume': volume, 'fill_price': fill_price,
+            'profit_amount': profit_amount or None, 'sl': sl, 'tp': tp
+        }, {'sl': sl, 'tp': tp, 'profit_amount': profit_amount or 0.0})
+
+    async def _attempt(self, state, request):
+        symbol = state['symbol']
+        order = state['order']
+        try:
+            result, ticket, sl, tp = (await self.scheduler.submit(
+                lambda: self.trader.attach_stops(
+                    order, symbol, request['sl'], request['tp'], request['profit_amount']
+                ),
+                lane=symbol,
+                priority=PRIORITY_CLOSE,
+                description=f"设置止损止盈 {symbol} 订单={order}"
+            ))[0]
+        except OrderRejected as e:
+            state['message'] = str(e)
+            return TRADE_RETCODE_POSITION_CLOSED if e.reason == 'position_closed' else None
+        state['ticket'], state['sl'], state['tp'] = ticket, sl, tp
+        if result is None:
+            return None
+        state['message'] = result.comment
+        return result.retcode
+
+    def _classify(self, retcode):
+        if retcode in (TRADE_RETCODE_DONE, TRADE_RETCODE_NO_CHANGES):
+            return 'attached'
+        if retcode == TRADE_RETCODE_POSITION_CLOSED:
+            return 'position_closed'
+        if retcode is None or retcode in RETRY_RETCODES:
+            return RETRY
+        return 'failed'
+
+    def _describe(self, state):
+        return f"{state['symbol']} 订单={state['order']}"
@@ -244,6 +244,14 @@ class SymbolMapper:
             logger.error(f"保存符号映射时出错: {str(e)}")
             return False
     
+    def get_mt5_symbols(self):
+        """获取所有映射到的MT5符号（去重，保持配置顺序）"""
+        symbols = []
+        for mapping_info in self.symbol_mapping.values():
+            if mapping_info["symbol"] not in symbols:
+                symbols.append(mapping_info["symbol"])
+        return symbols
+    
     def get_all_mappings(self):
         """获取所有符号映射关系"""
         return self.symbol_mapping
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 文件头: 标识、版本、记录大小、记录数，填充到64字节
+HEADER = struct.Struct('<8sIIQ')
+HEADER_SIZE = 64
+MAGIC = b'TICKREC1'
+VERSION = 1
+
+# 每条记录: time_msc(int64) bid(float64) ask(float64)
+RECORD_DTYPE = [('time_msc', '<i8'), ('bid', '<f8'), ('ask', '<f8')]
+RECORD_SIZE = 24
+
+# 文件每次扩容的记录数
+GROW_RECORDS = 65536
+
+_DAY_MS = 86400 * 1000
+
+def _np():
+    """numpy随MetaTrader5一起安装，延迟导入以免拖慢服务启动"""
+    import numpy
+    return numpy
+
+def day_of(time_msc):
+    """时间戳（毫秒）所在的日期，如20240102"""
+    return time.strftime('%Y%m%d', time.gmtime(time_msc // 1000))
+
+def tick_path(directory, symbol, day):
+    """品种某一天的Tick文件路径"""
+    return os.path.join(directory, symbol, f'{day}.ticks')
+
+class TickFile:
+    """
+    单个品种单日的定长记录文件（内存映射）
+    先写入记录再更新文件头中的记录数，读取方不会看到写了一半的记录
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        exists = os.path.exists(path) and os.path.getsize(path) >= HEADER_SIZE
+        self._file = open(path, 'r+b' if exists else 'w+b')
+        if not exists:
+            self._file.truncate(HEADER_SIZE + GROW_RECORDS * RECORD_SIZE)
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+
+        if exists:
+            magic, version, record_size, count = HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC or record_size != RECORD_SIZE:
+                raise ValueError(f'不是有效的Tick文件: {path}')
+            self.count = count
+        else:
+            self.count = 0
+            HEADER.pack_into(self._mmap, 0, MAGIC, VERSION, RECORD_SIZE, 0)
+
+    @property
+    def capacity(self):
+        return (len(self._mmap) - HEADER_SIZE) // RECORD_SIZE
+
+    def tail(self):
+        """
+        最后一条记录的时间（毫秒）及文件末尾该毫秒内的记录数
+
+        Returns:
+            tuple: (时间, 记录数)，没有记录返回(None, 0)
+        """
+        last = None
+        same = 0
+        for index in range(self.count - 1, -1, -1):
+            time_msc = struct.unpack_from('<q', self._mmap, HEADER_SIZE + index * RECORD_SIZE)[0]
+            if last is not None and time_msc != last:
+                break
+            last = time_msc
+            same += 1
+        return last, same
+
+    def _grow(self, needed):
+        """
+        扩容文件
+        Windows上文件被映射时不能改变大小：扩容失败时恢复映射并抛出异常，
+        记录器不更新已记录位置，这批Tick在下次拉取时重新写入
+        """
+        capacity = self.capacity
+        while capacity < needed:
+            capacity += GROW_RECORDS
+        self._mmap.close()
+        try:
+            self._file.truncate(HEADER_SIZE + capacity * RECORD_SIZE)
+        finally:
+            self._mmap = mmap.mmap(self._file.fileno(), 0)
+
+    def append(self, time_msc, bid, ask):
+        """
+        追加记录
+
+        Args:
+            time_msc / bid / ask: 等长的数组（numpy数组或序列）
+        """
+        n = len(time_msc)
+        if not n:
+            return
+        if self.count + n > self.capacity:
+            self._grow(self.count + n)
+
+        np = _np()
+        records = np.frombuffer(self._mmap, dtype=RECORD_DTYPE, count=n,
+                                offset=HEADER_SIZE + self.count * RECORD_SIZE)
+        records['time_msc'] = time_msc
+        records['bid'] = bid
+        records['ask'] = ask
+        # 释放对映射内存的引用，之后才能扩容或关闭
+        del records
+
+        self.count += n
+        struct.pack_into('<Q', self._mmap, HEADER.size - 8, self.count)
+
+    def close(self):
+        self._mmap.flush()
+        self._mmap.close()
+        self._file.close()
+
+class TickRecorder:
+    """
+    Tick记录器
+    后台线程按间隔用copy_ticks_from拉取每个品种自上次以来的全部Tick，
+    追加到按品种、按日（UTC）分段的内存映射文件
+    """
+
+    def __init__(self, mt5, symbols, directory='ticks', poll_ms=100, batch=100000, active=None):
+        """
+        初始化记录器
+
+        Args:
+            mt5: MetaTrader5模块
+            symbols: 函数，返回需要记录的MT5品种（品种映射变化后自动跟随）
+            directory: 文件目录
+            poll_ms: 拉取间隔（毫秒）
+            batch: 每次每个品种最多拉取的Tick数
+            active: 函数，返回False时跳过本次拉取（如MT5未连接）
+        """
+        self.mt5 = mt5
+        self.symbols = symbols
+        self.active = active
+        self.directory = directory
+        self.poll_interval = poll_ms / 1000
+        self.batch = batch
+        self._files = {}       # symbol -> (day, TickFile)
+        self._last = {}        # symbol -> (已记录的最后时间（毫秒）, 该毫秒内已记录的Tick数)
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'records': 0, 'polls': 0, 'errors': 0}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='tick-recorder', daemon=True)
+        self._thread.start()
+        logger.info("Tick记录已启动: %s", self.directory)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for _, tick_file in self._files.values():
+            tick_file.close()
+        self._files.clear()
+
+    def _file_for(self, symbol, day):
+        current = self._files.get(symbol)
+        if current is not None and current[0] == day:
+            return current[1]
+        if current is not None:
+            current[1].close()
+        tick_file = TickFile(tick_path(self.directory, symbol, day))
+        self._files[symbol] = (day, tick_file)
+        return tick_file
+
+    def _start_time(self, symbol):
+        """从今天已记录的最后一条继续，没有则从当前时间开始（不回补历史）"""
+        now_ms = int(time.time() * 1000)
+        tick_file = self._file_for(symbol, day_of(now_ms))
+        last, same = tick_file.tail()
+        return (last, same) if last is not None else (now_ms, 0)
+
+    def _poll(self, symbol):
+        position = self._last.get(symbol)
+        if position is None:
+            position = self._last[symbol] = self._start_time(symbol)
+        last, same = position
+
+        # 从last所在的秒开始拉取，返回结果包含last这一毫秒内的全部Tick
+        ticks = self.mt5.copy_ticks_from(symbol, last // 1000, self.batch, self.mt5.COPY_TICKS_INFO)
+        if ticks is None or not len(ticks):
+            return 0
+
+        # 同一毫秒内可能有多个Tick：last之前的跳过，last这一毫秒内只跳过已记录的same条
+        np = _np()
+        fetched = ticks['time_msc']
+        start = int(np.searchsorted(fetched, last, side='left'))
+        start += min(same, int(np.searchsorted(fetched, last, side='right')) - start)
+        ticks = ticks[start:]
+        if not len(ticks):
+            return 0
+
+        times = ticks['time_msc']
+        days = times // _DAY_MS
+        # 按日切分（Tick按时间排序，只需要找到日期变化的位置）
+        boundaries = np.flatnonzero(np.diff(days)) + 1
+        for start, end in zip(np.r_[0, boundaries], np.r_[boundaries, len(ticks)]):
+            part = ticks[start:end]
+            tick_file = self._file_for(symbol, day_of(int(part['time_msc'][0])))
+            tick_file.append(part['time_msc'], part['bid'], part['ask'])
+
+        newest = int(times[-1])
+        self._last[symbol] = (newest, len(fetched) - int(np.searchsorted(fetched, newest, side='left')))
+        return len(ticks)
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            if self.active is not None and not self.active():
+                continue
+            self.stats['polls'] += 1
+            for symbol in self.symbols():
+                try:
+                    self.stats['records'] += self._poll(symbol)
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    logger.error("记录Tick时出错: %s %s", symbol, e)
+
+    def status(self):
+        """获取记录器状态"""
+        return {
+            'directory': self.directory,
+            'last_time_msc': {symbol: last for symbol, (last, _) in self._last.items()},
+            'stats': dict(self.stats)
+        }
+
+class TickReader:
+    """
+    Tick文件读取器
+    返回直接映射文件内容的numpy结构化数组（不复制），按时间二分查找
+    只映射文件中已写入的部分；Windows上文件被映射时记录器不能扩容该文件，
+    返回的视图不要长期保留（用完即释放，需要保留时copy()）
+    """
+
+    def __init__(self, directory='ticks'):
+        self.directory = directory
+
+    def day(self, symbol, day):
+        """
+        读取品种某一天的全部Tick
+
+        Args:
+            symbol: MT5品种
+            day: 日期，如"20240102"
+
+        Returns:
+            numpy.ndarray: time_msc/bid/ask结构化数组（只读视图，只映射已写入的记录），文件不存在返回空数组
+        """
+        np = _np()
+        path = tick_path(self.directory, symbol, day)
+        if not os.path.exists(path):
+            return np.empty(0, dtype=RECORD_DTYPE)
+        with open(path, 'rb') as f:
+            magic, version, record_size, count = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or record_size != RECORD_SIZE:
+                raise ValueError(f'不是有效的Tick文件: {path}')
+            if not count:
+                return np.empty(0, dtype=RECORD_DTYPE)
+            mapped = mmap.mmap(f.fileno(), HEADER_SIZE + count * RECORD_SIZE, access=mmap.ACCESS_READ)
+        return np.frombuffer(mapped, dtype=RECORD_DTYPE, count=count, offset=HEADER_SIZE)
+
+    def range(self, symbol, from_ms, to_ms):
+        """
+        读取时间范围内的Tick
+
+        Args:
+            symbol: MT5品种
+            from_ms: 开始时间（毫秒，含）
+            to_ms: 结束时间（毫秒，不含）
+
+        Returns:
+            list: 每天一个numpy视图
+        """
+        np = _np()
+        views = []
+        for day_index in range(from_ms // _DAY_MS, (to_ms - 1) // _DAY_MS + 1):
+            ticks = self.day(symbol, day_of(day_index * _DAY_MS))
+            if not len(ticks):
+                continue
+            times = ticks['time_msc']
+            start = np.searchsorted(times, from_ms, side='left')
+            end = np.searchsorted(times, to_ms, side='left')
+            if end > start:
+                views.append(ticks[start:end])
+        return views
+
+    def at(self, symbol, time_ms):
+        """
+        获取某一时刻终端显示的报价（该时刻及之前的最后一个Tick）
+
+        Args:
+            symbol: MT5品种
+            time_ms: 时间（毫秒）
+
+        Returns:
+            numpy.void: (time_msc, bid, ask)，当天该时刻之前没有Tick则返回None
+        """
+        np = _np()
+        ticks = self.day(symbol, day_of(time_ms))
+        index = np.searchsorted(ticks['time_msc'], time_ms, side='right') - 1
+        return ticks[index] if index >= 0 else None
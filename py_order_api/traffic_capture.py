@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import itertools
+import json
+import logging
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+# 文件头
+MAGIC = b'WSCAP1\n'
+
+# 每条记录: 时间(time_ns, int64) + 连接编号(uint32) + 类型(1字节) + 数据长度(uint32)，随后是UTF-8数据
+RECORD = struct.Struct('<qIcI')
+
+# 记录类型
+INBOUND = b'I'     # 客户端发来的消息
+OUTBOUND = b'O'    # 服务端的响应
+CLOSED = b'C'      # 连接关闭
+
+# 写入前替换为REDACTED的请求参数（管理令牌、登录密码等），抓包文件可以作为基准测试数据分享
+SECRET_PARAMS = ('token', 'admin_token', 'password', 'api_key', 'api_secret')
+REDACTED = '***'
+
+def redact(message):
+    """
+    替换请求中的敏感参数
+
+    Args:
+        message: 客户端发来的消息文本
+
+    Returns:
+        str: 不含敏感参数值的消息文本（没有敏感参数时原样返回）
+    """
+    # 绝大多数消息不含敏感参数，先按文本判断，避免每条消息都解析JSON
+    if not any(f'"{name}"' in message for name in SECRET_PARAMS):
+        return message
+    try:
+        data = json.loads(message)
+    except ValueError:
+        return message
+    if not isinstance(data, dict):
+        return message
+    for container in (data, data.get('params')):
+        if isinstance(container, dict):
+            for name in SECRET_PARAMS:
+                if name in container:
+                    container[name] = REDACTED
+    return json.dumps(data, ensure_ascii=False)
+
+class TrafficCapture:
+    """
+    抓取WebSocket收发的消息到紧凑的二进制文件，供replay_capture.py回放
+    写入带缓冲，后台任务每秒刷新一次，不在每条消息上触发磁盘IO
+    """
+
+    def __init__(self, path, flush_interval=1.0):
+        """
+        初始化抓包
+
+        Args:
+            path: 抓包文件路径（追加写入）
+            flush_interval: 刷新到磁盘的间隔（秒）
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self._file = open(path, 'ab', buffering=1024 * 1024)
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._ids = {}
+        self._next_id = itertools.count(1)
+        self.records = 0
+
+    def _connection_id(self, websocket):
+        connection_id = self._ids.get(websocket)
+        if connection_id is None:
+            connection_id = self._ids[websocket] = next(self._next_id)
+        return connection_id
+
+    def write(self, websocket, kind, message):
+        """
+        记录一条消息
+
+        Args:
+            websocket: WebSocket连接
+            kind: INBOUND/OUTBOUND
+            message: 消息文本（INBOUND消息中的敏感参数会被替换）
+        """
+        if kind == INBOUND and isinstance(message, str):
+            message = redact(message)
+        data = message.encode('utf-8') if isinstance(message, str) else bytes(message)
+        self._file.write(RECORD.pack(time.time_ns(), self._connection_id(websocket), kind, len(data)))
+        self._file.write(data)
+        self.records += 1
+
+    def closed(self, websocket):
+        """记录连接关闭"""
+        connection_id = self._ids.pop(websocket, None)
+        if connection_id is not None:
+            self._file.write(RECORD.pack(time.time_ns(), connection_id, CLOSED, 0))
+
+    async def run(self):
+        """定期刷新到磁盘"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self._file.flush()
+            except Exception as e:
+                logger.error(f"写入抓包文件时出错: {str(e)}")
+
+    def close(self):
+        self._file.close()
+
+    def status(self):
+        """获取抓包状态"""
+        return {'path': self.path, 'records': self.records, 'connections': len(self._ids)}
+
+def read_capture(path):
+    """
+    读取抓包文件
+
+    Args:
+        path: 抓包文件路径
+
+    Yields:
+        tuple: (time_ns, 连接编号, 类型, 消息文本)
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'不是有效的抓包文件: {path}')
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            time_ns, connection_id, kind, length = RECORD.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                # 进程退出时最后一条可能没写完整
+                return
+            yield time_ns, connection_id, kind, data.decode('utf-8')
@@ -2,48 +2,203 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
+import atexit
+import hmac
 import json
 import logging
+import multiprocessing
 import os
 import sys
+import time
+from http import HTTPStatus
 import websockets
-import MetaTrader5 as mt5
-from mt5_trader import MT5Trader
+from log_setup import setup_logging
+from lazy_import import preload, get_import_times
+from mt5_trader import MT5Trader, mt5, mt5_module, select_backend
+from metrics import REGISTRY
 from symbol_mapper import get_mapper
+from spec_cache import SymbolSpecCache
+from connection_supervisor import ConnectionSupervisor
+from order_normalizer import normalize_volume
+from signal_engine import SignalEngine
+from order_aggregator import OpenAggregator
+from profiler import ProfileSession, MODE_SAMPLE
+from loop_monitor import LoopLagMonitor
+from read_cache import ReadCache
+from history_store import HistoryStore
+from market_data import stream_array, DEFAULT_CHUNK_BYTES
+from tick_recorder import TickRecorder
+from execution_stats import ExecutionStats
+from traffic_capture import TrafficCapture, INBOUND, OUTBOUND
+from stop_attacher import MT5StopAttacher
+from position_reconciler import PositionReconciler
+from broker_process import BrokerProxy
+from records import json_default
+from order_scheduler import (
+    OrderScheduler, OrderRejected, BrokerError, OutcomeUnknown, request_deadline, PRIORITY_OPEN, PRIORITY_CLOSE,
+    GLOBAL_LANE
+)
 
-# 配置日志
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# mt5.TRADE_RETCODE_DONE（使用常量，分进程模式下服务进程不导入MetaTrader5）
+TRADE_RETCODE_DONE = 10009
+
 # 保存所有已连接的WebSocket客户端
 connected_clients = set()
 
-# 加载配置
-try:
-    with open('config.json', 'r') as f:
-        config = json.load(f)
-except FileNotFoundError:
-    logger.error("配置文件不存在！")
-    config = {
-        "mt5_path": "",
-        "server": "",
-        "login": 0,
-        "password": "",
-        "symbol_mapping": {}
-    }
+# 配置（在init_server中加载）
+config = {}
 
-# 获取符号映射配置
-symbol_mapper = get_mapper()
+# 符号映射（在init_server中创建）
+symbol_mapper = None
+
+# 品种规格缓存，持久化到磁盘，下次启动直接复用（在init_server中创建）
+spec_cache = None
 
 # 初始化MT5交易者
 trader = None
 
-def initialize_mt5():
-    """初始化MT5连接"""
-    global trader
+# 分进程模式（process_mode为split）下的交易进程代理，同时也是trader
+broker = None
+
+# 交易进程重启后，重新连接时立即对账（被中断的交易调用可能已经成交）
+reconcile_on_connect = False
+
+# MT5连接守护（在start_server中创建）
+supervisor = None
+
+# 交易请求调度器（在start_server中创建）
+scheduler = None
+
+# ATAS持仓信号引擎（在start_server中创建）
+signal_engine = None
+
+# 开仓请求聚合器（在start_server中创建，open_aggregation_ms为0时不启用）
+aggregator = None
+
+# CPU分析（admin_profile操作，在start_server中创建）
+profile_session = None
+
+# 本地成交/历史订单库（在start_server中创建，history_db为空时不启用）
+history_store = None
+history_lock = None
+
+# 只读请求的合并与短时缓存，交易操作后失效（在init_server中创建）
+read_cache = None
+
+# 会改变账户或持仓状态的操作，完成后清空只读缓存
+TRADING_ACTIONS = ('open_position', 'close_position_by_ticket', 'close_positions_by_symbol', 'close_all_positions')
+
+# 事件循环延迟监控（在start_server中创建，loop_lag_threshold_ms为0时不启用）
+loop_monitor = None
+
+# 收发消息抓包（在start_server中创建，capture_file为空时不启用），用replay_capture.py回放
+traffic_capture = None
+
+# ATAS信号与MT5成交的延迟和滑点统计（在init_server中创建）
+execution_stats = None
+
+# 映射品种的Tick记录（在start_server中创建，tick_record为false时不启用）
+tick_recorder = None
+
+# ATAS预期净持仓与MT5实际持仓的对账（在start_server中创建，reconcile_interval为0时不启用）
+reconciler = None
+
+# 两阶段开仓（entry_mode为two_phase）：open_position带profit_amount时市价单先成交，止盈在后台按持仓均价设置
+# （在start_server中创建）
+stop_attacher = None
+
+# 服务指标（get_metrics和Prometheus /metrics）
+REQUESTS = REGISTRY.counter('ws_requests_total', 'WebSocket请求数', ('action', 'status'))
+REQUEST_ERRORS = REGISTRY.counter('ws_request_errors_total', 'WebSocket请求失败数', ('action', 'reason'))
+REQUEST_SECONDS = REGISTRY.histogram('ws_request_seconds', 'WebSocket请求处理耗时（秒）', ('action',))
+IN_FLIGHT = REGISTRY.gauge('ws_requests_in_flight', '正在处理的WebSocket请求数')
+REGISTRY.gauge('ws_connected_clients', '已连接的客户端数', function=lambda: len(connected_clients))
+REGISTRY.gauge('mt5_connected', 'MT5是否已连接', function=lambda: int(bool(supervisor and supervisor.connected)))
+REGISTRY.gauge('scheduler_queue_depth', '交易调度队列深度', function=lambda: scheduler.depth if scheduler else 0)
+REGISTRY.gauge('scheduler_in_flight', '正在执行的交易请求数', function=lambda: scheduler.in_flight if scheduler else 0)
+
+# 已知的操作，其他操作在指标中记为unknown，避免标签无限增长
+ACTIONS = (
+    'health_check', 'get_account_info', 'open_position', 'close_position_by_ticket',
+    'close_positions_by_symbol', 'close_all_positions', 'get_positions', 'get_symbol_mappings',
+    'add_symbol_mapping', 'remove_symbol_mapping', 'position_update', 'get_metrics',
+    'admin_profile', 'get_deals', 'get_orders_history', 'get_daily_pnl', 'get_rates', 'get_ticks',
+    'get_execution_stats', 'reconcile_positions'
+)
+
+# 服务就绪状态: starting -> connecting -> warming -> ready，断线重连期间为 reconnecting
+# warming时已连接并接受交易请求，品种预热在后台进行（未预热的品种在首单时查询规格）
+readiness = {'state': 'starting', 'since': time.time()}
+
+# 后台品种预热任务（连接或重连成功后启动）
+warm_task = None
+
+# 持仓票据 -> MT5品种（开仓成功和查询持仓时记录），按票据平仓时用来选择该品种的调度队列
+position_symbols = {}
+POSITION_SYMBOLS_MAX = 10000
+
+def load_config():
+    """加载config.json，不存在时使用默认配置"""
+    try:
+        with open('config.json', 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.error("配置文件不存在！")
+        return {
+            "mt5_path": "",
+            "server": "",
+            "login": 0,
+            "password": "",
+            "symbol_mapping": {}
+        }
+
+def init_server():
+    """
+    加载配置，初始化日志、MT5后端和共享状态
+    只在服务进程的入口调用：分进程模式下交易进程以spawn方式启动时会重新导入本模块，
+    模块顶层不能有这些副作用（否则日志文件被重复打开、配置和映射被重复加载）
+    """
+    global config, symbol_mapper, spec_cache, read_cache, execution_stats
+    config = load_config()
     
-    logger.info("=" * 50)
-    logger.info("开始初始化MT5连接")
+    # 配置日志：格式化和写入在后台线程完成，不占用交易线程和事件循环
+    setup_logging(config)
+    
+    # MT5后端: 环境变量MT5_BACKEND优先于配置，fake为模拟后端（回放和基准测试使用）
+    select_backend(os.environ.get("MT5_BACKEND") or config.get("mt5_backend", "mt5"))
+    
+    symbol_mapper = get_mapper()
+    spec_cache = SymbolSpecCache(config.get("spec_cache_file", "symbol_specs.json"))
+    read_cache = ReadCache(config.get("read_cache_ttl_ms", {"get_account_info": 250, "get_positions": 100}))
+    execution_stats = ExecutionStats(spec_cache, window=config.get("execution_stats_window", 200))
+
+def set_readiness(state):
+    """更新服务就绪状态，并通知所有客户端"""
+    if readiness['state'] == state:
+        return
+    readiness['state'] = state
+    readiness['since'] = time.time()
+    logger.info(f"服务状态: {state}")
+    asyncio.get_running_loop().create_task(
+        broadcast_message({'event': 'readiness', 'readiness': readiness_info()})
+    )
+
+def readiness_info():
+    """获取服务就绪状态信息"""
+    return {
+        'state': readiness['state'],
+        'since': readiness['since'],
+        'ready': readiness['state'] in ('warming', 'ready')
+    }
+
+def create_trader():
+    """
+    根据配置创建MT5交易者（不连接终端）
+    process_mode为split时MT5调用在独立的交易进程中执行，trader为转发调用的代理
+    """
+    global trader, broker
     
     # 从配置获取MT5路径（可选）
     mt5_path = config.get("mt5_path", "")
@@ -53,19 +208,63 @@ def initialize_mt5():
         logger.info(f"检测到程序文件名配置: {mt5_path}，将尝试连接到已运行的MT5")
         mt5_path = ""  # 清空路径，让MT5库自动连接
     
-    if mt5_path:
-        logger.info(f"使用配置的MT5路径: {mt5_path}")
+    trader_options = {
+        'mt5_path': mt5_path,
+        'server': config.get("server", ""),
+        'login': config.get("login", 0),
+        'password': config.get("password", ""),
+        'volume_rounding': config.get("volume_rounding", "down"),
+        'volume_clamp': config.get("volume_clamp", True),
+        'retry_max_attempts': config.get("retry_max_attempts", 3),
+        'retry_budget_ms': config.get("retry_budget_ms", 1500),
+        'retry_backoff_ms': config.get("retry_backoff_ms", 20),
+        'retry_jitter': config.get("retry_jitter", 0.5),
+        'tick_max_age_ms': config.get("tick_max_age_ms", 200)
+    }
+    
+    if config.get("process_mode", "single") == "split":
+        trader = broker = BrokerProxy(
+            config,
+            trader_options,
+            workers=config.get("broker_workers", 2),
+            trade_workers=config.get("scheduler_workers", 1),
+            hang_timeout=config.get("broker_hang_timeout", 30),
+            read_timeout=config.get("broker_read_timeout", 300),
+            heartbeat_interval=config.get("broker_heartbeat_interval", 1.0),
+            heartbeat_timeout=config.get("broker_heartbeat_timeout", 5),
+            on_restart=on_broker_restart
+        )
+        broker.start()
+    else:
+        trader = MT5Trader(spec_cache=spec_cache, **trader_options)
+    return trader
+
+def on_broker_restart(reason):
+    """
+    交易进程被重启：立即重新连接MT5并通知客户端
+    被中断的交易调用结果未知，清空只读缓存，新交易进程连接后立即对账
+    """
+    global reconcile_on_connect
+    read_cache.invalidate()
+    reconcile_on_connect = True
+    if supervisor:
+        supervisor.request_check()
+    asyncio.create_task(broadcast_message({'event': 'broker_restarted', 'reason': reason, 'time': time.time()}))
+
+def initialize_mt5():
+    """初始化MT5连接"""
+    logger.info("=" * 50)
+    logger.info("开始初始化MT5连接")
+    
+    if trader is None:
+        create_trader()
+    
+    if trader.mt5_path:
+        logger.info(f"使用配置的MT5路径: {trader.mt5_path}")
     else:
         logger.info("未配置MT5路径，将连接到已运行的MT5终端")
         logger.info("请确保MT5终端已手动启动并登录")
     
-    trader = MT5Trader(
-        mt5_path=mt5_path,
-        server=config.get("server", ""),
-        login=config.get("login", 0),
-        password=config.get("password", "")
-    )
-    
     try:
         success = trader.initialize()
         if success:
@@ -86,8 +285,40 @@ def initialize_mt5():
         logger.error("=" * 50)
         return False
 
+def is_mt5_connected():
+    """检查MT5连接（供连接守护在后台线程调用）"""
+    try:
+        return bool(trader and trader.is_connected())
+    except BrokerError:
+        # 交易进程正在重启，新进程连接后恢复
+        return False
+
+async def wait_for_mt5(hold=False, deadline=None):
+    """
+    检查MT5连接状态
+    
+    Args:
+        hold: 是否在重连期间等待连接恢复（交易请求使用），否则立即返回
+        deadline: 请求截止时间（Unix秒），等待不会超过该时间
+        
+    Returns:
+        tuple: (是否已连接, 失败原因)
+    """
+    if supervisor is None:
+        return False, 'MT5未连接'
+    if supervisor.connected:
+        return True, None
+    if not hold:
+        return False, 'MT5未连接'
+    timeout = config.get("reconnect_hold_timeout", 5.0)
+    if deadline is not None:
+        timeout = max(0.0, min(timeout, deadline - time.time()))
+    return await supervisor.hold_until_connected(timeout)
+
 async def handle_message(websocket, message):
     """处理从客户端接收到的消息"""
+    if traffic_capture is not None:
+        traffic_capture.write(websocket, INBOUND, message)
     try:
         data = json.loads(message)
         action = data.get('action')
@@ -95,35 +326,29 @@ async def handle_message(websocket, message):
         
         response = {'id': data.get('id'), 'status': 'error', 'message': '未知操作'}
         
-        # 根据操作类型执行相应的功能
-        if action == 'health_check':
-            response = await health_check(params)
-        elif action == 'get_account_info':
-            response = await get_account_info(params)
-        elif action == 'open_position':
-            response = await open_position(params)
-        elif action == 'close_position_by_ticket':
-            response = await close_position_by_ticket(params)
-        elif action == 'close_positions_by_symbol':
-            response = await close_positions_by_symbol(params)
-        elif action == 'close_all_positions':
-            response = await close_all_positions(params)
-        elif action == 'get_positions':
-            response = await get_positions(params)
-        elif action == 'get_symbol_mappings':
-            response = await get_symbol_mappings(params)
-        elif action == 'add_symbol_mapping':
-            response = await add_symbol_mapping(params)
-        elif action == 'remove_symbol_mapping':
-            response = await remove_symbol_mapping(params)
-        else:
-            response = {'status': 'error', 'message': f'未知操作: {action}'}
+        metric_action = action if action in ACTIONS else 'unknown'
+        started = time.perf_counter()
+        IN_FLIGHT.inc()
+        try:
+            response = await dispatch(action, params, websocket, data.get('id'))
+        finally:
+            IN_FLIGHT.dec()
+            REQUEST_SECONDS.observe(time.perf_counter() - started, metric_action)
+            if action in TRADING_ACTIONS:
+                read_cache.invalidate()
+        status = response.get('status', 'unknown')
+        REQUESTS.inc(metric_action, status)
+        if status == 'error':
+            REQUEST_ERRORS.inc(metric_action, response.get('reason', 'error'))
         
         # 添加请求ID到响应中，方便客户端匹配请求和响应
         if 'id' in data:
             response['id'] = data['id']
         
-        await websocket.send(json.dumps(response, ensure_ascii=False))
+        reply = json.dumps(response, ensure_ascii=False, default=json_default)
+        if traffic_capture is not None:
+            traffic_capture.write(websocket, OUTBOUND, reply)
+        await websocket.send(reply)
     except json.JSONDecodeError:
         await websocket.send(json.dumps({
             'status': 'error',
@@ -136,20 +361,70 @@ async def handle_message(websocket, message):
             'message': f'处理请求时发生错误: {str(e)}'
         }, ensure_ascii=False))
 
+async def dispatch(action, params, websocket=None, request_id=None):
+    """根据操作类型执行相应的功能（websocket和request_id用于分块推送结果的操作）"""
+    if action == 'health_check':
+        return await health_check(params)
+    elif action == 'get_account_info':
+        return await get_account_info(params)
+    elif action == 'open_position':
+        return await open_position(params)
+    elif action == 'close_position_by_ticket':
+        return await close_position_by_ticket(params)
+    elif action == 'close_positions_by_symbol':
+        return await close_positions_by_symbol(params)
+    elif action == 'close_all_positions':
+        return await close_all_positions(params)
+    elif action == 'get_positions':
+        return await get_positions(params)
+    elif action == 'get_symbol_mappings':
+        return await get_symbol_mappings(params)
+    elif action == 'add_symbol_mapping':
+        return await add_symbol_mapping(params)
+    elif action == 'remove_symbol_mapping':
+        return await remove_symbol_mapping(params)
+    elif action == 'position_update':
+        return await position_update(params)
+    elif action == 'get_metrics':
+        return await get_metrics(params)
+    elif action == 'admin_profile':
+        return await admin_profile(params)
+    elif action == 'get_deals':
+        return await get_history(params, 'deals', websocket, request_id)
+    elif action == 'get_orders_history':
+        return await get_history(params, 'orders', websocket, request_id)
+    elif action == 'get_daily_pnl':
+        return await get_daily_pnl(params)
+    elif action == 'get_rates':
+        return await get_market_data(params, 'rates', websocket, request_id)
+    elif action == 'get_ticks':
+        return await get_market_data(params, 'ticks', websocket, request_id)
+    elif action == 'get_execution_stats':
+        return await get_execution_stats(params)
+    elif action == 'reconcile_positions':
+        return await reconcile_positions(params)
+    return {'status': 'error', 'message': f'未知操作: {action}'}
+
 async def health_check(params):
     """健康检查接口"""
-    if trader and trader.is_connected():
-        return {'status': 'success', 'message': '服务正常运行'}
+    if supervisor and supervisor.connected:
+        return {'status': 'success', 'message': '服务正常运行', 'readiness': readiness_info()}
     else:
-        return {'status': 'error', 'message': 'MT5连接异常'}
+        return {'status': 'error', 'message': 'MT5连接异常', 'readiness': readiness_info()}
+
+def run_read(func, *args):
+    """在默认线程池中执行只读的MT5调用"""
+    return asyncio.get_running_loop().run_in_executor(None, func, *args)
 
 async def get_account_info(params):
     """获取账户信息"""
-    if not trader or not trader.is_connected():
-        return {'status': 'error', 'message': 'MT5未连接'}
+    connected, reason = await wait_for_mt5(hold=False)
+    if not connected:
+        return {'status': 'error', 'message': reason}
     
     try:
-        account_info = trader.get_account_info()
+        # 并发的相同请求只调用一次MT5，在线程池中执行避免阻塞事件循环
+        account_info = await read_cache.get('get_account_info', None, lambda: run_read(trader.get_account_info))
         if account_info:
             return {'status': 'success', 'data': account_info}
         else:
@@ -160,10 +435,48 @@ async def get_account_info(params):
         logger.exception(error_message)
         return {'status': 'error', 'message': error_message}
 
+async def execute_open(symbol, order_type, volume, deadline, order):
+    """
+    通过调度器在交易线程中执行开仓
+
+    Args:
+        symbol: MT5品种
+        order_type: BUY或SELL
+        volume: 交易量（已规范化）
+        deadline: 截止时间（Unix秒）
+        order: 其他下单参数（profit_amount/deviation/comment，normalized为True时交易量已按品种规格规范化）
+
+    Returns:
+        tuple: (MT5下单结果, 耗时信息, 下单尝试记录)
+    """
+    attempts = []
+    result, timing = await scheduler.submit(
+        lambda: trader.open_position(
+            symbol=symbol,
+            order_type=order_type,
+            volume=volume,
+            price=0,
+            sl=0,
+            tp=0,
+            profit_amount=order.get('profit_amount', 0),  # 传递盈利金额参数
+            deviation=order.get('deviation', 100),
+            comment=order.get('comment', "WebSocket API"),
+            attempts=attempts,
+            normalized=order.get('normalized', False)
+        ),
+        lane=symbol,
+        priority=PRIORITY_OPEN,
+        deadline=deadline,
+        description=f"开仓 {symbol} {order_type} {volume}"
+    )
+    return result, timing, attempts
+
 async def open_position(params):
     """开仓接口"""
-    if not trader or not trader.is_connected():
-        return {'status': 'error', 'message': 'MT5未连接'}
+    deadline = request_deadline(params)
+    connected, reason = await wait_for_mt5(hold=True, deadline=deadline)
+    if not connected:
+        return {'status': 'error', 'message': reason}
 
     try:
         # 获取参数
@@ -180,9 +493,6 @@ async def open_position(params):
         
         order_type = params.get('order_type', '').upper()  # 'BUY' 或 'SELL'
 
-        price = 0
-        sl = 0
-        tp = 0
         profit_amount = float(params.get('profit_amount', 0))  # 新增：目标盈利金额
         deviation = 100  # 设置默认偏差为100点
         
@@ -194,32 +504,49 @@ async def open_position(params):
         comment = params.get('comment', "WebSocket API")
         
         volume_ratio = symbol_mapper.get_volume_ratio(external_symbol)
-        logger.info(f"开始处理开仓请求: 品种={symbol}(原始={external_symbol}), 类型={order_type}")
-        logger.info(f"交易量映射: 原始={original_volume} -> MT5={volume} (手数比例={volume_ratio})")
+        logger.info("开始处理开仓请求: 品种=%s(原始=%s), 类型=%s, 交易量: 原始=%s -> MT5=%s (手数比例=%s)",
+                    symbol, external_symbol, order_type, original_volume, volume, volume_ratio)
+        
+        # 使用缓存的品种规格在本地规范化交易量，无效订单直接拒绝，不占用终端往返；
+        # 规范化后的交易量传给open_position时不再重复规范化（未缓存时由open_position查询规格后规范化）
+        spec = spec_cache.get(symbol)
+        if spec:
+            normalized_volume, reason = normalize_volume(
+                volume, spec, config.get("volume_rounding", "down"), config.get("volume_clamp", True)
+            )
+            if normalized_volume is None:
+                logger.warning(f"开仓请求被拒绝，交易量无效: {reason}")
+                return {'status': 'error', 'message': f'交易量无效: {reason}', 'reason': 'invalid_volume'}
+            if normalized_volume != abs(volume):
+                logger.info("交易量已规范化: %s -> %s", volume, normalized_volume)
+            volume = normalized_volume
         if profit_amount > 0:
-            logger.info(f"设置目标盈利金额: ${profit_amount}")
+            logger.info("设置目标盈利金额: $%s", profit_amount)
         
-        # 创建一个新的线程来执行MT5的交易操作
-        loop = asyncio.get_running_loop()
-        # 在线程池中执行MT5交易操作，设置90秒超时
-        result = await asyncio.wait_for(
-            loop.run_in_executor(None, lambda: trader.open_position(
-                symbol=symbol,
-                order_type=order_type,
-                volume=volume,
-                price=price,
-                sl=sl,
-                tp=tp,
-                profit_amount=profit_amount,  # 传递盈利金额参数
-                deviation=deviation,
-                comment=comment
-            )),
-            timeout=90
-        )
+        # 两阶段开仓时市价单不带止盈，成交后再按实际成交价和成交量设置
+        two_phase = stop_attacher is not None and profit_amount > 0
+        
+        # 通过调度器在交易线程中执行MT5交易操作，设置90秒超时
+        # 启用聚合窗口时，同品种同方向的开仓请求合并为一笔订单（设置了目标盈利金额的请求单独下单）
+        order = {'profit_amount': 0 if two_phase else profit_amount, 'deviation': deviation, 'comment': comment}
+        batch = None
+        if aggregator is not None and profit_amount <= 0 and aggregator.enabled_for(symbol):
+            # 合并后的总交易量可能超出最大交易量，由open_position重新规范化
+            (result, timing, attempts), share, count, total = await asyncio.wait_for(
+                aggregator.submit(symbol, order_type, volume, deadline, **order),
+                timeout=90
+            )
+            batch = {'requests': count, 'total_volume': total, 'share': round(share, 8)}
+        else:
+            result, timing, attempts = await asyncio.wait_for(
+                execute_open(symbol, order_type, volume, deadline, dict(order, normalized=spec is not None)),
+                timeout=90
+            )
         
-        if result and result.retcode == mt5.TRADE_RETCODE_DONE:
-            logger.info(f"开仓成功: 品种={symbol}, 订单号={result.order}, 价格={result.price}")
-            return {
+        if result and result.retcode == TRADE_RETCODE_DONE:
+            logger.info("开仓成功: 品种=%s, 订单号=%s, 价格=%s", symbol, result.order, result.price)
+            remember_positions(((result.order, symbol),))
+            response = {
                 'status': 'success',
                 'message': '开仓成功',
                 'data': {
@@ -229,15 +556,43 @@ async def open_position(params):
                     'symbol': symbol,
                     'type': order_type,
                     'profit_amount_target': profit_amount if profit_amount > 0 else None
-                }
+                },
+                'attempts': attempts,
+                'timing': timing
             }
+            if two_phase:
+                response['data']['stops'] = stop_attacher.attach(
+                    symbol, result.order, order_type, result.volume or volume, result.price,
+                    profit_amount=profit_amount
+                )
+            if batch is not None:
+                # 合并订单按请求交易量比例分配成交量
+                filled = result.volume or batch['total_volume']
+                response['data']['volume'] = round(filled * share, 8)
+                response['aggregated'] = batch
+            return response
         else:
-            error_code = result.retcode if result else 'Unknown'
-            error_message = f"开仓失败，错误码: {error_code}"
-            if result and hasattr(result, 'comment'):
+            if result is None:
+                # 订单未能发送到终端（本地拒绝已作为OrderRejected返回），可能是连接已断开，通知守护立即检查
+                supervisor.request_check()
+                error_message = "开仓失败，订单未能发送到MT5终端"
+                logger.error(error_message)
+                return {'status': 'error', 'message': error_message, 'reason': 'send_failed',
+                        'attempts': attempts, 'timing': timing}
+            error_message = f"开仓失败，错误码: {result.retcode}"
+            if hasattr(result, 'comment'):
                 error_message += f", 错误信息: {result.comment}"
             logger.error(error_message)
-            return {'status': 'error', 'message': error_message}
+            return {'status': 'error', 'message': error_message, 'attempts': attempts, 'timing': timing}
+    
+    except OrderRejected as e:
+        logger.warning(f"开仓请求被拒绝: {str(e)}")
+        return {'status': 'error', 'message': str(e), 'reason': e.reason}
+    
+    except OutcomeUnknown as e:
+        # 交易进程在执行期间被重启，订单可能已经成交，客户端应先查询持仓而不是直接重试
+        logger.error(f"开仓结果未知: {str(e)}")
+        return {'status': 'error', 'message': str(e), 'reason': e.reason}
     
     except asyncio.TimeoutError:
         error_message = f"开仓操作超时，可能是MT5处理时间过长，请检查MT5终端"
@@ -250,23 +605,45 @@ async def open_position(params):
         return {'status': 'error', 'message': error_message}
 
 async def close_position_by_ticket(params):
-    """通过持仓票据关闭单个持仓"""
-    if not trader or not trader.is_connected():
-        return {'status': 'error', 'message': 'MT5未连接'}
+    """
+    通过持仓票据关闭单个持仓
+    
+    可选参数:
+        symbol: 外部系统品种，与该品种排队中的开平仓按顺序执行（未提供时使用已记录的持仓品种）
+    """
+    deadline = request_deadline(params)
+    connected, reason = await wait_for_mt5(hold=True, deadline=deadline)
+    if not connected:
+        return {'status': 'error', 'message': reason}
     
     try:
         ticket = int(params.get('ticket', 0))
         if not ticket:
             return {'status': 'error', 'message': '缺少必要参数: ticket'}
         
-        result = trader.close_position_by_ticket(ticket)
+        result, timing = await scheduler.submit(
+            lambda: trader.close_position_by_ticket(ticket),
+            lane=ticket_lane(params, ticket),
+            priority=PRIORITY_CLOSE,
+            deadline=deadline,
+            description=f"按票据平仓 {ticket}"
+        )
         
         if result:
-            return {'status': 'success', 'message': '关仓成功'}
+            return {'status': 'success', 'message': '关仓成功', 'timing': timing}
         else:
             error_message = "关仓失败"
             logger.error(error_message)
-            return {'status': 'error', 'message': error_message}
+            return {'status': 'error', 'message': error_message, 'timing': timing}
+    
+    except OrderRejected as e:
+        logger.warning(f"平仓请求被拒绝: {str(e)}")
+        return {'status': 'error', 'message': str(e), 'reason': e.reason}
+    
+    except OutcomeUnknown as e:
+        # 交易进程在执行期间被重启，订单可能已经成交，客户端应先查询持仓而不是直接重试
+        logger.error(f"平仓结果未知: {str(e)}")
+        return {'status': 'error', 'message': str(e), 'reason': e.reason}
             
     except Exception as e:
         error_message = f"关仓处理异常: {str(e)}"
@@ -275,8 +652,10 @@ async def close_position_by_ticket(params):
 
 async def close_positions_by_symbol(params):
     """通过交易品种关闭所有相关持仓"""
-    if not trader or not trader.is_connected():
-        return {'status': 'error', 'message': 'MT5未连接'}
+    deadline = request_deadline(params)
+    connected, reason = await wait_for_mt5(hold=True, deadline=deadline)
+    if not connected:
+        return {'status': 'error', 'message': reason}
     
     try:
         external_symbol = params.get('symbol')
@@ -287,14 +666,29 @@ async def close_positions_by_symbol(params):
         symbol = symbol_mapper.map_to_mt5(external_symbol)
         
         logger.info(f"正在关闭品种持仓: {symbol}(原始={external_symbol})")
-        result = trader.close_positions_by_symbol(symbol)
+        result, timing = await scheduler.submit(
+            lambda: trader.close_positions_by_symbol(symbol),
+            lane=symbol,
+            priority=PRIORITY_CLOSE,
+            deadline=deadline,
+            description=f"按品种平仓 {symbol}"
+        )
         
         if result:
-            return {'status': 'success', 'message': '关仓成功'}
+            return {'status': 'success', 'message': '关仓成功', 'timing': timing}
         else:
             error_message = "关仓失败"
             logger.error(error_message)
-            return {'status': 'error', 'message': error_message}
+            return {'status': 'error', 'message': error_message, 'timing': timing}
+    
+    except OrderRejected as e:
+        logger.warning(f"平仓请求被拒绝: {str(e)}")
+        return {'status': 'error', 'message': str(e), 'reason': e.reason}
+    
+    except OutcomeUnknown as e:
+        # 交易进程在执行期间被重启，订单可能已经成交，客户端应先查询持仓而不是直接重试
+        logger.error(f"平仓结果未知: {str(e)}")
+        return {'status': 'error', 'message': str(e), 'reason': e.reason}
             
     except Exception as e:
         error_message = f"关仓处理异常: {str(e)}"
@@ -303,31 +697,127 @@ async def close_positions_by_symbol(params):
 
 async def close_all_positions(params):
     """关闭所有持仓"""
-    if not trader or not trader.is_connected():
-        return {'status': 'error', 'message': 'MT5未连接'}
+    deadline = request_deadline(params)
+    connected, reason = await wait_for_mt5(hold=True, deadline=deadline)
+    if not connected:
+        return {'status': 'error', 'message': reason}
     
     try:
-        result = trader.close_all_positions()
+        result, timing = await scheduler.submit(
+            trader.close_all_positions,
+            lane=GLOBAL_LANE,
+            priority=PRIORITY_CLOSE,
+            deadline=deadline,
+            description="关闭所有持仓"
+        )
         
         if result:
-            return {'status': 'success', 'message': '所有持仓已关闭'}
+            return {'status': 'success', 'message': '所有持仓已关闭', 'timing': timing}
         else:
             error_message = "关闭所有持仓失败"
             logger.error(error_message)
-            return {'status': 'error', 'message': error_message}
+            return {'status': 'error', 'message': error_message, 'timing': timing}
+    
+    except OrderRejected as e:
+        logger.warning(f"清仓请求被拒绝: {str(e)}")
+        return {'status': 'error', 'message': str(e), 'reason': e.reason}
+    
+    except OutcomeUnknown as e:
+        # 交易进程在执行期间被重启，订单可能已经成交，客户端应先查询持仓而不是直接重试
+        logger.error(f"清仓结果未知: {str(e)}")
+        return {'status': 'error', 'message': str(e), 'reason': e.reason}
             
     except Exception as e:
         error_message = f"关闭所有持仓异常: {str(e)}"
         logger.exception(error_message)
         return {'status': 'error', 'message': error_message}
 
+async def position_update(params):
+    """处理ATAS策略推送的持仓变化（开多/开空/平仓），由信号引擎合并后下单"""
+    try:
+        data = signal_engine.submit(params)
+        return {'status': 'success', 'message': '已接收持仓更新', 'data': data}
+    except ValueError as e:
+        return {'status': 'error', 'message': str(e)}
+    except Exception as e:
+        error_message = f"处理持仓更新异常: {str(e)}"
+        logger.exception(error_message)
+        return {'status': 'error', 'message': error_message}
+
+def remember_positions(pairs):
+    """记录持仓票据所属的MT5品种（pairs为(票据, 品种)）"""
+    if len(position_symbols) > POSITION_SYMBOLS_MAX:
+        position_symbols.clear()
+    position_symbols.update(pairs)
+
+def ticket_lane(params, ticket):
+    """
+    按票据平仓使用的调度队列
+    已知持仓品种时（参数symbol或已记录的票据）与该品种的开平仓按顺序执行，否则使用全局队列
+    """
+    if params.get('symbol'):
+        return symbol_mapper.map_to_mt5(params['symbol'])
+    return position_symbols.get(ticket, GLOBAL_LANE)
+
+async def fetch_positions(symbol, columnar=False, fields=None, order_type=None, magic=None):
+    """读取持仓并反向映射品种（结果会被缓存共享，返回后不再修改）"""
+    if columnar:
+        # original_symbol由服务器添加，MT5只读取其他字段（需要symbol用于映射）
+        with_original = fields is None or 'original_symbol' in fields
+        mt5_fields = None
+        if fields is not None:
+            mt5_fields = [field for field in fields if field != 'original_symbol']
+            if with_original and 'symbol' not in mt5_fields:
+                mt5_fields.append('symbol')
+        positions = await run_read(trader.get_positions_columnar, symbol, order_type, magic, mt5_fields)
+        columns = positions['columns']
+        if 'ticket' in columns and 'symbol' in columns:
+            remember_positions(zip(columns['ticket'], columns['symbol']))
+        if with_original:
+            # 每个品种只映射一次
+            mapped = {mt5_symbol: symbol_mapper.map_from_mt5(mt5_symbol) for mt5_symbol in set(columns['symbol'])}
+            columns['original_symbol'] = [mapped[mt5_symbol] for mt5_symbol in columns['symbol']]
+        if fields is not None:
+            positions['columns'] = {field: columns[field] for field in fields}
+        positions['fields'] = list(positions['columns'])
+        return positions
+    
+    positions = await run_read(trader.get_positions, symbol, order_type, magic)
+    remember_positions((position.ticket, position.symbol) for position in positions)
+    
+    # 进行反向映射，将MT5符号映射回外部系统符号
+    for position in positions:
+        position.original_symbol = symbol_mapper.map_from_mt5(position.symbol)
+    
+    # 未指定字段时直接返回持仓记录，发送时才序列化
+    if fields is not None:
+        positions = [position.to_json(fields) for position in positions]
+    return positions
+
 async def get_positions(params):
-    """获取持仓信息"""
-    if not trader or not trader.is_connected():
-        return {'status': 'error', 'message': 'MT5未连接'}
+    """
+    获取持仓信息
+    
+    可选参数:
+        symbol: 外部系统品种
+        format: rows（默认，每个持仓一个dict）或columnar（每个字段一个数组）
+        fields: 只返回指定字段，如 ["ticket", "symbol", "profit"]
+        type: 只返回BUY或SELL方向的持仓
+        magic: 只返回指定魔术号的持仓
+    """
+    connected, reason = await wait_for_mt5(hold=False)
+    if not connected:
+        return {'status': 'error', 'message': reason}
     
     try:
         external_symbol = params.get('symbol', '')
+        columnar = params.get('format', 'rows') == 'columnar'
+        fields = params.get('fields')
+        if isinstance(fields, str):
+            fields = [field.strip() for field in fields.split(',') if field.strip()]
+        fields = tuple(fields) if fields else None
+        order_type = params.get('type') or None
+        magic = int(params['magic']) if params.get('magic') is not None else None
         
         # 如果指定了品种，则进行映射
         symbol = ''
@@ -337,14 +827,11 @@ async def get_positions(params):
         else:
             logger.info("获取所有持仓信息")
         
-        positions = trader.get_positions(symbol)
-        
-        # 进行反向映射，将MT5符号映射回外部系统符号
-        if positions and isinstance(positions, list):
-            for position in positions:
-                if 'symbol' in position:
-                    mt5_symbol = position['symbol']
-                    position['original_symbol'] = symbol_mapper.map_from_mt5(mt5_symbol)
+        positions = await read_cache.get(
+            'get_positions',
+            (symbol, columnar, fields, order_type, magic),
+            lambda: fetch_positions(symbol, columnar, fields, order_type, magic)
+        )
         
         return {'status': 'success', 'data': positions}
             
@@ -353,6 +840,249 @@ async def get_positions(params):
         logger.exception(error_message)
         return {'status': 'error', 'message': error_message}
 
+async def sync_history():
+    """从MT5增量同步历史到本地库（同一时间只进行一次同步）"""
+    if history_store is None or not (supervisor and supervisor.connected):
+        return None
+    async with history_lock:
+        return await run_read(history_store.sync, trader.get_history_deals, trader.get_history_orders)
+
+async def get_history(params, table, websocket=None, request_id=None):
+    """
+    查询本地历史库中的成交（deals）或历史订单（orders）
+    
+    可选参数:
+        symbol: 外部系统品种
+        date_from / date_to: 时间范围（Unix秒，MT5服务器时间）
+        position_id / magic: 按持仓ID或魔术号筛选
+        cursor: 上一页返回的next_cursor
+        limit: 每页记录数（默认500），stream模式下为每块记录数
+        stream: 为true时分块推送全部结果（event=history_chunk），最后返回汇总
+        refresh: 为true时先从MT5增量同步
+    """
+    if history_store is None:
+        return {'status': 'error', 'message': '历史库未启用'}
+    
+    try:
+        if params.get('refresh'):
+            await sync_history()
+        
+        external_symbol = params.get('symbol', '')
+        filters = {
+            'symbol': symbol_mapper.map_to_mt5(external_symbol) if external_symbol else None,
+            'date_from': params.get('date_from'),
+            'date_to': params.get('date_to'),
+            'position_id': params.get('position_id'),
+            'magic': params.get('magic')
+        }
+        limit = int(params.get('limit', 500))
+        cursor = params.get('cursor')
+        
+        if not params.get('stream') or websocket is None:
+            page = await run_read(lambda: history_store.query(table, cursor=cursor, limit=limit, **filters))
+            return {'status': 'success', 'data': page}
+        
+        # 分块推送：每块一条消息，客户端按id和seq拼接
+        total = 0
+        seq = 0
+        while True:
+            page = await run_read(lambda: history_store.query(table, cursor=cursor, limit=limit, **filters))
+            await websocket.send(json.dumps({
+                'id': request_id,
+                'event': 'history_chunk',
+                'table': table,
+                'seq': seq,
+                'data': page['items'],
+                'last': page['next_cursor'] is None
+            }, ensure_ascii=False))
+            total += len(page['items'])
+            seq += 1
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        
+        return {'status': 'success', 'data': {'table': table, 'count': total, 'chunks': seq}}
+    
+    except Exception as e:
+        error_message = f"查询历史异常: {str(e)}"
+        logger.exception(error_message)
+        return {'status': 'error', 'message': error_message}
+
+async def get_daily_pnl(params):
+    """
+    按日汇总本地历史库中的成交盈亏
+    
+    可选参数: symbol, date_from, date_to, utc_offset_hours（划分日期的时区偏移）, refresh
+    """
+    if history_store is None:
+        return {'status': 'error', 'message': '历史库未启用'}
+    
+    try:
+        if params.get('refresh'):
+            await sync_history()
+        
+        external_symbol = params.get('symbol', '')
+        data = await run_read(
+            history_store.daily_pnl,
+            params.get('date_from'),
+            params.get('date_to'),
+            symbol_mapper.map_to_mt5(external_symbol) if external_symbol else None,
+            params.get('utc_offset_hours', 0)
+        )
+        return {'status': 'success', 'data': data}
+    
+    except Exception as e:
+        error_message = f"汇总每日盈亏异常: {str(e)}"
+        logger.exception(error_message)
+        return {'status': 'error', 'message': error_message}
+
+async def get_market_data(params, kind, websocket=None, request_id=None):
+    """
+    读取K线（rates）或Tick（ticks）历史，以二进制帧流式返回（协议见market_data.stream_array）
+    分进程模式下交易进程返回RecordBuffer：记录字节经管道复制一次，服务进程不导入numpy
+    
+    参数:
+        symbol: 外部系统品种
+        date_from / date_to: 时间范围（Unix秒）
+        timeframe: K线周期，如M1/H1（仅rates，默认M1）
+        flags: all/info/trade（仅ticks，默认all）
+        chunk_bytes: 每个二进制块的最大字节数（默认1MB）
+        compress: 为true时每块使用zlib压缩
+    """
+    connected, reason = await wait_for_mt5(hold=False)
+    if not connected:
+        return {'status': 'error', 'message': reason}
+    if websocket is None:
+        return {'status': 'error', 'message': '该操作只能通过WebSocket调用'}
+    
+    try:
+        external_symbol = params.get('symbol')
+        if not external_symbol or params.get('date_from') is None or params.get('date_to') is None:
+            return {'status': 'error', 'message': '缺少必要参数: symbol, date_from 或 date_to'}
+        
+        symbol = symbol_mapper.map_to_mt5(external_symbol)
+        date_from = int(params['date_from'])
+        date_to = int(params['date_to'])
+        
+        started = time.perf_counter()
+        if kind == 'rates':
+            timeframe = params.get('timeframe', 'M1')
+            meta = {'symbol': symbol, 'timeframe': timeframe}
+            array = await run_read(trader.copy_rates_range, symbol, timeframe, date_from, date_to)
+        else:
+            flags = params.get('flags', 'all')
+            meta = {'symbol': symbol, 'flags': flags}
+            array = await run_read(trader.copy_ticks_range, symbol, date_from, date_to, flags)
+        if array is None:
+            return {'status': 'error', 'message': f'读取{kind}失败: {symbol}'}
+        fetched = time.perf_counter()
+        
+        summary = await stream_array(
+            websocket, request_id, kind, array, meta,
+            chunk_bytes=int(params.get('chunk_bytes', DEFAULT_CHUNK_BYTES)),
+            compress=bool(params.get('compress', False))
+        )
+        summary['fetch_ms'] = round((fetched - started) * 1000, 3)
+        summary['send_ms'] = round((time.perf_counter() - fetched) * 1000, 3)
+        logger.info("已发送%s: %s %d条, %d块, %d字节", kind, symbol, summary['count'], summary['chunks'], summary['sent_bytes'])
+        return {'status': 'success', 'data': summary}
+    
+    except Exception as e:
+        error_message = f"读取{kind}异常: {str(e)}"
+        logger.exception(error_message)
+        return {'status': 'error', 'message': error_message}
+
+async def get_metrics(params):
+    """获取服务指标"""
+    data = {
+        'metrics': REGISTRY.snapshot(),
+        'scheduler': scheduler.status() if scheduler else None,
+        'signal_engine': signal_engine.status()['stats'] if signal_engine else None,
+        'aggregator': aggregator.status() if aggregator else None,
+        'connection': supervisor.status() if supervisor else None,
+        'event_loop': loop_monitor.status() if loop_monitor else None,
+        'tick_recorder': tick_recorder.status() if tick_recorder else None,
+        'execution': execution_stats.status(),
+        'capture': traffic_capture.status() if traffic_capture else None,
+        'stops': stop_attacher.status()['stats'] if stop_attacher else None,
+        'reconciler': reconciler.status()['stats'] if reconciler else None,
+        'broker': broker.status() if broker else None
+    }
+    return {'status': 'success', 'data': data}
+
+async def get_execution_stats(params):
+    """
+    获取ATAS信号执行统计：信号延迟、收到信号到成交的时间和滑点
+
+    Args:
+        params: 可选 symbol（外部品种）
+    """
+    external_symbol = params.get('symbol')
+    symbol = symbol_mapper.map_to_mt5(external_symbol) if external_symbol else None
+    return {'status': 'success', 'data': execution_stats.status(symbol)}
+
+async def reconcile_positions(params):
+    """立即执行一次持仓对账，返回本次产生的事件和对账状态"""
+    if reconciler is None:
+        return {'status': 'error', 'message': '未启用持仓对账'}
+    connected, reason = await wait_for_mt5(hold=False)
+    if not connected:
+        return {'status': 'error', 'message': reason}
+    events = await reconciler.check()
+    return {'status': 'success', 'data': {'events': events, **reconciler.status()}}
+
+def check_admin(params):
+    """
+    校验管理操作的令牌（config中的admin_token，未配置则禁用所有管理操作）
+
+    Returns:
+        str: 校验失败的原因，通过则返回None
+    """
+    admin_token = config.get("admin_token", "")
+    if not admin_token:
+        return '未配置admin_token，管理操作已禁用'
+    if not hmac.compare_digest(str(params.get('token', '')).encode(), str(admin_token).encode()):
+        return '管理令牌无效'
+    return None
+
+async def admin_profile(params):
+    """
+    CPU分析接口（管理操作）
+    在不重启进程的情况下分析事件循环和交易线程N秒，写入分析文件并返回耗时最多的函数
+
+    参数: token, mode(sample/cprofile), duration(秒), interval_ms(采样间隔), top(返回函数数量)
+    """
+    reason = check_admin(params)
+    if reason:
+        logger.warning(f"管理操作被拒绝: {reason}")
+        return {'status': 'error', 'message': reason, 'reason': 'unauthorized'}
+    if profile_session is None:
+        return {'status': 'error', 'message': '服务尚未启动完成'}
+    if profile_session.running:
+        return {'status': 'error', 'message': '已有分析正在进行', 'reason': 'busy'}
+    
+    try:
+        data = await profile_session.capture(
+            mode=params.get('mode', MODE_SAMPLE),
+            duration=float(params.get('duration', 10)),
+            interval_ms=float(params.get('interval_ms', 5)),
+            top=int(params.get('top', 20))
+        )
+        return {'status': 'success', 'data': data}
+    except Exception as e:
+        error_message = f"CPU分析失败: {str(e)}"
+        logger.exception(error_message)
+        return {'status': 'error', 'message': error_message}
+
+def process_request(connection, request):
+    """HTTP请求钩子：在WebSocket端口上提供Prometheus格式的/metrics，其他路径继续WebSocket握手"""
+    if request.path != config.get("metrics_path", "/metrics"):
+        return None
+    response = connection.respond(HTTPStatus.OK, REGISTRY.render_prometheus())
+    del response.headers['Content-Type']
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
 async def websocket_handler(websocket):
     """WebSocket连接处理函数"""
     client_address = websocket.remote_address
@@ -366,7 +1096,8 @@ async def websocket_handler(websocket):
         await websocket.send(json.dumps({
             'status': 'success',
             'message': '已连接到MT5 WebSocket服务',
-            'mt5_connected': trader and trader.is_connected()
+            'mt5_connected': bool(supervisor and supervisor.connected),
+            'readiness': readiness_info()
         }, ensure_ascii=False))
         
         # 持续监听客户端消息
@@ -380,6 +1111,8 @@ async def websocket_handler(websocket):
     finally:
         # 从集合中移除断开连接的客户端
         connected_clients.remove(websocket)
+        if traffic_capture is not None:
+            traffic_capture.closed(websocket)
 
 async def broadcast_message(message):
     """向所有连接的客户端广播消息"""
@@ -395,13 +1128,75 @@ async def broadcast_message(message):
         return_exceptions=True
     )
 
+async def on_connected():
+    """
+    连接（或重连）成功：品种预热作为单独的任务启动，连接守护随即标记为已连接，
+    预热期间到达的交易请求直接执行，不等待预热完成
+    """
+    global warm_task
+    if warm_task is not None and not warm_task.done():
+        warm_task.cancel()
+    warm_task = asyncio.create_task(warm_up())
+
+async def warm_up():
+    """预取所有映射品种的规格，完成后服务状态变为ready"""
+    global reconcile_on_connect
+    set_readiness('warming')
+    try:
+        symbols = symbol_mapper.get_mt5_symbols()
+        logger.info(f"开始预热 {len(symbols)} 个映射品种: {symbols}")
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, trader.warm_symbols, symbols)
+        if broker is not None:
+            # 品种规格由交易进程获取并保存，服务进程重新加载用于本地规范化交易量
+            spec_cache.load()
+    except Exception as e:
+        logger.exception(f"品种预热过程中发生异常: {str(e)}")
+    
+    if reconcile_on_connect:
+        reconcile_on_connect = False
+        read_cache.invalidate()
+        if reconciler is not None:
+            asyncio.create_task(reconcile_after_restart())
+    if supervisor.connected:
+        set_readiness('ready')
+    logger.info(f"延迟导入耗时: {get_import_times()}")
+
+async def reconcile_after_restart():
+    """交易进程重启并重新连接后立即对账，不等下一个对账周期"""
+    try:
+        await reconciler.check()
+    except Exception as e:
+        logger.exception(f"交易进程重启后对账时出错: {str(e)}")
+
+async def on_stops_result(event):
+    """两阶段开仓的止损止盈设置完成：清空只读缓存并推送结果"""
+    read_cache.invalidate()
+    await broadcast_message(event)
+
+async def on_signal_result(event):
+    """信号执行完成：清空只读缓存并推送结果"""
+    if event.get('orders'):
+        read_cache.invalidate()
+    await broadcast_message(event)
+
+def on_connection_state(state):
+    """连接守护状态变化时更新服务就绪状态"""
+    if state == 'connected':
+        set_readiness('warming' if warm_task is not None and not warm_task.done() else 'ready')
+    else:
+        set_readiness(state)
+
 async def start_server():
     """启动WebSocket服务器"""
-    # 初始化MT5连接
-    initialize_mt5()
-    
-    # 开始定期任务，如广播价格更新等
-    asyncio.create_task(periodic_tasks())
+    # 启动模式: lazy（默认）先监听端口，MetaTrader5等重量级模块在后台首次使用时导入；
+    # eager 则在监听前导入全部模块
+    startup_mode = config.get("startup_mode", "lazy")
+    if startup_mode == "eager":
+        logger.info("启动模式: eager，监听前导入全部模块")
+        preload(mt5_module)
+    else:
+        logger.info("启动模式: lazy，重量级模块将在首次使用时导入")
     
     # 启动WebSocket服务器
     host = "0.0.0.0"
@@ -413,9 +1208,90 @@ async def start_server():
         "ping_timeout": 180,      # 180秒超时
         "max_size": 10 * 1024 * 1024,  # 最大消息大小10MB
         "max_queue": 1024,        # 最大队列大小
-        "close_timeout": 60       # 关闭超时时间
+        "close_timeout": 60,      # 关闭超时时间
+        "process_request": process_request  # 同一端口提供/metrics
     }
     
+    global supervisor, scheduler, signal_engine, aggregator, profile_session, loop_monitor
+    global history_store, history_lock, tick_recorder, traffic_capture, stop_attacher, reconciler
+    scheduler = OrderScheduler(
+        workers=config.get("scheduler_workers", 1),
+        shed_depth=config.get("scheduler_shed_depth", 50),
+        max_depth=config.get("scheduler_max_depth", 200)
+    )
+    scheduler.start()
+    
+    # 本地历史库：连接后由定期任务增量同步，查询不访问终端
+    if config.get("history_db", "history.db"):
+        history_store = HistoryStore(
+            config.get("history_db", "history.db"),
+            backfill_days=config.get("history_backfill_days", 90)
+        )
+        history_lock = asyncio.Lock()
+    
+    # 抓取所有收发的消息，之后可以在模拟后端上回放作为回归基准
+    if config.get("capture_file", ""):
+        traffic_capture = TrafficCapture(config["capture_file"])
+        asyncio.create_task(traffic_capture.run())
+        atexit.register(traffic_capture.close)
+        logger.info(f"已启用消息抓包: {config['capture_file']}")
+    
+    profile_session = ProfileSession(config.get("profile_dir", "profiles"), scheduler)
+    
+    signal_engine = SignalEngine(
+        trader=create_trader(),
+        scheduler=scheduler,
+        symbol_mapper=symbol_mapper,
+        spec_cache=spec_cache,
+        coalesce_ms=config.get("signal_coalesce_ms", 200),
+        volume_rounding=config.get("signal_volume_rounding", "nearest"),
+        wait_connected=lambda: wait_for_mt5(hold=True),
+        on_result=on_signal_result,
+        execution_stats=execution_stats
+    )
+    
+    # entry_mode: attached（默认）在市价单中直接带止盈；two_phase 市价单先成交，止盈按持仓均价在后台设置
+    # 只作用于带profit_amount的open_position请求：ATAS持仓信号（position_update）开仓不带止损止盈，不经过两阶段
+    if config.get("entry_mode", "attached") == "two_phase":
+        stop_attacher = MT5StopAttacher(
+            trader,
+            scheduler,
+            max_attempts=config.get("stops_max_attempts", 5),
+            retry_ms=config.get("stops_retry_ms", 200),
+            on_result=on_stops_result
+        )
+        logger.info("开仓模式: two_phase，带目标盈利金额的开仓在成交后按持仓均价设置止盈")
+    
+    # 定期比较信号引擎的预期净持仓与MT5实际持仓，发现偏差时推送事件（可选自动补单）
+    if config.get("reconcile_interval", 5):
+        reconciler = PositionReconciler(
+            trader,
+            signal_engine,
+            spec_cache=spec_cache,
+            interval=config.get("reconcile_interval", 5),
+            confirmations=config.get("reconcile_confirmations", 2),
+            auto_correct=config.get("reconcile_auto_correct", False),
+            max_corrections=config.get("reconcile_max_corrections", 3),
+            on_event=broadcast_message,
+            is_connected=lambda: bool(supervisor and supervisor.connected)
+        )
+        asyncio.create_task(reconciler.run())
+    
+    # open_aggregation_ms: 数字或按MT5品种配置的dict（"default"为其他品种），0表示不聚合
+    open_aggregation_ms = config.get("open_aggregation_ms", 0)
+    if open_aggregation_ms:
+        aggregator = OpenAggregator(open_aggregation_ms, execute_open)
+        logger.info(f"已启用开仓请求聚合: {open_aggregation_ms}ms")
+    
+    supervisor = ConnectionSupervisor(
+        connect=initialize_mt5,
+        is_connected=is_mt5_connected,
+        check_interval=config.get("connection_check_interval", 2.0),
+        max_held=config.get("reconnect_hold_max", 100),
+        on_connected=on_connected,
+        on_state_change=on_connection_state
+    )
+    
     logger.info(f"启动WebSocket服务器 ws://{host}:{port}")
     
     server = await websockets.serve(
@@ -424,21 +1300,46 @@ async def start_server():
         port, 
         **server_options
     )
+    
+    # 先监听端口再连接MT5，避免终端连接缓慢导致ATAS一次性的Connect()失败
+    # 连接、断线检测和重连都由连接守护在后台线程完成
+    asyncio.create_task(supervisor.run())
+    
+    # 开始定期任务，如广播价格更新等
+    asyncio.create_task(periodic_tasks())
+    
+    # 监控事件循环延迟，记录阻塞事件循环的同步调用
+    if config.get("loop_lag_threshold_ms", 100):
+        loop_monitor = LoopLagMonitor(config.get("loop_lag_threshold_ms", 100))
+        asyncio.create_task(loop_monitor.run())
+    
+    # 交易进程卡住或退出时自动重启
+    if broker is not None:
+        asyncio.create_task(broker.supervise())
+    
+    # 把映射品种的每个Tick记录到按日分段的内存映射文件，供之后回放和信号分析
+    # （直接调用MT5，分进程模式下服务进程没有终端连接，不启用）
+    if config.get("tick_record", False) and broker is not None:
+        logger.warning("分进程模式下不支持tick_record，已忽略")
+    elif config.get("tick_record", False):
+        tick_recorder = TickRecorder(
+            mt5,
+            symbol_mapper.get_mt5_symbols,
+            directory=config.get("tick_record_dir", "ticks"),
+            poll_ms=config.get("tick_record_poll_ms", 100),
+            active=lambda: bool(supervisor and supervisor.connected)
+        )
+        tick_recorder.start()
+    
     await asyncio.Future()  # 持续运行直到被中断
 
 async def periodic_tasks():
-    """定期执行的任务，如检查MT5连接状态、广播行情数据等"""
+    """定期执行的任务，如广播行情数据等（MT5连接检查和重连由连接守护负责）"""
     while True:
         try:
-            # 检查MT5连接状态
-            if trader and trader.is_connected():
-                # 可以在这里添加定期广播的数据，如行情更新等
-                pass
-            else:
-                # 如果MT5连接断开，尝试重新连接
-                if trader:
-                    logger.warning("MT5连接已断开，尝试重新连接...")
-                    trader.initialize()
+            if supervisor and supervisor.connected:
+                # 增量同步成交和历史订单到本地库
+                await sync_history()
         except Exception as e:
             logger.exception(f"执行定期任务时出错: {str(e)}")
         
@@ -494,8 +1395,10 @@ async def remove_symbol_mapping(params):
         return {'status': 'error', 'message': error_message}
 
 if __name__ == "__main__":
+    # 打包为exe时分进程模式的交易进程需要
+    multiprocessing.freeze_support()
 
-    
+    init_server()
     try:
 
 
@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=['numpy'],
+    hiddenimports=['MetaTrader5', 'numpy', 'fake_mt5'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,47 @@
+# -*- mode: python ; coding: utf-8 -*-
+# 目录模式构建（pyinstaller websocket_server_onedir.spec）
+# 与单文件模式相比，启动时无需解压到临时目录，也不做UPX解压，适合崩溃后快速重启
+
+
+a = Analysis(
+    ['websocket_server.py'],
+    pathex=[],
+    binaries=[],
+    datas=[],
+    hiddenimports=['MetaTrader5', 'numpy', 'fake_mt5'],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=['pybit', 'requests', 'tkinter', 'unittest', 'pydoc', 'doctest'],
+    noarchive=False,
+    optimize=0,
+)
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='websocket_server',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=False,
+    console=True,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
+
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='websocket_server',
+)